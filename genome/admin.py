@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import TxtFiles
+from .models import AlignmentJob, TxtFiles
 
 # Register your models here.
 admin.site.register(TxtFiles)
+admin.site.register(AlignmentJob)
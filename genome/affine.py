@@ -0,0 +1,288 @@
+import numpy as np
+
+from . import banded, vectorized
+from .traceback import UP, LEFT, DIAGONAL, NONE, BandedTracebackMatrix
+
+# Besides the direction of the best score in its low 2 bits, every traceback code stores whether the vertical
+# and horizontal gap scores of the cell extend a gap (the bit is set) or open a new one.
+UP_EXTENDS = 4
+LEFT_EXTENDS = 8
+DIRECTION_MASK = 3
+
+
+def gap_cost(length, gap_open, gap_extend):
+    """Returns the score of a gap of length nucleotides: gap_open for the first one and gap_extend for the others"""
+    return gap_open + (length - 1) * gap_extend if length > 0 else 0
+
+
+def fill_rows(scoring_matrix, codes_one, codes_two, gap_open, gap_extend, global_alignment=True, traceback=True):
+    """Yields (best, directions) for every row of the Gotoh score matrices, starting with row 0
+
+    Three scores are kept for every cell: the best score of an alignment ending in a vertical gap (Up), in a
+    horizontal gap (Left) and in a match or mismatch (Diagonal). best is the highest of the three, and directions
+    is the row of traceback codes, see UP_EXTENDS and LEFT_EXTENDS. Without traceback, directions is None.
+
+    Like vectorized.score_row, the horizontal gap scores come from a running maximum over the row. This relies on
+    gap_open <= gap_extend: opening a gap right after another gap is then never better than extending it.
+    Only the previous row is kept.
+    """
+    dtype = np.result_type(scoring_matrix, gap_open, gap_extend)
+    # Stands in for the gap scores that don't exist, like a vertical gap in row 0
+    impossible = -(2 ** 60) if np.issubdtype(dtype, np.integer) else -np.inf
+    columns = len(codes_one) + 1
+    positions = np.arange(columns, dtype=dtype)
+    profile = vectorized.query_profile(scoring_matrix.astype(dtype), codes_one)
+
+    # Row 0 is a horizontal gap for global alignment and 0 for local alignment
+    directions = np.full(columns, NONE, dtype=np.uint8)
+    if global_alignment:
+        best = np.where(positions > 0, gap_open + (positions - 1) * gap_extend, 0).astype(dtype)
+        directions[1:] = LEFT
+        directions[2:] |= LEFT_EXTENDS
+    else:
+        best = np.zeros(columns, dtype=dtype)
+    vertical = np.full(columns, impossible, dtype=dtype)
+    yield best, directions
+
+    for y in range(1, len(codes_two) + 1):
+        first_value = gap_cost(y, gap_open, gap_extend) if global_alignment else 0
+
+        # Vertical gaps open from the best score above or extend the vertical gap above
+        opened = best + gap_open
+        extended = vertical + gap_extend
+        up_extends = extended >= opened if traceback else None
+        vertical = np.maximum(opened, extended)
+        vertical[0] = first_value if global_alignment else impossible
+
+        # Best of the cells that don't end in a horizontal gap, and column 0
+        without_left = np.empty(columns, dtype=dtype)
+        without_left[0] = first_value
+        diagonal = best[:-1] + profile[codes_two[y - 1]]
+        np.maximum(vertical[1:], diagonal, out=without_left[1:])
+        if not global_alignment:
+            np.maximum(without_left[1:], 0, out=without_left[1:])
+
+        # A horizontal gap ending at x opens after some column k < x, so its score is the running maximum of
+        # without_left[k] + gap_open + (x - k - 1) * gap_extend
+        horizontal = np.full(columns, impossible, dtype=dtype)
+        horizontal[1:] = (np.maximum.accumulate(without_left - positions * gap_extend)[:-1] + gap_open - gap_extend +
+                          positions[1:] * gap_extend)
+        best = np.maximum(without_left, horizontal)
+        if not traceback:
+            yield best, None
+            continue
+
+        # Pick the direction of the best score like the linear gap engines do: Up, then Left, then Diagonal
+        directions = np.full(columns, NONE, dtype=np.uint8)
+        values = best[1:]
+        directions[1:][diagonal == values] = DIAGONAL
+        directions[1:][horizontal[1:] == values] = LEFT
+        directions[1:][vertical[1:] == values] = UP
+        if global_alignment:
+            directions[0] = UP | (UP_EXTENDS if y > 1 else 0)
+        else:
+            directions[1:][values == 0] = NONE
+        directions[1:][up_extends[1:]] |= UP_EXTENDS
+        directions[2:][horizontal[1:-1] + gap_extend >= best[1:-1] + gap_open] |= LEFT_EXTENDS
+
+        yield best, directions
+
+
+class BandedDirections(BandedTracebackMatrix):
+    """The traceback codes of the cells close to the diagonal, see BandedTracebackMatrix
+
+    Cells are read with their [y, x] position like the full array of codes traceback_gaps walks, and give the
+    code instead of the direction string.
+    """
+
+    def __getitem__(self, position):
+        y, x = position
+        return self.codes[y, x - y - self.lowest_diagonal]
+
+
+def fill_band(scoring_matrix, codes_one, codes_two, gap_open, gap_extend, lowest_diagonal, highest_diagonal):
+    """Fills the global Gotoh matrices, only computing the cells with lowest_diagonal <= x - y <= highest_diagonal
+
+    Returns (score, directions) where directions is a BandedDirections. Like banded.fill_band, the cells outside
+    the band score banded.OUTSIDE_BAND, and every row is computed like fill_rows computes a whole row.
+    """
+    dtype = np.result_type(scoring_matrix, gap_open, gap_extend)
+    columns = len(codes_one) + 1
+    profile = vectorized.query_profile(scoring_matrix.astype(dtype), codes_one)
+    directions = BandedDirections(len(codes_two) + 1, lowest_diagonal, highest_diagonal)
+
+    # Two full width rows of each score are reused, only the band part of each row is written.
+    # Bands move right as y grows, so the cells just right of a row's band are never written and stay OUTSIDE_BAND.
+    best = np.full(columns + 1, banded.OUTSIDE_BAND, dtype=dtype)
+    vertical = best.copy()
+    next_best = best.copy()
+    next_vertical = best.copy()
+
+    # Row 0 is a horizontal gap, like fill_rows makes it
+    last = min(columns - 1, highest_diagonal)
+    positions = np.arange(last + 1, dtype=dtype)
+    best[:last + 1] = np.where(positions > 0, gap_open + (positions - 1) * gap_extend, 0)
+    directions.codes[0, :] = LEFT
+    directions.codes[0, 2 - lowest_diagonal:] |= LEFT_EXTENDS
+    directions.codes[0, -lowest_diagonal] = NONE
+
+    for y in range(1, len(codes_two) + 1):
+        first = max(0, y + lowest_diagonal)
+        last = min(columns - 1, y + highest_diagonal)
+        offset = first - y - lowest_diagonal
+        start = max(first, 1)
+
+        # left holds the cell just left of the computed columns, which is outside the band unless it is column 0
+        if first == 0:
+            left = gap_cost(y, gap_open, gap_extend)
+            next_best[0] = next_vertical[0] = left
+            directions.codes[y, offset] = UP | (UP_EXTENDS if y > 1 else 0)
+        else:
+            left = banded.OUTSIDE_BAND
+
+        # Vertical gaps open from the best score above or extend the vertical gap above
+        opened = best[start:last + 1] + gap_open
+        extended = vertical[start:last + 1] + gap_extend
+        up_extends = extended >= opened
+        row_vertical = np.maximum(opened, extended)
+
+        # Best of the cells that don't end in a horizontal gap, starting with the cell left of the band
+        without_left = np.empty(last - start + 2, dtype=dtype)
+        without_left[0] = left
+        diagonal = best[start - 1:last] + profile[codes_two[y - 1], start - 1:last]
+        np.maximum(row_vertical, diagonal, out=without_left[1:])
+
+        # The running maximum of fill_rows, over the columns of the band
+        positions = np.arange(len(without_left), dtype=dtype)
+        horizontal = np.full(len(without_left), banded.OUTSIDE_BAND, dtype=dtype)
+        horizontal[1:] = (np.maximum.accumulate(without_left - positions * gap_extend)[:-1] + gap_open - gap_extend +
+                          positions[1:] * gap_extend)
+        row_best = np.maximum(without_left[1:], horizontal[1:])
+
+        # Pick the direction of the best score like fill_rows does
+        row_directions = np.full(len(row_best), NONE, dtype=np.uint8)
+        row_directions[diagonal == row_best] = DIAGONAL
+        row_directions[horizontal[1:] == row_best] = LEFT
+        row_directions[row_vertical == row_best] = UP
+        row_directions[up_extends] |= UP_EXTENDS
+        row_directions[1:][horizontal[1:-1] + gap_extend >= row_best[:-1] + gap_open] |= LEFT_EXTENDS
+        directions.codes[y, offset + start - first:offset + last - first + 1] = row_directions
+
+        next_best[start:last + 1] = row_best
+        next_vertical[start:last + 1] = row_vertical
+        best, next_best = next_best, best
+        vertical, next_vertical = next_vertical, vertical
+
+    return best[columns - 1].item(), directions
+
+
+def banded_global_alignment(scorer, seq_one, seq_two, gap_open, gap_extend, band=8, max_cells=None):
+    """Globally aligns seq_one and seq_two with affine gap penalties, only filling the cells close to the diagonal
+
+    Works like banded.banded_alignment: the band is widened until banded.band_is_optimal proves the score is the
+    optimal one, so the result is the same as global_alignment gives. Every gap nucleotide scores at most
+    gap_extend, so that is the indel penalty of the bound. After a band fails, the next one is the narrowest
+    that would prove its score (see banded.next_band), which usually proves the optimum on the second pass.
+    Returns (score, seq_a_gaps, seq_b_gaps), or None when the band would need more than max_cells cells.
+    """
+    check_gap_penalties(gap_open, gap_extend)
+    scoring_matrix, codes_one, codes_two = vectorized.prepare(scorer, seq_one, seq_two)
+    length_difference = len(seq_one) - len(seq_two)
+
+    while True:
+        lowest_diagonal = min(0, length_difference) - band
+        highest_diagonal = max(0, length_difference) + band
+        if max_cells is not None and (len(seq_two) + 1) * (highest_diagonal - lowest_diagonal + 1) > max_cells:
+            return None
+
+        score, directions = fill_band(scoring_matrix, codes_one, codes_two, gap_open, gap_extend, lowest_diagonal,
+                                      highest_diagonal)
+        if banded.band_is_optimal(score, scorer.maximum_match_value, gap_extend, len(seq_one), len(seq_two),
+                                  lowest_diagonal, highest_diagonal):
+            _, _, seq_a_gaps, seq_b_gaps = traceback_gaps(directions, len(seq_one), len(seq_two))
+            return score, seq_a_gaps, seq_b_gaps
+        band = banded.next_band(score, scorer.maximum_match_value, gap_extend, len(seq_one), len(seq_two), band)
+
+
+def traceback_gaps(directions, x, y, global_alignment=True):
+    """Walks the traceback codes back from (x, y) and returns (x, y, seq_a_gaps, seq_b_gaps)
+
+    The walk ends at the top left corner for global alignment and at the first cell with no direction for local
+    alignment, (x, y) is where it ended. The gaps are in the format add_dashes expects.
+    """
+    seq_a_gaps = []
+    seq_b_gaps = []
+    state = directions[y, x] & DIRECTION_MASK
+    while (x > 0 or y > 0) if global_alignment else state != NONE:
+        code = directions[y, x]
+        if state == UP:
+            seq_a_gaps.append(x)
+            y -= 1
+            # Stay in the vertical gap while it was extended, otherwise continue from the best score of the cell above
+            state = UP if code & UP_EXTENDS else directions[y, x] & DIRECTION_MASK
+        elif state == LEFT:
+            seq_b_gaps.append(y)
+            x -= 1
+            state = LEFT if code & LEFT_EXTENDS else directions[y, x] & DIRECTION_MASK
+        else:
+            y -= 1
+            x -= 1
+            state = directions[y, x] & DIRECTION_MASK
+    return x, y, seq_a_gaps, seq_b_gaps
+
+
+def check_gap_penalties(gap_open, gap_extend):
+    if gap_open > gap_extend:
+        raise ValueError('gap_open must not be higher than gap_extend, opening a gap can\'t cost less than extending one')
+
+
+def global_alignment(scorer, seq_one, seq_two, gap_open, gap_extend):
+    """Globally aligns seq_one and seq_two with affine gap penalties
+
+    A gap of length L scores gap_open + (L - 1) * gap_extend. Only one byte of traceback per cell is stored.
+    Returns (score, seq_a_gaps, seq_b_gaps).
+    """
+    check_gap_penalties(gap_open, gap_extend)
+    scoring_matrix, codes_one, codes_two = vectorized.prepare(scorer, seq_one, seq_two)
+    directions = np.empty((len(codes_two) + 1, len(codes_one) + 1), dtype=np.uint8)
+    for y, (best, row_directions) in enumerate(fill_rows(scoring_matrix, codes_one, codes_two, gap_open,
+                                                          gap_extend)):
+        directions[y] = row_directions
+
+    _, _, seq_a_gaps, seq_b_gaps = traceback_gaps(directions, len(codes_one), len(codes_two))
+    return best[-1].item(), seq_a_gaps, seq_b_gaps
+
+
+def local_alignment(scorer, seq_one, seq_two, gap_open, gap_extend):
+    """Locally aligns seq_one and seq_two with affine gap penalties
+
+    Returns (score, max_x, max_y, x, y, seq_a_gaps, seq_b_gaps) in the format local_alignment_result takes.
+    When several cells have the highest score, the one local_alignment_traceback would pick is used.
+    """
+    check_gap_penalties(gap_open, gap_extend)
+    scoring_matrix, codes_one, codes_two = vectorized.prepare(scorer, seq_one, seq_two)
+    directions = np.empty((len(codes_two) + 1, len(codes_one) + 1), dtype=np.uint8)
+    max_value, max_x, max_y = 0, 0, 0
+    for y, (best, row_directions) in enumerate(fill_rows(scoring_matrix, codes_one, codes_two, gap_open, gap_extend,
+                                                          global_alignment=False)):
+        directions[y] = row_directions
+
+        # local_alignment_traceback takes the first maximum going column by column
+        row_max = best.max()
+        if row_max > max_value or (row_max == max_value and row_max > 0 and int(np.argmax(best)) < max_x):
+            max_value, max_x, max_y = row_max.item(), int(np.argmax(best)), y
+
+    x, y, seq_a_gaps, seq_b_gaps = traceback_gaps(directions, max_x, max_y, global_alignment=False)
+    return max_value, max_x, max_y, x, y, seq_a_gaps, seq_b_gaps
+
+
+def best_score(scorer, seq_one, seq_two, gap_open, gap_extend, global_alignment=True):
+    """Returns the affine gap alignment score of seq_one and seq_two using O(len(seq_one)) memory"""
+    check_gap_penalties(gap_open, gap_extend)
+    scoring_matrix, codes_one, codes_two = vectorized.prepare(scorer, seq_one, seq_two)
+    rows = fill_rows(scoring_matrix, codes_one, codes_two, gap_open, gap_extend, global_alignment, traceback=False)
+    if global_alignment:
+        for best, _ in rows:
+            pass
+        return best[-1].item()
+    return max(best.max() for best, _ in rows).item()
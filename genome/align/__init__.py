@@ -0,0 +1,5 @@
+# One interface to every alignment engine: align picks an engine from the registry in engines.py (or uses the one
+# asked for) and returns an AlignmentResult. New engines are added with the register decorator.
+from .engines import AUTO, DEFAULT_CELL_BUDGET, ENGINES, Engine, align, get_engine, register, select_engine
+from .result import AlignmentResult, truncate_lines
+from .scorer import AlignmentScorer
@@ -0,0 +1,305 @@
+import os
+
+from django.conf import settings
+
+from .result import AlignmentResult
+from .scorer import AlignmentScorer
+
+AUTO = 'auto'
+
+# Alignments with more matrix cells than this don't use the engines that build the full matrices,
+# like GENOME_FULL_MATRIX_CELL_BUDGET
+DEFAULT_CELL_BUDGET = 10_000_000
+
+# Options that change what is computed, so only engines that handle them can be used when they are set.
+# They are narrowed in this order, gap_open wins over anchored.
+REQUIRED_OPTIONS = ['gap_open', 'anchored']
+
+# Registered engines by name, see register
+ENGINES = {}
+
+# What happens to an option when no engine that handles it fits in the cell budget, see budget_warning
+OPTION_WARNINGS = {
+    'gap_open': 'the affine gap penalties were not used and every gap nucleotide was scored with the indel penalty',
+    'anchored': 'the alignment was not anchored on maximal unique matches',
+    'top_hits': 'only the best local alignment was reported',
+}
+
+
+class Engine:
+    """An alignment engine of the registry
+
+    run(scorer, seq_one, seq_two, global_alignment, options) aligns one pair and returns an AlignmentResult.
+    options is a dict of the options given to align, it always has cell_budget.
+
+    The rest describes the engine to select_engine: which modes it supports, the options it handles (and of
+    those, the ones it can't be used without), whether
+    its score is always the best one (heuristics like seeding are not), and estimate(len_one, len_two) which
+    returns (seconds, cells) for the time it takes on one core and the matrix cells it keeps in memory.
+    The estimates were measured for similar sequences, like two SARS-CoV-2 genomes. Engines with auto False
+    are only used when they are asked for by name, and engines with budgeted False are then used even when they
+    need more cells than the cell budget.
+    """
+
+    def __init__(self, name, run, estimate, global_alignment=True, local_alignment=True, options=(), requires=(),
+                 optimal=True, auto=True, budgeted=True):
+        self.name = name
+        self.run = run
+        self.estimate = estimate
+        self.global_alignment = global_alignment
+        self.local_alignment = local_alignment
+        self.options = set(options) | set(requires)
+        self.requires = set(requires)
+        self.optimal = optimal
+        self.auto = auto
+        self.budgeted = budgeted
+
+    def supports(self, global_alignment):
+        return self.global_alignment if global_alignment else self.local_alignment
+
+    def __repr__(self):
+        return f'Engine({self.name!r})'
+
+
+def register(name, estimate, **kwargs):
+    """Decorator that adds the engine run by the decorated function to ENGINES, see Engine for the arguments"""
+    def decorator(run):
+        ENGINES[name] = Engine(name, run, estimate, **kwargs)
+        return run
+    return decorator
+
+
+def get_engine(name):
+    if name not in ENGINES:
+        raise ValueError(f'Unknown engine {name!r}, expected {AUTO!r} or one of {list(ENGINES)}')
+    return ENGINES[name]
+
+
+def requested_options(options):
+    """Returns the names of the options that are set, the ones engines are picked by"""
+    requested = set()
+    if options.get('gap_open') is not None:
+        requested.add('gap_open')
+    if options.get('anchored'):
+        requested.add('anchored')
+    if options.get('top_hits', 1) > 1:
+        requested.add('top_hits')
+    return requested
+
+
+def budget_warning(option, len_one, len_two, cell_budget):
+    """Returns the warning for an option that was left out because it needs more than cell_budget cells"""
+    return (f'The {len_one} x {len_two} alignment needs more than the cell budget of {cell_budget} matrix cells, '
+            f'so {OPTION_WARNINGS[option]}.')
+
+
+def select_engine(len_one, len_two, global_alignment=True, cell_budget=DEFAULT_CELL_BUDGET, preferred=AUTO,
+                  **options):
+    """Returns the Engine to align sequences of these lengths with
+
+    Only engines that support the mode, handle the REQUIRED_OPTIONS that are set (unless none of them does) and
+    keep at most cell_budget cells in memory are considered. When none of the engines that handle the options fits
+    the budget, the options are dropped (align warns about it), and if no engine fits at all, the one that needs
+    the least memory is used. Engines that handle more of the options, then engines whose score is always optimal, then the
+    fastest ones are preferred. preferred, the name of an engine, is used when it fits (or isn't budgeted) unless
+    another engine handles more of the options. Raises ValueError when preferred requires an option that isn't set,
+    like the affine engine without gap_open, instead of running another engine.
+    """
+    requested = requested_options(options)
+    if preferred != AUTO:
+        missing = get_engine(preferred).requires - requested
+        if missing:
+            raise ValueError(f'Engine {preferred!r} can only be used with the {", ".join(sorted(missing))} option')
+    supported = [engine for engine in ENGINES.values()
+                 if engine.supports(global_alignment) and engine.requires <= requested]
+    candidates = supported
+    for option in REQUIRED_OPTIONS:
+        if option in requested:
+            narrowed = [engine for engine in candidates if option in engine.options]
+            candidates = narrowed or candidates
+
+    estimates = {engine.name: engine.estimate(len_one, len_two) for engine in supported}
+
+    def rank(engine):
+        return -len(requested & engine.options), not engine.optimal, estimates[engine.name][0]
+
+    fitting = [engine for engine in candidates if estimates[engine.name][1] <= cell_budget]
+    if not any(engine.auto for engine in fitting):
+        # The engines that handle the options need too much memory, so align without them
+        candidates = supported
+        fitting = [engine for engine in candidates if estimates[engine.name][1] <= cell_budget]
+    if preferred != AUTO:
+        # The engine asked for is used unless another one handles more of the options
+        engine = get_engine(preferred)
+        usable = fitting + [engine] if engine in candidates and not engine.budgeted else fitting
+        if engine in usable and rank(engine)[0] == min(rank(other)[0] for other in usable):
+            return engine
+
+    candidates = [engine for engine in candidates if engine.auto]
+    fitting = [engine for engine in fitting if engine.auto]
+    if not fitting:
+        return min(candidates, key=lambda engine: estimates[engine.name][1])
+    return min(fitting, key=rank)
+
+
+def align(scoring_matrix, indel_penalty, seq_one, seq_two, global_alignment=True, engine=AUTO,
+          cell_budget=DEFAULT_CELL_BUDGET, columns_shown=None, score_only=False, **options):
+    """Aligns seq_one and seq_two and returns an AlignmentResult
+
+    engine is the name of a registered engine or AUTO, which lets select_engine pick the fastest one that fits
+    in cell_budget. An engine that can't align these sequences within cell_budget is replaced the same way.
+    options are passed on to the engine: gap_open and gap_extend for affine gap penalties, top_hits for the
+    number of local alignments to report, anchored for the anchored global alignment, and reference_key and
+    sequence_id (or index) for the seeds of the seeded engine.
+    With score_only only the score and percent similarity are computed, in O(len(seq_one)) memory.
+    """
+    if engine != AUTO:
+        get_engine(engine)
+    # The engines that build the full matrices fill them with AlignmentScorer.fill_matrices, the others use numpy
+    fill_engine = engine if engine in AlignmentScorer.engines else 'numpy'
+    scorer = AlignmentScorer(scoring_matrix, indel_penalty, fill_engine, columns_shown)
+
+    if score_only:
+        if options.get('gap_open') is not None:
+            score, percent_similarity = scorer.affine_score_only(seq_one, seq_two, options['gap_open'],
+                                                                 options['gap_extend'], global_alignment)
+        else:
+            score, percent_similarity = scorer.score_only(seq_one, seq_two, global_alignment)
+        return AlignmentResult(score=score, percent_similarity=percent_similarity, engine='score_only')
+
+    selected = select_engine(len(seq_one), len(seq_two), global_alignment, cell_budget, engine, **options)
+    result = selected.run(scorer, seq_one, seq_two, global_alignment, dict(options, cell_budget=cell_budget))
+    result.engine = selected.name
+
+    # Options that an engine of this mode handles were only left out because they didn't fit in the budget
+    handled = set().union(*(other.options for other in ENGINES.values() if other.supports(global_alignment)))
+    for option in sorted((requested_options(options) - selected.options) & handled):
+        result.warnings.append(budget_warning(option, len(seq_one), len(seq_two), cell_budget))
+    return result
+
+
+def full_matrix_estimate(cells_per_second):
+    return lambda len_one, len_two: (len_one * len_two / cells_per_second, len_one * len_two)
+
+
+@register('python', full_matrix_estimate(4e5))
+@register('numpy', full_matrix_estimate(5e6))
+def full_matrices(scorer, seq_one, seq_two, global_alignment, options):
+    """Fills the full score and traceback matrices, the reference every other engine is compared with"""
+    matrix, traceback_matrix = scorer.create_initalized_matrices(len(seq_one), len(seq_two), global_alignment)
+    scorer.fill_matrices(matrix, traceback_matrix, seq_one, seq_two, global_alignment)
+    if global_alignment:
+        lines = scorer.global_alignment_traceback(matrix, traceback_matrix, seq_one, seq_two)
+    else:
+        lines = scorer.local_alignment_traceback(matrix, traceback_matrix, seq_one, seq_two)
+    return AlignmentResult.from_lines(lines, scorer.alignment)
+
+
+def tiled_estimate(len_one, len_two):
+    # Filling a tile costs about as much as the numpy engine, the processes are started once per worker
+    workers = getattr(settings, 'GENOME_TILE_WORKERS', None) or os.cpu_count() or 1
+    return len_one * len_two / (5e6 * workers), len_one * len_two
+
+
+@register('tiled', tiled_estimate, auto=False, budgeted=False)
+def tiled(scorer, seq_one, seq_two, global_alignment, options):
+    """Fills the matrix in tiles on several processes and keeps only one byte per cell, see
+    AlignmentScorer.tiled_alignment
+
+    It is only used when asked for by name, and then even above the cell budget: a 30 kb pair needs about 900 MB.
+    """
+    return AlignmentResult.from_lines(scorer.tiled_alignment(seq_one, seq_two, global_alignment), scorer.alignment)
+
+
+def band_cells(len_one, len_two):
+    # The band starts 8 cells wide on each side and doubles until the score is proven, for similar sequences
+    # it ends up about this wide
+    return (abs(len_one - len_two) + 32) * max(len_one, len_two)
+
+
+@register('banded', lambda len_one, len_two: (len_two * 2e-5 + band_cells(len_one, len_two) / 2e6,
+                                              band_cells(len_one, len_two)), local_alignment=False)
+def banded(scorer, seq_one, seq_two, global_alignment, options):
+    """Only fills the cells near the diagonal, gives the same alignment as the full matrices
+
+    If the band grows past the cell budget the alignment is done in linear space instead.
+    """
+    lines = scorer.banded_global_alignment(seq_one, seq_two, max_cells=options['cell_budget'])
+    if lines is None:
+        lines = scorer.linear_space_global_alignment(seq_one, seq_two)
+    return AlignmentResult.from_lines(lines, scorer.alignment)
+
+
+@register('linear_space', lambda len_one, len_two: (len_two * 3.5e-5 + len_one * len_two / 3.5e7,
+                                                    len_one + len_two), local_alignment=False)
+def linear_space(scorer, seq_one, seq_two, global_alignment, options):
+    """Hirschberg's algorithm, see AlignmentScorer.linear_space_global_alignment"""
+    return AlignmentResult.from_lines(scorer.linear_space_global_alignment(seq_one, seq_two), scorer.alignment)
+
+
+@register('anchored', lambda len_one, len_two: ((len_one + len_two) * 2e-6, len_one + len_two),
+          local_alignment=False, requires=['anchored'], optimal=False)
+def anchored(scorer, seq_one, seq_two, global_alignment, options):
+    """Aligns only between maximal unique matches, see AlignmentScorer.anchored_global_alignment"""
+    lines, stats = scorer.anchored_global_alignment(seq_one, seq_two, options.get('k', 20))
+    return AlignmentResult.from_lines(lines, scorer.alignment, stats=stats)
+
+
+@register('seeded', lambda len_one, len_two: (len_one * len_two / 2e8, len_one + len_two), global_alignment=False,
+          optimal=False)
+def seeded(scorer, seq_one, seq_two, global_alignment, options):
+    """Only computes the cells around k-mer seeds, see AlignmentScorer.seeded_local_alignment
+
+    The seeds come from options['index'], or the index of the reference cached under options['reference_key'],
+    where seq_one is sequence options['sequence_id']. Without either an index of seq_one is built.
+    """
+    index = options.get('index')
+    sequence_id = options.get('sequence_id', 0)
+    if index is None and options.get('reference_key') is not None:
+        from ..reference_cache import get_reference_cache
+        reference = get_reference_cache().get_by_key(options['reference_key'])
+        # Evicted from the cache, the index of seq_one alone gives the same seeds
+        if reference is not None:
+            index = reference.index
+    if index is None:
+        from ..seeds import KmerIndex
+        index = KmerIndex.build([seq_one])
+        sequence_id = 0
+    lines = scorer.seeded_local_alignment(seq_one, seq_two, index, sequence_id)
+    return AlignmentResult.from_lines(lines, scorer.alignment)
+
+
+@register('waterman_eggert', lambda len_one, len_two: (len_one * len_two / 3e6, len_one * len_two),
+          global_alignment=False, options=['top_hits'])
+def waterman_eggert(scorer, seq_one, seq_two, global_alignment, options):
+    """Reports the top_hits best local alignments, see AlignmentScorer.top_local_alignments"""
+    lines, hits = scorer.top_local_alignments(seq_one, seq_two, options.get('top_hits', 1))
+    return AlignmentResult.from_lines(lines, scorer.alignment, hits=hits)
+
+
+@register('banded_affine', lambda len_one, len_two: (len_two * 1e-4 + band_cells(len_one, len_two) / 2e6,
+                                                     band_cells(len_one, len_two)),
+          local_alignment=False, requires=['gap_open'])
+def banded_affine(scorer, seq_one, seq_two, global_alignment, options):
+    """Affine gap penalties in the cells near the diagonal, gives the same alignment as the affine engine
+
+    If the band grows past the cell budget, the gaps are scored with the indel penalty by the banded engine
+    instead and the result warns about it.
+    """
+    lines = scorer.banded_affine_global_alignment(seq_one, seq_two, options['gap_open'], options['gap_extend'],
+                                                  max_cells=options['cell_budget'])
+    if lines is None:
+        result = banded(scorer, seq_one, seq_two, global_alignment, options)
+        result.warnings.append(budget_warning('gap_open', len(seq_one), len(seq_two), options['cell_budget']))
+        return result
+    return AlignmentResult.from_lines(lines, scorer.alignment)
+
+
+@register('affine', lambda len_one, len_two: (len_one * len_two / 2e7, len_one * len_two), requires=['gap_open'])
+def affine(scorer, seq_one, seq_two, global_alignment, options):
+    """Affine gap penalties with Gotoh's algorithm, see AlignmentScorer.affine_global_alignment"""
+    if global_alignment:
+        lines = scorer.affine_global_alignment(seq_one, seq_two, options['gap_open'], options['gap_extend'])
+    else:
+        lines = scorer.affine_local_alignment(seq_one, seq_two, options['gap_open'], options['gap_extend'])
+    return AlignmentResult.from_lines(lines, scorer.alignment)
@@ -0,0 +1,47 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .. import cigar
+
+
+@dataclass
+class AlignmentResult:
+    """The output of aligning one pair of sequences with any engine
+
+    line_one, match_line and line_two are the aligned sequences and the | line between them, as the results page
+    shows them: only the first columns_shown columns when the scorer was given columns_shown. score and
+    percent_similarity are strings like the tracebacks always returned them. alignment is the whole alignment,
+    or None when only the score was computed. hits are the local alignments of the waterman_eggert engine
+    (see AlignmentScorer.local_hit) and stats tells how much of the matrices the anchored engine computed.
+    warnings tells the user about options that could not be used for this pair, see engines.budget_warning.
+    """
+    line_one: str = ''
+    match_line: str = ''
+    line_two: str = ''
+    score: str = ''
+    percent_similarity: str = ''
+    alignment: Optional[cigar.Alignment] = None
+    hits: list = field(default_factory=list)
+    stats: Optional[dict] = None
+    warnings: list = field(default_factory=list)
+    # Name of the engine that computed the result
+    engine: str = ''
+
+    @classmethod
+    def from_lines(cls, lines, alignment=None, **kwargs):
+        """Creates the result of the 5-tuple the AlignmentScorer tracebacks return"""
+        line_one, match_line, line_two, score, percent_similarity = lines
+        return cls(line_one, match_line, line_two, score, percent_similarity, alignment, **kwargs)
+
+    def lines(self):
+        """Returns the 5-tuple the AlignmentScorer tracebacks return"""
+        return self.line_one, self.match_line, self.line_two, self.score, self.percent_similarity
+
+    def text(self):
+        """Returns the aligned sequences, the | line and the score as one text, the way main_global prints them"""
+        return self.line_one + '\n' + self.match_line + '\n' + self.line_two + '\nScore: ' + self.score
+
+
+# Trim each line to only be x characters long
+def truncate_lines(text, characters_show):
+    return '\n'.join([line[:characters_show] for line in text.splitlines()])
@@ -0,0 +1,465 @@
+import numpy as np
+
+from .. import affine, anchors, banded, cigar, hirschberg, seeds, traceback, vectorized, waterman_eggert, wavefront
+from ..traceback import TracebackMatrix
+
+
+class AlignmentScorer:
+    traceback_directions = traceback.DIRECTIONS
+
+    # This is used as a lookup for the scoring matrix
+    scoring_matrix_indexes = {
+        'A': 0,
+        'C': 1,
+        'G': 2,
+        'T': 3,
+    }
+
+    # 'python' fills the matrices one cell at a time with compute_score.
+    # 'numpy' fills them one row at a time with numpy array operations and gives the same matrices.
+    # tiled_alignment splits the matrix across several processes instead, see wavefront.py.
+    engines = ['python', 'numpy']
+
+    # The tracebacks return the aligned sequences rendered from a cigar.Alignment. columns_shown limits them to
+    # their first columns_shown columns, None renders them whole. The Alignment of the last result is kept in
+    # the alignment attribute.
+    def __init__(self, scoring_matrix, indel_penalty, engine='python', columns_shown=None):
+        if engine not in AlignmentScorer.engines:
+            raise ValueError(f'Unknown engine {engine!r}, expected one of {AlignmentScorer.engines}')
+        self.scoring_matrix = scoring_matrix
+        self.indel_penalty = indel_penalty
+        self.engine = engine
+        self.maximum_match_value = max(list(map(max, scoring_matrix)))
+        self.columns_shown = columns_shown
+        self.alignment = None
+
+    """Returns a score from the scoring matrix used to initialize AlignmentScorer
+
+    The nucleotides can be letters, which use scoring_matrix_indexes as a lookup of what matrix value to use,
+    or codes that already are scoring matrix indexes, like vectorized.encode_sequence returns.
+    """
+
+    def score(self, nuc_one, nuc_two):
+        if isinstance(nuc_one, str):
+            nuc_one = AlignmentScorer.scoring_matrix_indexes[nuc_one]
+        if isinstance(nuc_two, str):
+            nuc_two = AlignmentScorer.scoring_matrix_indexes[nuc_two]
+        return self.scoring_matrix[nuc_two][nuc_one]
+
+    """Returns the score matrix and the TracebackMatrix for sequences of these lengths
+
+    The python engine fills a list of lists one cell at a time, the numpy engine a numpy array one row at a time.
+    Both are indexed with matrix[y][x].
+    """
+
+    def create_initalized_matrices(self, sequence_one_len, sequence_two_len, global_alignment=True):
+
+        # Create the matrices with 0 and - for default values
+        if self.engine == 'python':
+            matrix = [[0 for x in range(sequence_one_len + 1)] for y in range(sequence_two_len + 1)]
+        else:
+            matrix = np.zeros((sequence_two_len + 1, sequence_one_len + 1), dtype=vectorized.score_dtype(self))
+        traceback_matrix = TracebackMatrix(sequence_two_len + 1, sequence_one_len + 1)
+
+        # If global alignment is used, fill in the first row and column of the matrices.
+        if global_alignment:
+            for x in range(sequence_one_len + 1):
+                matrix[0][x] = x * self.indel_penalty
+            for y in range(sequence_two_len + 1):
+                matrix[y][0] = y * self.indel_penalty
+
+            traceback_matrix.codes[0, :] = traceback.LEFT
+            traceback_matrix.codes[:, 0] = traceback.UP
+        return matrix, traceback_matrix
+
+    def compute_score(self, matrix, seq_one, seq_two, x, y, global_alignment=True):
+        return self.compute_cell(matrix, self.score(seq_one[x], seq_two[y]), x, y, global_alignment)
+
+    """Returns (value, direction) of the cell at x, y given the match score of its two nucleotides"""
+
+    def compute_cell(self, matrix, match, x, y, global_alignment=True):
+
+        # Compute the scores from the cells diagonal, above, and to the left of the cell at x, y
+        diag_score = matrix[y][x] + match
+        top_score = matrix[y + 1][x] + self.indel_penalty
+        left_score = matrix[y][x + 1] + self.indel_penalty
+
+        # Put all the scores into a list
+        scores = [left_score, top_score, diag_score]
+        if not global_alignment:
+            scores.append(0)  # For local alignment, each cell must have a min score of 0.
+
+        # Get the max value of the list
+        max_value = max(scores)
+
+        # Get the index of the max argument in the list. Because we initialized the list as [left_score, top_score, diag_score],
+        # If the index is 0, we know the direction is left, if the index is 1, we know the direction should be up, and if the index is 2 the direction should be diagonal
+        direction = AlignmentScorer.traceback_directions[max(range(len(scores)), key=scores.__getitem__)]
+
+        if not global_alignment and max_value == 0:
+            direction = AlignmentScorer.traceback_directions[
+                3]  # For the local alignment, we don't want a traceback direction if the corresponding matrix value is 0
+
+        return (max_value, direction)
+
+    """Returns the query profile of seq_one: for each of the four nucleotides, the list of its scores against every
+    nucleotide of seq_one
+
+    query_profile(seq_one)[scoring_matrix_indexes[nuc_two]][x] is score(seq_one[x], nuc_two). Building it once per
+    alignment means the python engine only indexes a list per cell instead of looking both nucleotides up.
+    """
+
+    def query_profile(self, seq_one):
+        scoring_matrix = np.array(self.scoring_matrix)
+        return vectorized.query_profile(scoring_matrix, vectorized.encode_sequence(seq_one)).tolist()
+
+    def fill_matrices(self, matrix, traceback_matrix, seq_one, seq_two, global_alignment=True):
+        if self.engine == 'numpy':
+            vectorized.fill_matrices(self, matrix, traceback_matrix, seq_one, seq_two, global_alignment)
+            return
+
+        # The nucleotides of seq_two are turned into scoring matrix indexes once, and each row takes its match scores
+        # from the query profile of seq_one, so no nucleotide is looked up per cell.
+        profile = self.query_profile(seq_one)
+        codes_two = vectorized.encode_sequence(seq_two).tolist()
+
+        # seq_one is on the top of the matrix and seq_two as the left side.
+        # We'll loop through the matrices and fill out the values.
+        for y in range(len(seq_two)):
+            match_scores = profile[codes_two[y]]
+            for x in range(len(seq_one)):
+                max_value, direction = self.compute_cell(matrix, match_scores[x], x, y, global_alignment)
+                matrix[y + 1][x + 1] = max_value
+                traceback_matrix[y + 1, x + 1] = direction
+
+    """Returns the score as a percentage of the best score two sequences of these lengths could get
+
+    gap_penalty is the score of the gap a global alignment needs for the difference in length, it defaults to
+    one indel_penalty per nucleotide.
+    """
+
+    def percent_similarity(self, score, sequence_one_len, sequence_two_len, global_alignment=True, gap_penalty=None):
+        longer_sequence_length = max(sequence_one_len, sequence_two_len)
+        shorter_sequence_length = min(sequence_one_len, sequence_two_len)
+
+        if global_alignment:
+            # The maximum possible value is the length of the shorter sequence * the maximum match score - the gap in length * the indel score
+            gap = longer_sequence_length - shorter_sequence_length
+            if gap_penalty is None:
+                gap_penalty = gap * self.indel_penalty
+            max_possible_score = self.maximum_match_value * shorter_sequence_length + gap_penalty
+        else:
+            # The maximum possible value is the length of the shorter sequence * the maximum match score
+            max_possible_score = self.maximum_match_value * shorter_sequence_length
+
+        return (100 * score) / max_possible_score
+
+    """Returns only the score and percent similarity of an alignment, as strings like the tracebacks return them
+
+    No traceback matrix is created and only two rows of the score matrix are kept, so this uses O(len(seq_one)) memory.
+    """
+
+    def score_only(self, seq_one, seq_two, global_alignment=True):
+        if self.engine != 'python':
+            score = vectorized.best_score(self, seq_one, seq_two, global_alignment)
+        else:
+            profile = self.query_profile(seq_one)
+            codes_two = vectorized.encode_sequence(seq_two).tolist()
+            previous_row = [x * self.indel_penalty if global_alignment else 0 for x in range(len(seq_one) + 1)]
+            score = previous_row[-1] if global_alignment else 0
+            for y in range(len(seq_two)):
+                # compute_score only looks at two rows, so it can run on the previous and current rows directly
+                current_row = [(y + 1) * self.indel_penalty if global_alignment else 0] + [0] * len(seq_one)
+                rows = [previous_row, current_row]
+                match_scores = profile[codes_two[y]]
+                for x in range(len(seq_one)):
+                    current_row[x + 1], _ = self.compute_cell(rows, match_scores[x], x, 0, global_alignment)
+                previous_row = current_row
+                score = previous_row[-1] if global_alignment else max(score, max(previous_row))
+
+        percent_similarity = self.percent_similarity(score, len(seq_one), len(seq_two), global_alignment)
+        return str(score), str(percent_similarity)[:7]
+
+    """Adds ---- to sequences to fill in the gap
+
+    Example, add_dashes('ATG', [1]) gives A-TG
+    Example, add_dashes('ATG', [1,2]) gives A-T-G
+    Example, add_dashes('ATG', [], 2) gives --ATG
+    Example, add_dashes('ATG', [1,2], 2) gives --A-T-G
+    """
+
+    def add_dashes(self, sequence, gaps, offset=0):
+        # The pieces between the gaps are joined once, so this is linear in the length of the result
+        pieces = ['-' * offset]
+        previous_index = 0
+        for index in sorted(gaps):
+            pieces.append(str(sequence[previous_index:index]))
+            pieces.append('-')
+            previous_index = index
+        pieces.append(str(sequence[previous_index:]))
+        return ''.join(pieces)
+
+    # This creates the | between the two sequences in the final output.
+    def create_match_string(seq_one, seq_two):
+        # If the two nucleotides are the same add a |, otherwise add a space
+        return ''.join('|' if a == b else ' ' for a, b in zip(seq_one, seq_two))
+
+    def local_alignment_traceback(self, matrix, traceback_matrix, seq_one, seq_two):
+
+        # Start by finding the maximum value in the matrix, along with its x and y coordinates.
+        # Ties go to the lowest x, then the lowest y, so argmax runs over the transposed matrix.
+        max_x, max_y = np.unravel_index(np.argmax(np.asarray(matrix).T), (len(seq_one) + 1, len(seq_two) + 1))
+        max_x = int(max_x)
+        max_y = int(max_y)
+        max_value = int(matrix[max_y][max_x])
+
+        x, y, seq_a_gaps, seq_b_gaps = self.local_traceback_gaps(traceback_matrix, max_x, max_y)
+        return self.local_alignment_result(max_value, max_x, max_y, x, y, seq_a_gaps, seq_b_gaps, seq_one, seq_two)
+
+    """Follows the traceback matrix of a local alignment from the cell at max_x, max_y back to its start
+
+    Returns (x, y, seq_a_gaps, seq_b_gaps): the start of the alignment and the gaps in the format add_dashes expects.
+    Only the cells with a score of 0 have no direction, so the traceback stops at the first one.
+    """
+
+    def local_traceback_gaps(self, traceback_matrix, max_x, max_y):
+        seq_a_gaps = []
+        seq_b_gaps = []
+
+        x = max_x
+        y = max_y
+
+        # We will go back through the matrix using the traceback matrix as a guide until we hit 0 in the matrix.
+        # When the traceback matrix says to go Up or Left, we will note there should be a gap in the appropriate sequence
+        while True:
+            direction = traceback_matrix[y, x]
+            if direction == '-':
+                break
+            if direction == 'Up':
+                seq_a_gaps.append(x)  # This means there was a gap in the first sequence
+                y -= 1
+            if direction == 'Left':
+                seq_b_gaps.append(y)  # This means there was a gap in the second sequence
+                x -= 1
+            if direction == "Diagonal":  # This means there was no gap
+                y -= 1
+                x -= 1
+
+        return x, y, seq_a_gaps, seq_b_gaps
+
+    """Builds the output of a local alignment from its score, end (max_x, max_y), start (x, y) and gaps
+
+    The aligned region covers seq_one[x:max_x] and seq_two[y:max_y]. seq_a_gaps and seq_b_gaps are the gap
+    positions in the format add_dashes expects.
+    """
+
+    def local_alignment_result(self, max_value, max_x, max_y, x, y, seq_a_gaps, seq_b_gaps, seq_one, seq_two):
+        # The sequences are lined up so the first shared nucleotide in the local alignment is in the same column.
+        # The | characters are only added for the area which is locally aligned.
+        self.alignment = cigar.Alignment.from_gaps(seq_one, seq_two, x, y, max_x, max_y, seq_a_gaps, seq_b_gaps)
+        final_seq_one, match_line, final_seq_two = self.alignment.window(0, self.columns_shown)
+
+        percent_similarity = self.percent_similarity(max_value, len(seq_one), len(seq_two), global_alignment=False)
+
+        return final_seq_one, match_line, final_seq_two, str(max_value), str(percent_similarity)[:7]
+        # return final_seq_one + '\n' + match_line + '\n' + final_seq_two + '\nScore: ' + str(max_value)
+
+    def global_alignment_traceback(self, matrix, traceback_matrix, seq_one, seq_two):
+        seq_a_gaps, seq_b_gaps = self.global_traceback_gaps(traceback_matrix, seq_one, seq_two)
+
+        # The score comes from the bottom right value in the score matrix
+        score = int(matrix[len(seq_two)][len(seq_one)])
+
+        return self.global_alignment_result(score, seq_a_gaps, seq_b_gaps, seq_one, seq_two)
+
+    """Follows the traceback matrix from the bottom right corner and returns the gaps in each sequence
+
+    The gaps are returned as (seq_a_gaps, seq_b_gaps) in the format add_dashes expects.
+    """
+
+    def global_traceback_gaps(self, traceback_matrix, seq_one, seq_two):
+        seq_a_gaps = []
+        seq_b_gaps = []
+
+        # Set x and y to be in the bottom right corner of the matrix
+        x = len(seq_one)
+        y = len(seq_two)
+
+        while x > 0 or y > 0:
+            direction = traceback_matrix[y, x]
+            if direction == 'Up':
+                seq_a_gaps.append(x)  # If the traceback direction is Up, we know there is a gap in the first sequence
+                y -= 1
+            if direction == 'Left':
+                seq_b_gaps.append(
+                    y)  # If the traceback direction is Left, we know there is a gap in the second sequence
+                x -= 1
+            if direction == "Diagonal":  # If the traceback direction is Diagonal, we know there is no gap
+                y -= 1
+                x -= 1
+
+        return seq_a_gaps, seq_b_gaps
+
+    """Builds the output of a global alignment from its score and the gaps found by the traceback
+
+    seq_a_gaps and seq_b_gaps are the gap positions in the format add_dashes expects.
+    gap_penalty is passed on to percent_similarity.
+    """
+
+    def global_alignment_result(self, score, seq_a_gaps, seq_b_gaps, seq_one, seq_two, gap_penalty=None):
+        # Fill in the gaps with -'s
+        self.alignment = cigar.Alignment.from_gaps(seq_one, seq_two, 0, 0, len(seq_one), len(seq_two), seq_a_gaps,
+                                                   seq_b_gaps)
+        final_seq_one, match_line, final_seq_two = self.alignment.window(0, self.columns_shown)
+
+        percent_similarity = self.percent_similarity(score, len(seq_one), len(seq_two), gap_penalty=gap_penalty)
+
+        # SPLITTED:
+        result1 = final_seq_one
+        result2 = match_line
+        result3 = final_seq_two
+        result4_score = str(score)
+        result5_p_similarity = str(percent_similarity)[:7]
+        return result1, result2, result3, result4_score, result5_p_similarity
+
+    """Runs a global alignment that only fills the cells close to the diagonal
+
+    The band starts band cells wide on each side and is doubled until the score is provably optimal,
+    so the output is the same as global_alignment_traceback gives with the full matrices.
+    Returns None if the band would need more than max_cells cells.
+    """
+
+    def banded_global_alignment(self, seq_one, seq_two, band=8, max_cells=None):
+        alignment = banded.banded_alignment(self, seq_one, seq_two, band, max_cells)
+        if alignment is None:
+            return None
+
+        score, traceback_matrix = alignment
+        seq_a_gaps, seq_b_gaps = self.global_traceback_gaps(traceback_matrix, seq_one, seq_two)
+        return self.global_alignment_result(score, seq_a_gaps, seq_b_gaps, seq_one, seq_two)
+
+    """Runs a local alignment that only computes the cells around k-mer seeds shared by the two sequences
+
+    index is a KmerIndex of the reference sequences and seq_one must be its sequence number sequence_id.
+    Returns the same output as local_alignment_traceback. This is a heuristic: the result is the alignment
+    along the best chain of seeds, so a best local alignment that shares no k-mer with the reference is missed.
+    """
+
+    def seeded_local_alignment(self, seq_one, seq_two, index, sequence_id=0):
+        alignment = seeds.seed_and_extend(self, seq_one, seq_two, index, sequence_id)
+        if alignment is None:
+            # Without seeds the result is the same as for a matrix without any positive score
+            alignment = (0, 0, 0, 0, 0, [], [])
+
+        max_value, max_x, max_y, x, y, seq_a_gaps, seq_b_gaps = alignment
+        return self.local_alignment_result(max_value, max_x, max_y, x, y, seq_a_gaps, seq_b_gaps, seq_one, seq_two)
+
+    """Runs a global alignment in O(len(seq_one) + len(seq_two)) memory with Hirschberg's algorithm
+
+    Returns the same output as global_alignment_traceback without creating the full matrices.
+    The score and similarity are always the same. When several alignments have the best score,
+    the gaps can be placed in a different (equally good) spot than the full traceback places them.
+    """
+
+    def linear_space_global_alignment(self, seq_one, seq_two):
+        score, seq_a_gaps, seq_b_gaps = hirschberg.linear_space_alignment(self, seq_one, seq_two)
+        return self.global_alignment_result(score, seq_a_gaps, seq_b_gaps, seq_one, seq_two)
+
+    """Runs a global or local alignment whose matrix is filled in tiles by several processes at once
+
+    Only the traceback directions are kept for the whole matrix, see wavefront.tiled_alignment. Returns the same
+    output as global_alignment_traceback or local_alignment_traceback.
+    """
+
+    def tiled_alignment(self, seq_one, seq_two, global_alignment=True):
+        alignment = wavefront.tiled_alignment(self, seq_one, seq_two, global_alignment)
+        if global_alignment:
+            return self.global_alignment_result(*alignment, seq_one, seq_two)
+        return self.local_alignment_result(*alignment, seq_one, seq_two)
+
+    """Runs a global alignment that only fills matrices between maximal unique matches of the two sequences
+
+    Returns (result, stats). result has the same format as global_alignment_traceback gives and stats tells how
+    many matrix cells were computed, see anchors.anchored_alignment. The alignment is forced through the chained
+    matches, so for sequences that are not similar the score can be lower than the optimal one.
+    """
+
+    def anchored_global_alignment(self, seq_one, seq_two, k=20):
+        score, seq_a_gaps, seq_b_gaps, stats = anchors.anchored_alignment(self, seq_one, seq_two, k)
+        return self.global_alignment_result(score, seq_a_gaps, seq_b_gaps, seq_one, seq_two), stats
+
+    """Finds up to count local alignments that don't share any cell, best first (Waterman-Eggert)
+
+    Returns (result, hits). result is what local_alignment_traceback returns for the best hit, hits has a dict
+    per hit made by local_hit.
+    """
+
+    def top_local_alignments(self, seq_one, seq_two, count):
+        alignments = waterman_eggert.local_alignments(self, seq_one, seq_two, count)
+        # Without any positive score the result is the same as local_alignment_traceback gives
+        best_alignment = alignments[0] if alignments else (0, 0, 0, 0, 0, [], [])
+        result = self.local_alignment_result(*best_alignment, seq_one, seq_two)
+        return result, [self.local_hit(*alignment, seq_one, seq_two) for alignment in alignments]
+
+    """Describes one local alignment for the results page
+
+    The aligned part of each sequence is seq_one[seq_one_start:seq_one_end] and seq_two[seq_two_start:seq_two_end].
+    """
+
+    def local_hit(self, max_value, max_x, max_y, x, y, seq_a_gaps, seq_b_gaps, seq_one, seq_two):
+        alignment = cigar.Alignment.from_gaps(seq_one, seq_two, x, y, max_x, max_y, seq_a_gaps, seq_b_gaps)
+        columns = alignment.region_columns if self.columns_shown is None else min(self.columns_shown,
+                                                                                   alignment.region_columns)
+        aligned_one, match, aligned_two = alignment.region_window(0, columns)
+        return {
+            'score': max_value,
+            'percent_similarity': str(self.percent_similarity(max_value, len(seq_one), len(seq_two), False))[:7],
+            **alignment.to_dict(),
+            'aligned_one': aligned_one,
+            'match': match,
+            'aligned_two': aligned_two,
+        }
+
+    """Runs a global alignment with affine gap penalties (Gotoh's algorithm)
+
+    A gap of length L scores gap_open + (L - 1) * gap_extend instead of L * indel_penalty, so one long gap
+    scores better than several short ones. gap_open can't be higher than gap_extend.
+    Returns the same output as global_alignment_traceback.
+    """
+
+    def affine_global_alignment(self, seq_one, seq_two, gap_open, gap_extend):
+        score, seq_a_gaps, seq_b_gaps = affine.global_alignment(self, seq_one, seq_two, gap_open, gap_extend)
+        gap_penalty = affine.gap_cost(abs(len(seq_one) - len(seq_two)), gap_open, gap_extend)
+        return self.global_alignment_result(score, seq_a_gaps, seq_b_gaps, seq_one, seq_two, gap_penalty)
+
+    """Runs a global alignment with affine gap penalties that only fills the cells close to the diagonal
+
+    Returns the same output as affine_global_alignment, or None if the band would need more than max_cells cells.
+    See affine.banded_global_alignment.
+    """
+
+    def banded_affine_global_alignment(self, seq_one, seq_two, gap_open, gap_extend, max_cells=None):
+        alignment = affine.banded_global_alignment(self, seq_one, seq_two, gap_open, gap_extend, max_cells=max_cells)
+        if alignment is None:
+            return None
+        score, seq_a_gaps, seq_b_gaps = alignment
+        gap_penalty = affine.gap_cost(abs(len(seq_one) - len(seq_two)), gap_open, gap_extend)
+        return self.global_alignment_result(score, seq_a_gaps, seq_b_gaps, seq_one, seq_two, gap_penalty)
+
+    """Runs a local alignment with affine gap penalties, see affine_global_alignment
+
+    Returns the same output as local_alignment_traceback.
+    """
+
+    def affine_local_alignment(self, seq_one, seq_two, gap_open, gap_extend):
+        max_value, max_x, max_y, x, y, seq_a_gaps, seq_b_gaps = affine.local_alignment(self, seq_one, seq_two, gap_open,
+                                                                                        gap_extend)
+        return self.local_alignment_result(max_value, max_x, max_y, x, y, seq_a_gaps, seq_b_gaps, seq_one, seq_two)
+
+    """Returns only the score and percent similarity of an affine gap alignment, like score_only"""
+
+    def affine_score_only(self, seq_one, seq_two, gap_open, gap_extend, global_alignment=True):
+        score = affine.best_score(self, seq_one, seq_two, gap_open, gap_extend, global_alignment)
+        gap_penalty = affine.gap_cost(abs(len(seq_one) - len(seq_two)), gap_open, gap_extend)
+        percent_similarity = self.percent_similarity(score, len(seq_one), len(seq_two), global_alignment, gap_penalty)
+        return str(score), str(percent_similarity)[:7]
@@ -0,0 +1,123 @@
+import numpy as np
+
+from . import hirschberg, packed, seeds, vectorized
+
+
+def unique_kmers(sequence, k):
+    """Returns (kmers, positions) of the k-mers that occur exactly once in sequence, sorted by k-mer"""
+    kmers, positions = seeds.encode_kmers(sequence, k)
+    order = np.argsort(kmers, kind='stable')
+    kmers = kmers[order]
+    positions = positions[order]
+    _, first, counts = np.unique(kmers, return_index=True, return_counts=True)
+    first = first[counts == 1]
+    return kmers[first], positions[first]
+
+
+def maximal_unique_matches(seq_one, seq_two, k=20):
+    """Returns (xs, ys, lengths) of the maximal unique matches of two sequences, as int64 arrays sorted by xs
+
+    A match starts with a k-mer that occurs exactly once in each sequence. Matching k-mers that follow each other on
+    the same diagonal are merged, and every match is extended while the nucleotides are the same, so
+    seq_one[x:x + length] equals seq_two[y:y + length] and the match can't be made any longer.
+    Hashing the k-mers instead of building a suffix array finds the matches of at least k nucleotides in
+    O(n log n) with numpy.
+    """
+    kmers_one, positions_one = unique_kmers(seq_one, k)
+    kmers_two, positions_two = unique_kmers(seq_two, k)
+    _, in_one, in_two = np.intersect1d(kmers_one, kmers_two, assume_unique=True, return_indices=True)
+    xs = positions_one[in_one].astype(np.int64)
+    ys = positions_two[in_two].astype(np.int64)
+    if len(xs) == 0:
+        return xs, ys, xs.copy()
+
+    # Group the hits by diagonal and split each diagonal where the hits stop being consecutive
+    order = np.lexsort((xs, xs - ys))
+    xs = xs[order]
+    ys = ys[order]
+    starts = np.flatnonzero(np.concatenate(([True], (np.diff(xs) != 1) | (np.diff(xs - ys) != 0))))
+    ends = np.concatenate((starts[1:], [len(xs)]))
+    xs = xs[starts]
+    ys = ys[starts]
+    lengths = ends - starts + k - 1
+
+    # Extend the matches past the unique k-mers, to both sides
+    codes_one = packed.nucleotide_codes(seq_one).tobytes()
+    codes_two = packed.nucleotide_codes(seq_two).tobytes()
+    xs, ys, lengths = xs.tolist(), ys.tolist(), lengths.tolist()
+    for i in range(len(xs)):
+        x, y, length = xs[i], ys[i], lengths[i]
+        while x > 0 and y > 0 and codes_one[x - 1] == codes_two[y - 1]:
+            x -= 1
+            y -= 1
+            length += 1
+        while x + length < len(codes_one) and y + length < len(codes_two) and \
+                codes_one[x + length] == codes_two[y + length]:
+            length += 1
+        xs[i], ys[i], lengths[i] = x, y, length
+
+    order = np.argsort(xs, kind='stable')
+    return np.array(xs, dtype=np.int64)[order], np.array(ys, dtype=np.int64)[order], \
+        np.array(lengths, dtype=np.int64)[order]
+
+
+def anchored_alignment(scorer, seq_one, seq_two, k=20):
+    """Globally aligns seq_one and seq_two by chaining maximal unique matches and aligning only between them
+
+    The matches are chained with the longest increasing subsequence of seeds.chain_hits and used as anchors:
+    every anchor is aligned without gaps and the parts of the sequences between two anchors (and before the first
+    and after the last one) are aligned with hirschberg.align. For similar genomes this replaces one huge matrix
+    with many small ones. This is a heuristic: the alignment is forced through the anchors, so it can score lower
+    than the optimal alignment when an anchor is not on the optimal path.
+
+    Returns (score, seq_a_gaps, seq_b_gaps, stats) where the gaps are in the format add_dashes expects and stats
+    is a dict with the number of anchors, the anchored nucleotides, the matrix cells computed between the anchors
+    and the cells of the full matrix.
+    """
+    scoring_matrix, codes_one, codes_two = vectorized.prepare(scorer, seq_one, seq_two)
+    xs, ys, lengths = maximal_unique_matches(seq_one, seq_two, k)
+    chain = seeds.chain_hits(xs, ys) if len(xs) else []
+
+    seq_a_gaps = []
+    seq_b_gaps = []
+    score = 0
+    cells = 0
+    anchors = 0
+    anchored = 0
+
+    # (x, y) is where the aligned part ends so far
+    x = 0
+    y = 0
+    for anchor_x, anchor_y, length in zip(xs[chain].tolist(), ys[chain].tolist(), lengths[chain].tolist()):
+        # Skip the part of the anchor that overlaps what is already aligned, like seed_and_extend does
+        overlap = max(x - anchor_x, y - anchor_y, 0)
+        if overlap >= length:
+            continue
+        anchor_x += overlap
+        anchor_y += overlap
+        length -= overlap
+
+        if anchor_x > x or anchor_y > y:
+            score += hirschberg.align(scoring_matrix, scorer.indel_penalty, codes_one[x:anchor_x],
+                                      codes_two[y:anchor_y], x, y, seq_a_gaps, seq_b_gaps).item()
+            cells += (anchor_x - x) * (anchor_y - y)
+
+        score += scoring_matrix[codes_two[anchor_y:anchor_y + length], codes_one[anchor_x:anchor_x + length]].sum().item()
+        x = anchor_x + length
+        y = anchor_y + length
+        anchors += 1
+        anchored += length
+
+    # The rest of the sequences after the last anchor
+    if x < len(codes_one) or y < len(codes_two):
+        score += hirschberg.align(scoring_matrix, scorer.indel_penalty, codes_one[x:], codes_two[y:], x, y,
+                                  seq_a_gaps, seq_b_gaps).item()
+        cells += (len(codes_one) - x) * (len(codes_two) - y)
+
+    stats = {
+        'anchors': anchors,
+        'anchored_nucleotides': anchored,
+        'cells': cells,
+        'full_matrix_cells': len(codes_one) * len(codes_two),
+    }
+    return score, seq_a_gaps, seq_b_gaps, stats
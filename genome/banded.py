@@ -0,0 +1,139 @@
+import numpy as np
+
+from . import traceback, vectorized
+from .traceback import BandedTracebackMatrix
+
+# Stands in for the score of cells outside the band. It is low enough that it never ties with a real score
+# and far enough from the int64 limit that adding penalties to it can't overflow.
+OUTSIDE_BAND = -(2 ** 60)
+
+
+def fill_band(scoring_matrix, indel_penalty, codes_one, codes_two, lowest_diagonal, highest_diagonal):
+    """Fills the global alignment matrices, only computing the cells with lowest_diagonal <= x - y <= highest_diagonal
+
+    Returns (score, traceback_matrix) where traceback_matrix is a BandedTracebackMatrix.
+    Cells outside the band are treated as if their score were OUTSIDE_BAND, so the cells inside get the same
+    values and directions as in the full matrices whenever the optimal paths to them stay in the band.
+    """
+    columns = len(codes_one) + 1
+    traceback_matrix = BandedTracebackMatrix(len(codes_two) + 1, lowest_diagonal, highest_diagonal)
+
+    # Two full width rows are reused, only the band part of each row is written.
+    # Bands move right as y grows, so the cells just right of a row's band are never written and stay OUTSIDE_BAND.
+    previous_row = np.full(columns + 1, OUTSIDE_BAND, dtype=scoring_matrix.dtype)
+    current_row = previous_row.copy()
+
+    # The first row is made of gaps, like in create_initalized_matrices
+    last = min(columns - 1, highest_diagonal)
+    previous_row[:last + 1] = np.arange(last + 1) * indel_penalty
+    traceback_matrix.codes[0, :] = traceback.LEFT
+    traceback_matrix.codes[0, -lowest_diagonal] = traceback.UP
+
+    gap_offsets = np.arange(columns + 1, dtype=scoring_matrix.dtype) * indel_penalty
+    profile = vectorized.query_profile(scoring_matrix, codes_one)
+    for y in range(1, len(codes_two) + 1):
+        first = max(0, y + lowest_diagonal)
+        last = min(columns - 1, y + highest_diagonal)
+        offset = first - y - lowest_diagonal
+
+        if first == 0:
+            # Column 0 is made of gaps, like in create_initalized_matrices
+            current_row[0] = y * indel_penalty
+            traceback_matrix.codes[y, offset] = traceback.UP
+            start = 1
+        else:
+            start = first
+
+        # fill_row needs the cell left of the first computed column, which is outside the band unless it is column 0
+        first_value = current_row[0] if first == 0 else OUTSIDE_BAND
+        row, directions = vectorized.fill_row(previous_row[start - 1:last + 1],
+                                              profile[codes_two[y - 1], start - 1:last],
+                                              first_value, indel_penalty, gap_offsets[:last - start + 2])
+        current_row[start:last + 1] = row[1:]
+        traceback_matrix.codes[y, offset + start - first:offset + last - first + 1] = directions
+
+        previous_row, current_row = current_row, previous_row
+
+    return previous_row[columns - 1].item(), traceback_matrix
+
+
+def band_is_optimal(score, maximum_match_value, indel_penalty, sequence_one_len, sequence_two_len, lowest_diagonal,
+                    highest_diagonal):
+    """Returns True when no alignment that leaves the band can score as much as score
+
+    An alignment that leaves the band has to use some minimum number of gaps. Every other column is at best
+    a maximum_match_value match, which gives an upper bound for its score (Ukkonen's cut-off).
+    When score is strictly higher, every optimal path, including the one the traceback follows, lies in the band.
+    """
+    total_len = sequence_one_len + sequence_two_len
+    length_difference = sequence_one_len - sequence_two_len
+
+    # Minimum number of gaps for an alignment that goes past each edge of the band
+    fewest_gaps = []
+    if highest_diagonal < sequence_one_len:
+        fewest_gaps.append(2 * (highest_diagonal + 1) - length_difference)
+    if lowest_diagonal > -sequence_two_len:
+        fewest_gaps.append(2 * (1 - lowest_diagonal) + length_difference)
+    if not fewest_gaps:
+        return True  # The band covers the whole matrix
+
+    # The bound is linear in the number of gaps, so the highest value is at one of the two ends.
+    # Both sides are doubled to keep the comparison in integers.
+    gaps = min(fewest_gaps)
+    best_outside = max((total_len - gaps) * maximum_match_value + 2 * gaps * indel_penalty,
+                       2 * total_len * indel_penalty)
+    return 2 * score > best_outside
+
+
+def next_band(score, maximum_match_value, indel_penalty, sequence_one_len, sequence_two_len, band):
+    """Returns the band to try after band failed to prove score optimal
+
+    A wider band can only give a higher score, so this is the narrowest band wider than band for which
+    band_is_optimal would already accept score. It saves the passes of doubling the band one step at a time.
+    """
+    length_difference = sequence_one_len - sequence_two_len
+
+    def proves(width):
+        return band_is_optimal(score, maximum_match_value, indel_penalty, sequence_one_len, sequence_two_len,
+                               min(0, length_difference) - width, max(0, length_difference) + width)
+
+    # Grow the band until it proves score, the band that covers the whole matrix always does
+    low = band + 1
+    high = max(low, band * 2)
+    while not proves(high):
+        low = high + 1
+        high *= 2
+    # Then find the narrowest one between the last band that didn't and high
+    while low < high:
+        middle = (low + high) // 2
+        if proves(middle):
+            high = middle
+        else:
+            low = middle + 1
+    return high
+
+
+def banded_alignment(scorer, seq_one, seq_two, band=8, max_cells=None):
+    """Globally aligns seq_one and seq_two, only filling the cells within band of the diagonal
+
+    The band is doubled until band_is_optimal proves that the banded score is the optimal score, which
+    means the traceback is exactly the one of the full matrices. Near identical sequences only need a
+    small band, so this takes O(band * len(seq_two)) time and memory instead of O(len(seq_one) * len(seq_two)).
+
+    Returns (score, traceback_matrix), or None when the band would need more than max_cells cells.
+    """
+    scoring_matrix, codes_one, codes_two = vectorized.prepare(scorer, seq_one, seq_two)
+    length_difference = len(seq_one) - len(seq_two)
+
+    while True:
+        lowest_diagonal = min(0, length_difference) - band
+        highest_diagonal = max(0, length_difference) + band
+        if max_cells is not None and (len(seq_two) + 1) * (highest_diagonal - lowest_diagonal + 1) > max_cells:
+            return None
+
+        score, traceback_matrix = fill_band(scoring_matrix, scorer.indel_penalty, codes_one, codes_two,
+                                            lowest_diagonal, highest_diagonal)
+        if band_is_optimal(score, scorer.maximum_match_value, scorer.indel_penalty, len(seq_one), len(seq_two),
+                           lowest_diagonal, highest_diagonal):
+            return score, traceback_matrix
+        band = max(1, band * 2)
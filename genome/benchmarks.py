@@ -0,0 +1,268 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from . import align, reference_cache
+from .models import AlignmentJob
+from .scoring import INDEL_PENALTY, SCORING_MATRIX
+
+# Nucleotide frequencies of the SARS-CoV-2 reference genome (NC_045512.2)
+SARS_COV_2_FREQUENCIES = {'A': 0.299, 'C': 0.184, 'G': 0.196, 'T': 0.321}
+
+DEFAULT_LENGTHS = [100, 300, 1000, 3000, 10000, 30000]
+
+# Options the engines that need them are benchmarked with, see align.Engine.requires
+ENGINE_OPTIONS = {
+    'gap_open': {'gap_open': -3, 'gap_extend': -1},
+    'anchored': {'anchored': True},
+    'top_hits': {'top_hits': 3},
+}
+
+MODES = {'global': True, 'local': False}
+
+
+def best_time(function, repeat):
+    """Returns the fastest of repeat runs of function in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def peak_memory(function):
+    """Returns the most memory in bytes that Python and numpy had allocated at once while function ran"""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def random_genome(length, rng, frequencies=SARS_COV_2_FREQUENCIES):
+    """Returns a random sequence of length nucleotides drawn with the given frequencies"""
+    return ''.join(rng.choices(list(frequencies), weights=list(frequencies.values()), k=length))
+
+
+def mutate(sequence, rng, substitution_rate=0.01, indel_rate=0.002, max_indel=10):
+    """Returns a copy of sequence with random mutations, like a sample sequenced against a reference
+
+    Every nucleotide is replaced by another one with probability substitution_rate, and an insertion or a
+    deletion of 1 to max_indel nucleotides starts at it with probability indel_rate.
+    """
+    pieces = []
+    position = 0
+    while position < len(sequence):
+        draw = rng.random()
+        if draw < indel_rate / 2:
+            pieces.append(random_genome(rng.randint(1, max_indel), rng))
+        elif draw < indel_rate:
+            position += rng.randint(1, max_indel)
+            continue
+        nucleotide = sequence[position]
+        if rng.random() < substitution_rate:
+            nucleotide = rng.choice([other for other in 'ACGT' if other != nucleotide])
+        pieces.append(nucleotide)
+        position += 1
+    return ''.join(pieces)
+
+
+def engine_options(engine):
+    """Returns the options align needs to run engine, see ENGINE_OPTIONS"""
+    options = {}
+    for option in sorted(engine.options):
+        options.update(ENGINE_OPTIONS.get(option, {}))
+    return options
+
+
+def skip_reason(engine, len_one, len_two, cell_budget, max_seconds):
+    """Returns why engine is left out for sequences of these lengths, or None when it is benchmarked"""
+    seconds, cells = engine.estimate(len_one, len_two)
+    if cells > cell_budget and engine.budgeted:
+        return f'needs about {cells:.3g} cells, more than the budget of {cell_budget:.3g}'
+    if seconds > max_seconds:
+        return f'estimated to take {seconds:.3g} seconds, more than {max_seconds:.3g}'
+    return None
+
+
+def benchmark_engine(engine_name, seq_one, seq_two, global_alignment, repeat=3, cell_budget=align.DEFAULT_CELL_BUDGET):
+    """Aligns seq_one and seq_two with an engine (or align.AUTO) and measures it
+
+    Returns a dict with the fastest of repeat runs in seconds, the matrix cells per second (the cells of the full
+    matrices, whatever the engine computes, so the engines can be compared), the peak memory of one more run,
+    the score and the engine that ran.
+    """
+    options = {} if engine_name == align.AUTO else engine_options(align.get_engine(engine_name))
+    results = []
+
+    def run():
+        results.append(align.align(SCORING_MATRIX, INDEL_PENALTY, seq_one, seq_two, global_alignment, engine_name,
+                                   cell_budget, **options))
+
+    seconds = best_time(run, repeat)
+    cells = len(seq_one) * len(seq_two)
+    return {
+        'seconds': seconds,
+        'cells': cells,
+        'cells_per_second': cells / seconds if seconds else None,
+        'peak_memory_bytes': peak_memory(run),
+        'score': results[-1].score,
+        'selected_engine': results[-1].engine,
+    }
+
+
+def benchmark_upload(engine_name, seq_one, seq_two, global_alignment, cell_budget=align.DEFAULT_CELL_BUDGET):
+    """Returns the seconds UploadTxt.post takes to align the pair uploaded as two files, from the request to the
+    response
+
+    The job runs in the request (GENOME_JOB_WORKERS = 0) with GENOME_ENGINE set to engine_name, so this is the
+    whole upload path: reading the files, the result cache, the job and main_local. Everything written to the
+    database is rolled back. The engine name is added to the FASTA headers so every upload misses the result cache.
+    """
+    from .views import UploadTxt
+
+    options = {} if engine_name == align.AUTO else engine_options(align.get_engine(engine_name))
+    data = {
+        'algo': 'Global' if global_alignment else '',
+        'file1': SimpleUploadedFile('reference.txt', f'>{engine_name} reference\n{seq_one}\n'.encode('ascii')),
+        'file2': SimpleUploadedFile('sample.txt', f'>{engine_name} sample\n{seq_two}\n'.encode('ascii')),
+        'top_hits': str(options.get('top_hits', 1)),
+        'skip_graph': 'on',
+    }
+    request = RequestFactory().post('/', data)
+
+    with override_settings(GENOME_ENGINE=engine_name, GENOME_JOB_WORKERS=0, GENOME_PAIR_WORKERS=1,
+                           GENOME_FULL_MATRIX_CELL_BUDGET=cell_budget, GENOME_GAP_OPEN=options.get('gap_open'),
+                           GENOME_GAP_EXTEND=options.get('gap_extend'),
+                           GENOME_ANCHORED_GLOBAL=options.get('anchored', False), GENOME_MAX_DIVERGENCE=None), \
+            transaction.atomic():
+        start = time.perf_counter()
+        UploadTxt.as_view()(request)
+        seconds = time.perf_counter() - start
+
+        job = AlignmentJob.objects.latest('id')
+        error = job.error if job.status == AlignmentJob.FAILED else None
+        transaction.set_rollback(True)
+
+    if error:
+        raise RuntimeError(f'The upload with engine {engine_name} failed: {error}. The traceback is logged by '
+                           f'genome.jobs')
+    return seconds
+
+
+def git_commit():
+    """Returns the commit the benchmark runs on, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(engines=None, lengths=DEFAULT_LENGTHS, modes=MODES, repeat=3, substitution_rate=0.01,
+                   indel_rate=0.002, seed=0, cell_budget=align.DEFAULT_CELL_BUDGET, max_seconds=10, upload=True,
+                   log=None):
+    """Benchmarks the engines on synthetic sequence pairs and returns the report as a JSON serializable dict
+
+    For every length a random reference with the nucleotide frequencies of SARS-CoV-2 is made and mutated into a
+    sample. Every engine (align.AUTO and every registered engine by default) that supports the mode is measured
+    with benchmark_engine and, with upload, benchmark_upload. Engines that would need more than cell_budget cells
+    or are estimated to take more than max_seconds are skipped. log(row) is called after every row.
+    """
+    if engines is None:
+        engines = [align.AUTO] + list(align.ENGINES)
+    rng = random.Random(seed)
+    rows = []
+
+    # Uploads build reference indexes, which are kept in a temporary directory instead of the reference cache
+    with tempfile.TemporaryDirectory() as directory, override_settings(GENOME_REFERENCE_CACHE_DIR=directory):
+        reference_cache._reference_cache = None
+        try:
+            for length in lengths:
+                seq_one = random_genome(length, rng)
+                seq_two = mutate(seq_one, rng, substitution_rate, indel_rate)
+                for mode, global_alignment in modes.items():
+                    for engine_name in engines:
+                        row = {'engine': engine_name, 'mode': mode, 'length': length, 'len_one': len(seq_one),
+                               'len_two': len(seq_two)}
+                        if engine_name != align.AUTO:
+                            engine = align.get_engine(engine_name)
+                            if not engine.supports(global_alignment):
+                                continue
+                            row['skipped'] = skip_reason(engine, len(seq_one), len(seq_two), cell_budget,
+                                                         max_seconds)
+                        if not row.get('skipped'):
+                            # The engines and main_local print progress, which would bury the report
+                            with contextlib.redirect_stdout(io.StringIO()):
+                                row.update(benchmark_engine(engine_name, seq_one, seq_two, global_alignment, repeat,
+                                                            cell_budget))
+                                if upload:
+                                    row['upload_seconds'] = benchmark_upload(engine_name, seq_one, seq_two,
+                                                                             global_alignment, cell_budget)
+                        rows.append(row)
+                        if log is not None:
+                            log(row)
+        finally:
+            reference_cache._reference_cache = None
+
+    return {
+        'commit': git_commit(),
+        'created_at': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'cpu_count': os.cpu_count(),
+        'parameters': {
+            'lengths': list(lengths),
+            'modes': list(modes),
+            'repeat': repeat,
+            'substitution_rate': substitution_rate,
+            'indel_rate': indel_rate,
+            'seed': seed,
+            'cell_budget': cell_budget,
+            'max_seconds': max_seconds,
+        },
+        'results': rows,
+    }
+
+
+def compare(report, baseline, tolerance=0.1):
+    """Compares two reports of run_benchmarks and returns a list of (row, speed ratio, upload ratio, regressed)
+
+    The ratios are new / baseline speeds, so below 1 is slower. Rows are matched by engine, mode and length.
+    A row regressed when either ratio is more than tolerance below 1.
+    """
+    baseline_rows = {(row['engine'], row['mode'], row['length']): row for row in baseline['results']}
+    comparisons = []
+    for row in report['results']:
+        old = baseline_rows.get((row['engine'], row['mode'], row['length']))
+        if old is None or row.get('skipped') or old.get('skipped'):
+            continue
+        speed = row['cells_per_second'] / old['cells_per_second']
+        upload = None
+        if row.get('upload_seconds') and old.get('upload_seconds'):
+            upload = old['upload_seconds'] / row['upload_seconds']
+        regressed = speed < 1 - tolerance or (upload is not None and upload < 1 - tolerance)
+        comparisons.append((row, speed, upload, regressed))
+    return comparisons
+
+
+def write_report(report, path):
+    """Writes a report of run_benchmarks to path as JSON, to be compared with a later run"""
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
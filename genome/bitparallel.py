@@ -0,0 +1,102 @@
+import numpy as np
+
+from . import packed, parallel
+from .fasta import read_fasta
+
+
+def match_masks(codes):
+    """Returns {code: mask} where bit i of mask is set when codes[i] is code, as Python ints"""
+    masks = {}
+    for code in np.unique(codes).tolist():
+        bits = np.packbits(codes == code, bitorder='little')
+        masks[code] = int.from_bytes(bits.tobytes(), 'little')
+    return masks
+
+
+def edit_distance(seq_one, seq_two, max_distance=None):
+    """Returns the unit cost edit distance (Levenshtein distance) between seq_one and seq_two
+
+    Uses Myers' bit-vector algorithm: a whole column of the edit distance matrix is held in two Python ints
+    with one bit per nucleotide of seq_two, so every nucleotide of seq_one costs a handful of big int operations
+    instead of len(seq_two) cells. That is about len(seq_two) / 64 machine words per nucleotide.
+    seq_one and seq_two can be str or PackedSequence.
+
+    With max_distance, None is returned as soon as the distance is known to be higher than max_distance.
+    """
+    codes_one = packed.nucleotide_codes(seq_one)
+    codes_two = packed.nucleotide_codes(seq_two)
+    if max_distance is not None and abs(len(codes_one) - len(codes_two)) > max_distance:
+        return None
+    if len(codes_two) == 0:
+        return len(codes_one)
+
+    masks = match_masks(codes_two)
+    all_bits = (1 << len(codes_two)) - 1
+    last_bit = 1 << (len(codes_two) - 1)
+    # Vertical differences of the current column: positive_vertical has bit i set when the cell in row i + 1 is
+    # one more than the cell above it, negative_vertical when it is one less. Column 0 goes 0, 1, 2, ...
+    positive_vertical = all_bits
+    negative_vertical = 0
+    distance = len(codes_two)
+
+    remaining = len(codes_one)
+    for code in codes_one.tolist():
+        match = masks.get(code, 0)
+        vertical = match | negative_vertical
+        horizontal = (((match & positive_vertical) + positive_vertical) ^ positive_vertical) | match
+        positive_horizontal = negative_vertical | ~(horizontal | positive_vertical)
+        negative_horizontal = positive_vertical & horizontal
+
+        # The last bit gives the horizontal difference in the bottom row, which holds the distance
+        if positive_horizontal & last_bit:
+            distance += 1
+        elif negative_horizontal & last_bit:
+            distance -= 1
+
+        # Row 0 goes 0, 1, 2, ... so the top cell always increases by one
+        positive_horizontal = ((positive_horizontal << 1) | 1) & all_bits
+        negative_horizontal = (negative_horizontal << 1) & all_bits
+        positive_vertical = (negative_horizontal | ~(vertical | positive_horizontal)) & all_bits
+        negative_vertical = positive_horizontal & vertical
+
+        # Every remaining column can lower the distance by at most one
+        remaining -= 1
+        if max_distance is not None and distance - remaining > max_distance:
+            return None
+
+    return distance
+
+
+def divergence(seq_one, seq_two):
+    """Returns the edit distance between seq_one and seq_two divided by the length of the longer one, from 0 to 1"""
+    length = max(len(seq_one), len(seq_two))
+    return edit_distance(seq_one, seq_two) / length if length else 0.0
+
+
+def max_edit_distance(max_divergence, seq_one, seq_two):
+    """Returns the highest edit distance two sequences of these lengths can have without diverging more than
+    max_divergence"""
+    return int(max_divergence * max(len(seq_one), len(seq_two)))
+
+
+def triage_pair(task):
+    """Returns (edit_distance, divergence) of one pair, or (None, None) when it diverges more than max_divergence"""
+    seq_one, seq_two, max_divergence = task
+    max_distance = None if max_divergence is None else max_edit_distance(max_divergence, seq_one, seq_two)
+    distance = edit_distance(seq_one, seq_two, max_distance)
+    if distance is None:
+        return None, None
+    length = max(len(seq_one), len(seq_two))
+    return distance, distance / length if length else 0.0
+
+
+def triage(f1_path, f2_path, max_divergence=None, workers=None, chunksize=None):
+    """Yields (edit_distance, divergence) for every sequence pair of two FASTA files, in order
+
+    A quick check of a large batch of samples against a reference before aligning them: the edit distance
+    is much cheaper than the weighted alignment. Pairs that diverge more than max_divergence give
+    (None, None) without computing their whole distance. The pairs run in a process pool like main_local's.
+    """
+    tasks = ((seq_one, seq_two, max_divergence)
+             for (_, seq_one), (_, seq_two) in zip(read_fasta(f1_path), read_fasta(f2_path)))
+    yield from parallel.map_pairs(triage_pair, tasks, workers, chunksize)
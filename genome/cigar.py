@@ -0,0 +1,191 @@
+import re
+from bisect import bisect_right
+from itertools import accumulate
+
+import numpy as np
+
+from . import packed
+
+# CIGAR operations, with the first sequence as the reference:
+# = both nucleotides are the same, X they are different, I a nucleotide of seq_two against a gap in seq_one,
+# D a nucleotide of seq_one against a gap in seq_two
+OPERATIONS = '=XID'
+# Which sequences have a nucleotide in a column of each operation
+USES_ONE = {'=': True, 'X': True, 'I': False, 'D': True}
+USES_TWO = {'=': True, 'X': True, 'I': True, 'D': False}
+MATCH_CHARACTERS = {'=': '|', 'X': ' ', 'I': ' ', 'D': ' '}
+
+CIGAR_PATTERN = re.compile(r'(\d+)([=XID])')
+
+
+def letter_columns(length, gaps, start):
+    """Returns the column of every nucleotide of a sequence piece of length nucleotides once its gaps are added
+
+    gaps are positions in the format add_dashes expects, offset by start.
+    """
+    counts = np.bincount(np.asarray(gaps, dtype=np.int64) - start, minlength=length + 1)
+    return np.arange(length) + np.cumsum(counts)[:length]
+
+
+def operations_from_gaps(seq_one, seq_two, x, y, max_x, max_y, seq_a_gaps, seq_b_gaps):
+    """Returns the run-length encoded operations, a list of (length, operation), of the aligned region
+
+    The region covers seq_one[x:max_x] and seq_two[y:max_y] and the gaps are in the format add_dashes expects.
+    This takes O(region + gaps) time, no gapped string is built.
+    """
+    columns = (max_x - x) + len(seq_a_gaps)
+    one = np.full(columns, -1, dtype=np.int16)
+    two = np.full(columns, -1, dtype=np.int16)
+    one[letter_columns(max_x - x, seq_a_gaps, x)] = packed.nucleotide_codes(seq_one[x:max_x])
+    two[letter_columns(max_y - y, seq_b_gaps, y)] = packed.nucleotide_codes(seq_two[y:max_y])
+
+    # Operation index in OPERATIONS of every column
+    codes = np.where(one == two, 0, 1)
+    codes[one < 0] = 2
+    codes[two < 0] = 3
+    if columns == 0:
+        return []
+    starts = np.flatnonzero(np.concatenate(([True], codes[1:] != codes[:-1])))
+    lengths = np.diff(np.append(starts, columns))
+    return [(length, OPERATIONS[code]) for length, code in zip(lengths.tolist(), codes[starts].tolist())]
+
+
+def to_string(operations):
+    """Returns the CIGAR string of operations, like 12=1X3I40="""
+    return ''.join(f'{length}{operation}' for length, operation in operations)
+
+
+def parse(cigar):
+    """Returns the operations of a CIGAR string made by to_string"""
+    return [(int(length), operation) for length, operation in CIGAR_PATTERN.findall(cigar)]
+
+
+class Alignment:
+    """An alignment of two sequences stored as CIGAR operations instead of gapped strings
+
+    The aligned region covers seq_one[x:max_x] and seq_two[y:max_y]. The alignment is shown the way the
+    tracebacks always showed it: for a local alignment the parts of the sequences before the region are padded
+    with - so the region starts in the same column, and the parts after it follow the region. The match line has
+    a | for every column where both nucleotides are the same.
+
+    window renders any range of columns without building the whole strings, so showing the first columns of a
+    long alignment costs only the operations before them plus the columns shown.
+    """
+
+    def __init__(self, seq_one, seq_two, x, y, max_x, max_y, operations):
+        self.seq_one = seq_one
+        self.seq_two = seq_two
+        self.x = x
+        self.y = y
+        self.max_x = max_x
+        self.max_y = max_y
+        self.operations = operations
+        # Column and positions in both sequences where each operation starts, and the number of columns of the region
+        self.operation_starts = [0] + list(accumulate(length for length, _ in operations))
+        self.region_columns = self.operation_starts.pop()
+        self.positions_one = list(accumulate((length if USES_ONE[operation] else 0 for length, operation in operations),
+                                             initial=x))
+        self.positions_two = list(accumulate((length if USES_TWO[operation] else 0 for length, operation in operations),
+                                             initial=y))
+
+    @classmethod
+    def from_gaps(cls, seq_one, seq_two, x, y, max_x, max_y, seq_a_gaps, seq_b_gaps):
+        operations = operations_from_gaps(seq_one, seq_two, x, y, max_x, max_y, seq_a_gaps, seq_b_gaps)
+        return cls(seq_one, seq_two, x, y, max_x, max_y, operations)
+
+    @property
+    def cigar(self):
+        return to_string(self.operations)
+
+    def to_dict(self, sequences=False):
+        """Returns the CIGAR string and the region of the alignment, for machine-readable output
+
+        With sequences, both sequences are added so from_dict can rebuild the Alignment.
+        """
+        data = {
+            'cigar': self.cigar,
+            'seq_one_start': self.x,
+            'seq_one_end': self.max_x,
+            'seq_two_start': self.y,
+            'seq_two_end': self.max_y,
+        }
+        if sequences:
+            data['seq_one'] = str(self.seq_one)
+            data['seq_two'] = str(self.seq_two)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuilds an Alignment from to_dict(sequences=True)"""
+        return cls(data['seq_one'], data['seq_two'], data['seq_one_start'], data['seq_two_start'],
+                   data['seq_one_end'], data['seq_two_end'], parse(data['cigar']))
+
+    # Columns before the region
+    @property
+    def leading_columns(self):
+        return max(self.x, self.y)
+
+    def __len__(self):
+        """Number of columns of the longer of the two lines"""
+        return self.leading_columns + self.region_columns + max(len(self.seq_one) - self.max_x,
+                                                                len(self.seq_two) - self.max_y)
+
+    def region_window(self, start, end):
+        """Returns the three lines of columns start to end of the region (0 is its first column)"""
+        line_one = []
+        line_two = []
+        match_line = []
+        index = max(bisect_right(self.operation_starts, start) - 1, 0)
+        while index < len(self.operations) and self.operation_starts[index] < end:
+            length, operation = self.operations[index]
+            skip = max(start - self.operation_starts[index], 0)
+            shown = min(end - self.operation_starts[index], length) - skip
+            if USES_ONE[operation]:
+                position = self.positions_one[index] + skip
+                line_one.append(str(self.seq_one[position:position + shown]))
+            else:
+                line_one.append('-' * shown)
+            if USES_TWO[operation]:
+                position = self.positions_two[index] + skip
+                line_two.append(str(self.seq_two[position:position + shown]))
+            else:
+                line_two.append('-' * shown)
+            match_line.append(MATCH_CHARACTERS[operation] * shown)
+            index += 1
+        return ''.join(line_one), ''.join(match_line), ''.join(line_two)
+
+    def flank(self, sequence, padding, start, end):
+        """Returns columns start to end of the part of a line before the region
+
+        The line starts with padding -'s followed by the sequence, end must not be past the region.
+        """
+        dashes = '-' * max(min(end, padding) - start, 0)
+        return dashes + str(sequence[max(start - padding, 0):max(end - padding, 0)])
+
+    def window(self, start=0, end=None):
+        """Returns (line_one, match_line, line_two) for the columns start to end (end excluded)
+
+        Lines that end before end are shorter, like the lines of a local alignment after its region.
+        """
+        if end is None:
+            end = len(self)
+        leading = self.leading_columns
+        region_end = leading + self.region_columns
+
+        line_one = self.flank(self.seq_one, leading - self.x, start, min(end, leading))
+        line_two = self.flank(self.seq_two, leading - self.y, start, min(end, leading))
+        match_line = ' ' * max(min(end, leading) - start, 0)
+
+        if end > leading and start < region_end:
+            region = self.region_window(max(start - leading, 0), min(end, region_end) - leading)
+            line_one += region[0]
+            match_line += region[1]
+            line_two += region[2]
+
+        # The parts of the sequences after the region
+        if end > region_end:
+            tail_start = max(start - region_end, 0)
+            tail_end = end - region_end
+            line_one += str(self.seq_one[self.max_x + tail_start:self.max_x + tail_end])
+            line_two += str(self.seq_two[self.max_y + tail_start:self.max_y + tail_end])
+        return line_one, match_line, line_two
@@ -0,0 +1,48 @@
+import io
+
+
+def parse_fasta(lines):
+    """Yields a (header, sequence) tuple for every record of the FASTA text in lines, an iterable of str lines
+
+    header is the text after '>' on the header line, or '' for a sequence before the first header.
+    The lines of a sequence are collected in a list and joined once, so building a record is linear in its length.
+    Records without any line after the header are skipped, like get_sequences always did.
+    """
+    header = ''
+    sequence_lines = []
+    for line in lines:
+        if line.startswith('>'):
+            if sequence_lines:
+                yield header, ''.join(sequence_lines)
+                sequence_lines = []
+            header = line[1:].rstrip('\r\n')
+        else:
+            sequence_lines.append(line.rstrip('\r\n'))
+    if sequence_lines:
+        yield header, ''.join(sequence_lines)
+
+
+def read_fasta(source):
+    """Yields a (header, sequence) tuple for every record of a FASTA file, reading one record at a time
+
+    source is the path of the file, or its contents as bytes, like an upload read into memory.
+    """
+    if isinstance(source, bytes):
+        # TextIOWrapper decodes and splits the lines as they are read, like open does
+        yield from parse_fasta(io.TextIOWrapper(io.BytesIO(source), encoding='utf-8'))
+        return
+    with open(source) as file:
+        yield from parse_fasta(file)
+
+
+def get_sequences(path):
+    """Returns a list(string) of genetic sequences
+
+    The relative file path of the file containing the genetic sequences, or the contents of the file as bytes
+    """
+    return [sequence for _, sequence in read_fasta(path)]
+
+
+def source_name(source):
+    """Returns how messages refer to a FASTA source passed to read_fasta"""
+    return 'uploaded file' if isinstance(source, bytes) else source
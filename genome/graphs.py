@@ -0,0 +1,58 @@
+import base64
+import io
+from html import escape
+
+
+def runtime_series(lengths, times):
+    """Returns the points of the runtime graph, [length, seconds] pairs sorted by length
+
+    The series is small and JSON serializable, so it is stored in the result instead of an image.
+    """
+    return [[length, runtime] for length, runtime in sorted(zip(lengths, times))]
+
+
+def runtime_png(series):
+    """Returns the runtime graph as a base64 encoded PNG, drawn into memory instead of a file
+
+    matplotlib is imported here, so only the code that asks for a PNG pays for it. A Figure is used instead
+    of pyplot, which keeps global state and isn't safe to use from several threads.
+    """
+    from matplotlib.figure import Figure
+
+    figure = Figure()
+    axes = figure.subplots()
+    axes.plot([length for length, _ in series], [runtime for _, runtime in series])
+    axes.set_ylabel('Time (seconds)')
+    axes.set_xlabel('Sequence length')
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png', bbox_inches='tight')
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def runtime_svg(series, width=300, height=300):
+    """Returns the runtime graph as an inline SVG element, like runtime_png but without matplotlib"""
+    margin = 40
+    max_length = max((length for length, _ in series), default=0) or 1
+    max_runtime = max((runtime for _, runtime in series), default=0) or 1
+    plot_width = width - 2 * margin
+    plot_height = height - 2 * margin
+
+    points = ' '.join(f'{margin + length / max_length * plot_width:.1f},'
+                      f'{height - margin - runtime / max_runtime * plot_height:.1f}' for length, runtime in series)
+    labels = [
+        # x, y, anchor, text
+        (margin, height - margin + 14, 'start', '0'),
+        (width - margin, height - margin + 14, 'end', str(max_length)),
+        (width / 2, height - 8, 'middle', 'Sequence length'),
+        (margin - 4, margin + 4, 'end', f'{max_runtime:.3g}'),
+        (margin - 4, height - margin, 'end', '0'),
+    ]
+    text = ''.join(f'<text x="{x}" y="{y}" text-anchor="{anchor}">{escape(label)}</text>'
+                   for x, y, anchor, label in labels)
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}" font-size="10" font-family="sans-serif">'
+            f'<text x="12" y="{height / 2}" text-anchor="middle" transform="rotate(-90 12 {height / 2})">'
+            f'Time (seconds)</text>{text}'
+            f'<polyline points="{margin},{margin} {margin},{height - margin} {width - margin},{height - margin}" '
+            f'fill="none" stroke="black"/>'
+            f'<polyline points="{points}" fill="none" stroke="#1f77b4" stroke-width="1.5"/></svg>')
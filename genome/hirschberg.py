@@ -0,0 +1,89 @@
+import numpy as np
+
+from . import traceback, vectorized
+
+# Sub-problems with at most this many cells are solved with a small full matrix instead of being split again.
+# This keeps the memory use constant for the base case while avoiding very deep recursion on tiny blocks.
+BLOCK_CELLS = 1 << 16
+
+
+def last_row(scoring_matrix, indel_penalty, codes_one, codes_two):
+    """Returns the last row of the global alignment score matrix of codes_one (top) and codes_two (left side)
+
+    Only two rows are kept in memory at a time.
+    """
+    for row in vectorized.score_rows(scoring_matrix, indel_penalty, codes_one, codes_two):
+        pass
+    return row
+
+
+def align_block(scoring_matrix, indel_penalty, codes_one, codes_two, x_start, y_start, seq_a_gaps, seq_b_gaps):
+    """Globally aligns a small block with a full traceback matrix and adds its gaps to seq_a_gaps and seq_b_gaps
+
+    x_start and y_start are the position of the block in the whole alignment, so the gaps are added with whole
+    alignment positions. Returns the score of the block.
+    """
+    gap_offsets = np.arange(len(codes_one) + 1, dtype=scoring_matrix.dtype) * indel_penalty
+    traceback_matrix = np.full((len(codes_two) + 1, len(codes_one) + 1), traceback.LEFT, dtype=np.uint8)
+    traceback_matrix[:, 0] = traceback.UP
+    profile = vectorized.query_profile(scoring_matrix, codes_one)
+
+    row = gap_offsets.copy()
+    for y in range(len(codes_two)):
+        row, traceback_matrix[y + 1, 1:] = vectorized.fill_row(row, profile[codes_two[y]],
+                                                               (y + 1) * indel_penalty, indel_penalty, gap_offsets)
+
+    # Same walk as global_alignment_traceback, starting from the bottom right corner of the block
+    x = len(codes_one)
+    y = len(codes_two)
+    while x > 0 or y > 0:
+        direction = traceback_matrix[y, x]
+        if direction == traceback.UP:
+            seq_a_gaps.append(x_start + x)
+            y -= 1
+        elif direction == traceback.LEFT:
+            seq_b_gaps.append(y_start + y)
+            x -= 1
+        else:
+            y -= 1
+            x -= 1
+
+    return row[-1]
+
+
+def align(scoring_matrix, indel_penalty, codes_one, codes_two, x_start, y_start, seq_a_gaps, seq_b_gaps):
+    """Hirschberg's divide and conquer step. Returns the score of the alignment of codes_one and codes_two
+
+    seq_two is split in half. The forward scores of the top half and the backward scores of the bottom half
+    give the best column for the optimal path to cross the middle row, and each half is aligned on its own.
+    """
+    if len(codes_two) <= 1 or len(codes_one) * len(codes_two) <= BLOCK_CELLS:
+        return align_block(scoring_matrix, indel_penalty, codes_one, codes_two, x_start, y_start, seq_a_gaps,
+                           seq_b_gaps)
+
+    y_middle = len(codes_two) // 2
+    forward = last_row(scoring_matrix, indel_penalty, codes_one, codes_two[:y_middle])
+    backward = last_row(scoring_matrix, indel_penalty, codes_one[::-1], codes_two[y_middle:][::-1])
+    totals = forward + backward[::-1]
+
+    # When there is a tie, use the right-most column
+    x_middle = len(totals) - 1 - int(np.argmax(totals[::-1]))
+
+    align(scoring_matrix, indel_penalty, codes_one[:x_middle], codes_two[:y_middle], x_start, y_start, seq_a_gaps,
+          seq_b_gaps)
+    align(scoring_matrix, indel_penalty, codes_one[x_middle:], codes_two[y_middle:], x_start + x_middle,
+          y_start + y_middle, seq_a_gaps, seq_b_gaps)
+    return totals[x_middle]
+
+
+def linear_space_alignment(scorer, seq_one, seq_two):
+    """Globally aligns seq_one and seq_two using O(len(seq_one) + len(seq_two)) memory
+
+    Returns (score, seq_a_gaps, seq_b_gaps) where the gap lists have the same format as in global_alignment_traceback.
+    """
+    scoring_matrix, codes_one, codes_two = vectorized.prepare(scorer, seq_one, seq_two)
+
+    seq_a_gaps = []
+    seq_b_gaps = []
+    score = align(scoring_matrix, scorer.indel_penalty, codes_one, codes_two, 0, 0, seq_a_gaps, seq_b_gaps)
+    return score.item(), seq_a_gaps, seq_b_gaps
@@ -0,0 +1,134 @@
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from . import result_cache
+from .models import AlignmentJob
+
+logger = logging.getLogger(__name__)
+
+# Shown to the user instead of the traceback, which is only logged
+FAILED_MESSAGE = "The alignment failed, please check the files and try again"
+STALE_MESSAGE = "The alignment was interrupted by a restart of the server, please upload the files again"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def current_worker():
+    """Returns the "host:pid" stored in AlignmentJob.worker for the jobs submitted by this process"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def worker_alive(worker):
+    """Returns False when worker is a process of this host that has exited
+
+    The processes of other hosts can't be checked, they count as alive. Jobs without a worker are from before
+    it was stored and count as exited.
+    """
+    host, _, pid = worker.rpartition(':')
+    if not pid.isdigit():
+        return False
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fail_stale_jobs(queryset=None):
+    """Marks the queued and running jobs whose worker has exited as failed and returns how many there were
+
+    The pool of a process goes away with it, so its jobs would otherwise stay queued or running forever and the
+    job page would poll them forever. queryset limits the jobs that are checked.
+    """
+    if queryset is None:
+        queryset = AlignmentJob.objects.all()
+    unfinished = queryset.filter(status__in=[AlignmentJob.QUEUED, AlignmentJob.RUNNING])
+    stale = [job.id for job in unfinished.only('id', 'worker') if not worker_alive(job.worker)]
+    # The status is checked again, a job that just finished is left alone
+    return unfinished.filter(id__in=stale).update(status=AlignmentJob.FAILED, error=STALE_MESSAGE,
+                                                  finished_at=timezone.now())
+
+
+def initialize_worker():
+    # Workers started with spawn (the default outside Linux) have to set Django up themselves.
+    # Forked workers inherit the database connections of the web process, which can't be shared, so drop them.
+    django.setup()
+    connections.close_all()
+
+
+def get_executor():
+    """Returns the process pool the jobs run in"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # The jobs of the processes this one replaces were lost with them
+            fail_stale_jobs()
+            _executor = ProcessPoolExecutor(max_workers=getattr(settings, 'GENOME_JOB_WORKERS', None),
+                                            initializer=initialize_worker)
+        return _executor
+
+
+def submit(job, file1_data=None, file2_data=None):
+    """Queues job to run in the process pool
+
+    file1_data and file2_data are the contents of the uploaded files. They are sent to the worker with the job,
+    so the files don't have to be saved. Without them the job reads its file1 and file2.
+
+    GENOME_JOB_WORKERS sets the number of processes, None uses one per core. With 0 the job runs right away in
+    the calling process, which is useful for tests and debugging.
+    """
+    if getattr(settings, 'GENOME_JOB_WORKERS', None) == 0:
+        run_job(job.id, file1_data, file2_data)
+    else:
+        get_executor().submit(run_job, job.id, file1_data, file2_data)
+
+
+def run_job(job_id, file1_data=None, file2_data=None):
+    """Runs the alignment of an AlignmentJob and saves its result. Called in a worker process
+
+    The pairs of the job are aligned one after another unless GENOME_PAIR_WORKERS is set, as every job worker
+    starting a pool of one process per core would start far more processes than there are cores.
+    """
+    # Imported here so the web process doesn't load numpy and the engines until a job runs in it
+    from .local import main_local
+
+    job = AlignmentJob.objects.get(id=job_id)
+    job.status = AlignmentJob.RUNNING
+    job.started_at = timezone.now()
+    job.save(update_fields=['status', 'started_at'])
+
+    try:
+        file1 = job.file1.path if file1_data is None else file1_data
+        file2 = job.file2.path if file2_data is None else file2_data
+        job.result = list(main_local(file1, file2, job.algo, score_only=job.score_only,
+                                     workers=getattr(settings, 'GENOME_PAIR_WORKERS', None) or 1,
+                                     top_hits=job.top_hits, show_graphs=not job.skip_graph))
+        job.status = AlignmentJob.DONE
+        # With a result cache shared between processes, the result is there before the job page asks for it
+        if job.cache_key:
+            result_cache.set_result(job.cache_key, tuple(job.result))
+    except Exception:
+        logger.exception("Alignment job %s failed", job.uuid)
+        job.error = FAILED_MESSAGE
+        job.status = AlignmentJob.FAILED
+    finally:
+        # The uploaded files are only needed while the job runs
+        if job.file1:
+            job.file1.delete(save=False)
+        if job.file2:
+            job.file2.delete(save=False)
+        job.finished_at = timezone.now()
+        job.save()
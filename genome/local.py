@@ -1,257 +1,69 @@
-import base64
 import time
-from random import choice
-import matplotlib
-import matplotlib.pyplot as plt
-import os
 from django.conf import settings
 
-
-class AlignmentScorer:
-    traceback_directions = ['Up', 'Left', 'Diagonal', '-']
-
-    # This is used as a lookup for the scoring matrix
-    scoring_matrix_indexes = {
-        'A': 0,
-        'C': 1,
-        'G': 2,
-        'T': 3,
-    }
-
-    def __init__(self, scoring_matrix, indel_penalty):
-        self.scoring_matrix = scoring_matrix
-        self.indel_penalty = indel_penalty
-        self.maximum_match_value = max(list(map(max, scoring_matrix)))
-
-    """Returns a score from the scoring matrix used to initialize AlignmentScorer
-
-    This uses scoring_matrix_indexes as a lookup of what matrix value to use.
-    """
-
-    def score(self, nuc_one, nuc_two):
-        return self.scoring_matrix[AlignmentScorer.scoring_matrix_indexes[nuc_two]][
-            AlignmentScorer.scoring_matrix_indexes[nuc_one]]
-
-    def create_initalized_matrices(self, sequence_one_len, sequence_two_len, global_alignment=True):
-
-        # Create the matrices with 0 and - for default values
-        matrix = [[0 for x in range(sequence_one_len + 1)] for y in range(sequence_two_len + 1)]
-        traceback_matrix = [['-' for x in range(sequence_one_len + 1)] for y in range(sequence_two_len + 1)]
-
-        # If global alignment is used, fill in the first row and column of the matrices.
-        if global_alignment:
-            for x in range(sequence_one_len + 1):
-                matrix[0][x] = x * self.indel_penalty
-            for y in range(sequence_two_len + 1):
-                matrix[y][0] = y * self.indel_penalty
-
-            for x in range(sequence_one_len + 1):
-                traceback_matrix[0][x] = 'Left'
-            for y in range(sequence_two_len + 1):
-                traceback_matrix[y][0] = 'Up'
-        return matrix, traceback_matrix
-
-    def compute_score(self, matrix, seq_one, seq_two, x, y, global_alignment=True):
-
-        # Compute the scores from the cells diagonal, above, and to the left of the cell at x, y
-        match = self.score(seq_one[x], seq_two[y])
-        diag_score = matrix[y][x] + match
-        top_score = matrix[y + 1][x] + self.indel_penalty
-        left_score = matrix[y][x + 1] + self.indel_penalty
-
-        # Put all the scores into a list
-        scores = [left_score, top_score, diag_score]
-        if not global_alignment:
-            scores.append(0)  # For local alignment, each cell must have a min score of 0.
-
-        # Get the max value of the list
-        max_value = max(scores)
-
-        # Get the index of the max argument in the list. Because we initialized the list as [left_score, top_score, diag_score],
-        # If the index is 0, we know the direction is left, if the index is 1, we know the direction should be up, and if the index is 2 the direction should be diagonal
-        direction = AlignmentScorer.traceback_directions[max(range(len(scores)), key=scores.__getitem__)]
-
-        if not global_alignment and max_value == 0:
-            direction = AlignmentScorer.traceback_directions[
-                3]  # For the local alignment, we don't want a traceback direction if the corresponding matrix value is 0
-
-        return (max_value, direction)
-
-    def fill_matrices(self, matrix, traceback_matrix, seq_one, seq_two, global_alignment=True):
-        # seq_one is on the top of the matrix and seq_two as the left side.
-        # We'll loop through the matrices and fill out the values.
-        for y in range(len(seq_two)):
-            for x in range(len(seq_one)):
-                max_value, direction = self.compute_score(matrix, seq_one, seq_two, x, y, global_alignment)
-                matrix[y + 1][x + 1] = max_value
-                traceback_matrix[y + 1][x + 1] = direction
-
-    """Adds ---- to sequences to fill in the gap
-
-    Example, add_dashes('ATG', [1]) gives A-TG
-    Example, add_dashes('ATG', [1,2]) gives A-T-G
-    Example, add_dashes('ATG', [], 2) gives --ATG
-    Example, add_dashes('ATG', [1,2], 2) gives --A-T-G
+from . import align, bitparallel, graphs, packed, parallel
+from .align import AlignmentScorer, truncate_lines
+from .fasta import get_sequences, read_fasta, source_name
+from .reference_cache import get_reference_cache
+from .scoring import INDEL_PENALTY, SCORING_MATRIX
+
+
+def align_pair(task):
+    """Aligns one pair of sequences for main_local. This runs in the worker processes of parallel.map_pairs
+
+    task is (seq_one, seq_two, sequence_id, options) and options holds the settings of main_local. The sequences
+    can be PackedSequence, they are only decoded once the pair passed the divergence prefilter.
+    Returns (result1, result2, result3, result4_score, result5_p_similarity, runtime, length, hits, alignment,
+    warnings) where runtime is in seconds and length is the length of the longer sequence. hits lists the top_hits best local
+    alignments (see AlignmentScorer.top_local_alignments) and is empty unless top_hits is more than 1.
+    The pair is aligned with align.align, engine is the name of an engine or align.AUTO.
+    The aligned sequences only have their first columns_shown columns, alignment is the whole alignment from
+    cigar.Alignment.to_dict (with the sequences), or None when only the score was computed. warnings lists the
+    options that could not be used for this pair, see align.AlignmentResult.
+    A pair that diverges more than max_divergence is not aligned, and all its results are None.
     """
-
-    def add_dashes(self, sequence, gaps, offset=0):
-        final_sequence = '-' * offset
-        for index, char in zip(range(len(sequence)), sequence):
-            final_sequence += '-' * gaps.count(index)
-            final_sequence += char
-
-        final_sequence += '-' * gaps.count(len(sequence))
-
-        return final_sequence
-
-    # This creates the | between the two sequences in the final output.
-    def create_match_string(seq_one, seq_two):
-        result = ''
-        for a, b in zip(seq_one, seq_two):
-            # If the two nucleotides are the same add a |
-            if a == b:
-                result += '|'
-            else:  # Otherwise add a space
-                result += ' '
-        return result
-
-    def local_alignment_traceback(self, matrix, traceback_matrix, seq_one, seq_two):
-
-        # Start by finding the maximum value in the matrix, along with its x and y coordinates
-        max_value = 0
-        max_x = 0
-        max_y = 0
-        for x in range(len(seq_one) + 1):
-            for y in range(len(seq_two) + 1):
-                if matrix[y][x] > max_value:
-                    max_x = x
-                    max_y = y
-                    max_value = matrix[y][x]
-
-        seq_a_gaps = []
-        seq_b_gaps = []
-
-        x = max_x
-        y = max_y
-
-        # We will go back through the matrix using the traceback matrix as a guide until we hit 0 in the matrix.
-        # When the traceback matrix says to go Up or Left, we will note there should be a gap in the appropriate sequence
-        while matrix[y][x] != 0:
-            direction = traceback_matrix[y][x]
-            if direction == 'Up':
-                seq_a_gaps.append(x)  # This means there was a gap in the first sequence
-                y -= 1
-            if direction == 'Left':
-                seq_b_gaps.append(y)  # This means there was a gap in the second sequence
-                x -= 1
-            if direction == "Diagonal":  # This means there was no gap
-                y -= 1
-                x -= 1
-
-        gap = x - y
-
-        seq_two_padding = max(gap, 0)  # If gap is positive, add - padding to second sequence
-        seq_one_padding = -min(gap, 0)  # If gap is negative, add - padding to first sequence
-
-        # We will align the two sequences using - for gaps. This will line up the sequences so the first shared nucleotide in the local alignment is lined up.
-        final_seq_one = self.add_dashes(seq_one, seq_a_gaps, seq_one_padding)
-        final_seq_two = self.add_dashes(seq_two, seq_b_gaps, seq_two_padding)
-
-        # We will find the starting and ending points of the aligned region. The | characters will only be added for the area which is locally aligned.
-        start_pos = max(x, y)
-        end_pos = start_pos + abs(max_x - x)
-
-        # Get the subsections of the sequences which are locally aligned
-        matched_sequence_one = final_seq_one[start_pos:end_pos]
-        matched_sequence_two = final_seq_two[start_pos:end_pos]
-
-        # We'll now generate the | characters for matching nucleotides in the locally aligned region
-        match_line = ' ' * max(x, y) + AlignmentScorer.create_match_string(matched_sequence_one, matched_sequence_two)
-
-        # The maximum possible value is the length of the shorter sequence * the maximum match score
-        max_possible_score = self.maximum_match_value * min(len(seq_one), len(seq_two))
-        percent_similarity = (100 * max_value) / max_possible_score
-
-        return final_seq_one, match_line, final_seq_two, str(max_value), str(percent_similarity)[:7]
-        # return final_seq_one + '\n' + match_line + '\n' + final_seq_two + '\nScore: ' + str(max_value)
-
-    def global_alignment_traceback(self, matrix, traceback_matrix, seq_one, seq_two):
-        seq_a_gaps = []
-        seq_b_gaps = []
-
-        # Set x and y to be in the bottom right corner of the matrix
-        x = len(seq_one)
-        y = len(seq_two)
-
-        while x > 0 or y > 0:
-            direction = traceback_matrix[y][x]
-            if direction == 'Up':
-                seq_a_gaps.append(x)  # If the traceback direction is Up, we know there is a gap in the first sequence
-                y -= 1
-            if direction == 'Left':
-                seq_b_gaps.append(
-                    y)  # If the traceback direction is Left, we know there is a gap in the second sequence
-                x -= 1
-            if direction == "Diagonal":  # If the traceback direction is Diagonal, we know there is no gap
-                y -= 1
-                x -= 1
-
-        # Fill in the gaps with -'s
-        final_seq_one = self.add_dashes(seq_one, seq_a_gaps)
-        final_seq_two = self.add_dashes(seq_two, seq_b_gaps)
-
-        # The score comes from the bottom right value in the score matrix
-        score = matrix[len(seq_two)][len(seq_one)]
-
-        # Return the sequences + the | text where there are matches
-        result = final_seq_one + '\n'
-        result += AlignmentScorer.create_match_string(final_seq_one, final_seq_two) + '\n'
-        result += final_seq_two + '\nScore: ' + str(score)
-
-        # The maximum possible value is the length of the shorter sequence * the maximum match score - the gap in length * the indel score
-        longer_sequence_length = max(len(seq_one), len(seq_two))
-        shorter_sequence_length = min(len(seq_one), len(seq_two))
-        gap = longer_sequence_length - shorter_sequence_length
-
-        max_possible_score = self.maximum_match_value * shorter_sequence_length + (gap * self.indel_penalty)
-        percent_similarity = (100 * score) / max_possible_score
-
-        # SPLITTED:
-        result1 = final_seq_one
-        result2 = AlignmentScorer.create_match_string(final_seq_one, final_seq_two)
-        result3 = final_seq_two
-        result4_score = str(
-            matrix[len(seq_two)][len(seq_one)])
-        result5_p_similarity = str(percent_similarity)[:7]
-        return result1, result2, result3, result4_score, result5_p_similarity
-
-
-def get_sequences(path):
-    """Returns a list(string) of genetic sequences
-
-    The relative file path of the file containing the genetic sequences
+    seq_one, seq_two, sequence_id, options = task
+    (scoring_matrix, indel_penalty, engine, global_alignment, score_only, full_matrix_cell_budget, reference_key,
+     gap_open, gap_extend, max_divergence, top_hits, anchored, columns_shown) = options
+
+    start = time.time()
+
+    # The edit distance is much cheaper than the alignment, so pairs that are too different are skipped before it
+    if max_divergence is not None and bitparallel.edit_distance(
+            seq_one, seq_two, bitparallel.max_edit_distance(max_divergence, seq_one, seq_two)) is None:
+        return None, None, None, None, None, time.time() - start, max(len(seq_one), len(seq_two)), [], None, []
+    seq_one, seq_two = str(seq_one), str(seq_two)
+
+    # align.select_engine picks the engine from the lengths of the sequences, the cell budget and the options:
+    # affine gap penalties, the anchored global alignment and several local hits each have their own engine.
+    # Otherwise global alignments use the banded engine (or the linear space engine when the band doesn't fit
+    # in the budget) and local alignments fill the full matrices, or only compute the cells around k-mer seeds
+    # shared with file 1 above the budget.
+    # Only the columns that are shown are rendered, the whole alignment is kept as CIGAR operations.
+    result = align.align(scoring_matrix, indel_penalty, seq_one, seq_two, global_alignment, engine,
+                         full_matrix_cell_budget, columns_shown, score_only, gap_open=gap_open, gap_extend=gap_extend,
+                         top_hits=top_hits, anchored=anchored, reference_key=reference_key, sequence_id=sequence_id)
+    if result.stats is not None:
+        stats = result.stats
+        print(f'Anchored alignment: {stats["anchors"]} anchors covering {stats["anchored_nucleotides"]} nucleotides, '
+              f'{stats["cells"]} of {stats["full_matrix_cells"]} matrix cells computed')
+
+    end = time.time()
+
+    alignment = result.alignment.to_dict(sequences=True) if result.alignment is not None else None
+    return (*result.lines(), end - start, max(len(seq_one), len(seq_two)), result.hits, alignment, result.warnings)
+
+
+def main_local(f1_path, f2_path, algo, engine=None, score_only=False, workers=None, chunksize=None, gap_open=None,
+               gap_extend=None, max_divergence=None, top_hits=1, anchored=None, show_graphs=True):
+    """Aligns every pair of sequences of two FASTA files and returns the results shown on the results page
+
+    f1_path and f2_path are the paths of the files, or their contents as bytes so uploads can be aligned
+    without being written to disk.
+    With show_graphs the result holds the points of the runtime graph (see graphs.runtime_series), otherwise None.
+    The last item of the result lists the warnings the results page shows, like options that didn't fit in the cell
+    budget for some pair.
     """
-    sequences = []
-    current_sequence = ''
-    with open(path) as file:
-        for line in file:
-            if line.startswith('>'):
-                if (current_sequence != ''):
-                    sequences.append(current_sequence.replace('\n', ''))
-                    current_sequence = ''
-            else:
-                current_sequence += line
-        if (current_sequence != ''):
-            sequences.append(current_sequence.replace('\n', ''))
-    return sequences
-
-
-# Trim each line to only be x characters long
-def truncate_lines(text, characters_show):
-    return '\n'.join([line[:characters_show] for line in text.splitlines()])
-
-
-def main_local(f1_path, f2_path, algo):
     # ALGO
     result1 = ""
     result2 = ""
@@ -259,17 +71,32 @@ def main_local(f1_path, f2_path, algo):
     result4_score = ""
     characters_shown = 20
 
-    indel_penalty = -1
-    mismatch = 2
-    match = 4
-    # Scoring matrix to allow different match scores / mismatch penalties for different nucleotide combinations. For example, an A-C mismatch could be penalized less than an A-G mismatch.
-    #                  A        C       G       T
-    scoring_matrix = [[match, mismatch, mismatch, mismatch],  # A
-                      [mismatch, match, mismatch, mismatch],  # C
-                      [mismatch, mismatch, match, mismatch],  # G
-                      [mismatch, mismatch, mismatch, match]]  # T
+    indel_penalty = INDEL_PENALTY
+    scoring_matrix = SCORING_MATRIX
+
+    # See align.ENGINES, align.AUTO picks one for every pair
+    if engine is None:
+        engine = getattr(settings, 'GENOME_ENGINE', align.AUTO)
+
+    # Affine gap penalties (see AlignmentScorer.affine_global_alignment), None uses indel_penalty for every gap
+    if gap_open is None:
+        gap_open = getattr(settings, 'GENOME_GAP_OPEN', None)
+        gap_extend = getattr(settings, 'GENOME_GAP_EXTEND', None)
+
+    # Pairs whose edit distance is more than this fraction of the longer sequence are skipped, None aligns every pair
+    if max_divergence is None:
+        max_divergence = getattr(settings, 'GENOME_MAX_DIVERGENCE', None)
+
+    # Global alignments are anchored on maximal unique matches, see AlignmentScorer.anchored_global_alignment
+    if anchored is None:
+        anchored = getattr(settings, 'GENOME_ANCHORED_GLOBAL', False)
 
-    show_graphs = True
+    # Local alignments report the top_hits best alignments that don't overlap, in the hits list of the result
+    top_hits = max(1, top_hits)
+
+    # Alignments with more cells than this don't create the full matrices. Global alignments use
+    # linear_space_global_alignment and local alignments use seeded_local_alignment instead.
+    full_matrix_cell_budget = getattr(settings, 'GENOME_FULL_MATRIX_CELL_BUDGET', 10_000_000)
 
     # Get the file paths for the sequences
     seq_one_path = f1_path
@@ -277,83 +104,92 @@ def main_local(f1_path, f2_path, algo):
 
     # If global_alignment is True, the Needleman–Wunsch algorithm will be used.
     # If global_alignment is False, the Smith–Waterman algorithm will be used.
-    global_alignment = algo
+    global_alignment = algo == "Global"
 
     # Read the files
-    seq_ones = get_sequences(seq_one_path)
-    seq_twos = get_sequences(seq_two_path)
+    # File 1 is the reference, which is usually the same file every time. The reference cache only parses it
+    # the first time it is seen, and only builds its index when a seeded alignment first needs it.
+    reference = get_reference_cache().get(seq_one_path, get_sequences)
+    # Both files are read one sequence at a time while the pairs are aligned, so only the pairs being aligned are
+    # in memory instead of every sequence of both files. The sequences are sent to the workers packed with 2 bits
+    # per nucleotide when they only have A, C, G and T, see packed.pack.
+    seq_ones = reference.iter_sequences(packed=True)
+    seq_twos = (packed.pack(sequence) for _, sequence in read_fasta(seq_two_path))
 
     # Used for ploting the computation time
     times = [0]
     lengths = [0]
 
-    sequence_ones_count = len(seq_ones)
-    sequence_twos_count = len(seq_twos)
-
-    # Send a message if either file has more sequences than the other.
-    if (sequence_ones_count != sequence_twos_count):
-        print(
-            f'File {seq_one_path} has {sequence_ones_count} sequences while file {seq_two_path} has {sequence_twos_count} sequences.')
-
-    for seq_one, seq_two in zip(seq_ones, seq_twos):
-
-        start = time.time()
-
-        # We create a scorer. This object holds the scoring_matrix and indel_penalty and is used to run the algorthims
-        scorer = AlignmentScorer(scoring_matrix, indel_penalty)
-
-        matrix, traceback_matrix = scorer.create_initalized_matrices(len(seq_one), len(seq_two), global_alignment)
-
-        # This will fill out the empty values in matrix and traceback_matrix
-        scorer.fill_matrices(matrix, traceback_matrix, seq_one, seq_two, global_alignment)
-
-        # This will use the filled out matrix and traceback_matrix to find the gaps and generate the output text. The output text will be stored in result.
+    # The pairs are aligned in worker processes. Each worker gets the key of the reference instead of its index,
+    # and only loads the index from the reference cache when a pair needs it.
+    options = (scoring_matrix, indel_penalty, engine, global_alignment, score_only, full_matrix_cell_budget,
+               reference.key, gap_open, gap_extend, max_divergence, top_hits, anchored, characters_shown)
+    tasks = ((seq_one, seq_two, sequence_id, options)
+             for sequence_id, (seq_one, seq_two) in enumerate(zip(seq_ones, seq_twos)))
+
+    result5_p_similarity = ""
+    hits = []
+    alignment = None
+    warnings = []
+    skipped_pairs = []
+    for sequence_id, pair_result in enumerate(parallel.map_pairs(align_pair, tasks, workers, chunksize)):
         result = ''
-        if global_alignment == "Global":
-            result1, result2, result3, result4_score, result5_p_similarity = scorer.global_alignment_traceback(matrix,
-                                                                                                               traceback_matrix,
-                                                                                                               seq_one,
-                                                                                                               seq_two)
-        elif global_alignment == "":
-            result1, result2, result3, result4_score, result5_p_similarity = scorer.local_alignment_traceback(matrix,
-                                                                                                              traceback_matrix,
-                                                                                                              seq_one,
-                                                                                                              seq_two)
-
-        end = time.time()
+        runtime, length = pair_result[5:7]
+
+        # The results page shows the last pair, so a skipped pair says so instead of showing an earlier pair, the
+        # warnings give the reason
+        if pair_result[3] is None:
+            skipped_pairs.append(sequence_id + 1)
+            result1 = 'Not aligned'
+            result2 = result3 = result4_score = result5_p_similarity = ''
+            hits, alignment = [], None
+        else:
+            result1, result2, result3, result4_score, result5_p_similarity = pair_result[:5]
+            hits, alignment = pair_result[7:9]
+        warnings.extend(f'Sequence pair {sequence_id + 1}: {warning}' for warning in pair_result[9])
 
         # Add the runtime of alignment algorthim (seconds) and the length of the longer sequence.
-        times.append(end - start)
-        lengths.append(max(len(seq_one), len(seq_two)))
+        times.append(runtime)
+        lengths.append(length)
 
         # truncate_lines trims each line of the output to only be characters_shown charters long.
         print(truncate_lines(result, characters_shown))
 
         # Optional: Print the runtime of the algorthim to the console
-        # print('Runtime: ' + str(end - start))
+        # print('Runtime: ' + str(runtime))
 
         # Prints 3 blank lines to the console
         print('\n')
 
-    if show_graphs:
-        matplotlib.use('Agg')
-        lens_sorted, times_sorted = zip(*sorted(zip(lengths, times)))
+    if skipped_pairs:
+        # The results page shows it with the other warnings
+        skipped_message = (f'Skipped {len(skipped_pairs)} sequence pairs that diverge more than '
+                           f'{max_divergence:.0%}: {", ".join(map(str, skipped_pairs))}')
+        print(skipped_message)
+        warnings.append(skipped_message)
 
-        plt.plot(lens_sorted, times_sorted)
-        plt.ylabel('Time (seconds)')
-        plt.xlabel('Sequence length')
-        # plt.show()
-        plt.savefig(os.path.join(settings.MEDIA_ROOT, 'graph_local.png'), bbox_inches='tight')
+    # zip stops at the end of the shorter file, so count what is left of file 2 to get its number of sequences
+    sequence_ones_count = reference.sequence_count
+    sequence_twos_count = len(times) - 1 + sum(1 for _ in seq_twos)
 
-        f_path = os.path.join(settings.MEDIA_ROOT, 'graph_local.png')
-        with open(f_path, "rb") as image_file:
-            image_data = base64.b64encode(image_file.read()).decode('utf-8')
+    # Send a message if either file has more sequences than the other.
+    if (sequence_ones_count != sequence_twos_count):
+        print(
+            f'File {source_name(seq_one_path)} has {sequence_ones_count} sequences while file {source_name(seq_two_path)} has {sequence_twos_count} sequences.')
 
-        plt.close()
+    # Only the points of the graph are kept. The results page draws them, so no image is rendered here.
+    graph = graphs.runtime_series(lengths, times) if show_graphs else None
 
     final_result1 = truncate_lines(result1, characters_shown)
     final_result2 = truncate_lines(result2, characters_shown)
     final_result3 = truncate_lines(result3, characters_shown)
     final_result4_score = truncate_lines(result4_score, characters_shown)
 
-    return final_result1, final_result2, final_result3, final_result4_score, result5_p_similarity, image_data
+    # The aligned text of the hits is trimmed like the other results
+    final_hits = [dict(hit, **{key: truncate_lines(hit[key], characters_shown)
+                               for key in ('aligned_one', 'match', 'aligned_two')}) for hit in hits]
+
+    # alignment holds the whole alignment in CIGAR form, the aligned sequences above are only its first columns.
+    # The results page shows any other columns with the AlignmentWindow view.
+    return (final_result1, final_result2, final_result3, final_result4_score, result5_p_similarity, graph,
+            final_hits, alignment, warnings)
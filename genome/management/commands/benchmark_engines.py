@@ -0,0 +1,75 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from genome import align, benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks every alignment engine and the upload path on synthetic SARS-CoV-2-like sequences and '
+            'writes the results as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', action='append', dest='engines',
+                            help=f'Engine to benchmark, can be repeated. Defaults to {align.AUTO!r} and every '
+                                 f'registered engine')
+        parser.add_argument('--length', action='append', type=int, dest='lengths',
+                            help=f'Length of the reference, can be repeated. Defaults to {benchmarks.DEFAULT_LENGTHS}')
+        parser.add_argument('--mode', action='append', choices=list(benchmarks.MODES), dest='modes',
+                            help='Alignment mode, can be repeated. Defaults to both')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs of each case, the fastest one is reported')
+        parser.add_argument('--substitution-rate', type=float, default=0.01,
+                            help='Probability that a nucleotide of the sample is substituted')
+        parser.add_argument('--indel-rate', type=float, default=0.002,
+                            help='Probability that an insertion or deletion starts at a nucleotide of the sample')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--cell-budget', type=int, default=align.DEFAULT_CELL_BUDGET,
+                            help='Engines that keep more matrix cells than this in memory are skipped')
+        parser.add_argument('--max-seconds', type=float, default=10,
+                            help='Engines estimated to take longer than this on a pair are skipped')
+        parser.add_argument('--no-upload', action='store_true', help='Skip measuring UploadTxt.post')
+        parser.add_argument('--output', help='File to write the JSON report to')
+        parser.add_argument('--compare', help='JSON report of an earlier run to compare this one with')
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Slowdown compared to --compare that counts as a regression, 0.1 is 10%%')
+
+    def handle(self, *args, **options):
+        for engine in options['engines'] or []:
+            if engine != align.AUTO and engine not in align.ENGINES:
+                raise CommandError(f'Unknown engine {engine!r}, expected {align.AUTO!r} or one of '
+                                   f'{list(align.ENGINES)}')
+        modes = {mode: benchmarks.MODES[mode] for mode in options['modes'] or benchmarks.MODES}
+
+        self.stdout.write(f'{"engine":16} {"mode":6} {"length":>6} {"seconds":>9} {"Mcells/s":>9} '
+                          f'{"peak MB":>8} {"upload s":>9}')
+        report = benchmarks.run_benchmarks(options['engines'], options['lengths'] or benchmarks.DEFAULT_LENGTHS,
+                                           modes, options['repeat'], options['substitution_rate'],
+                                           options['indel_rate'], options['seed'], options['cell_budget'],
+                                           options['max_seconds'], not options['no_upload'], self.write_row)
+
+        if options['output']:
+            benchmarks.write_report(report, options['output'])
+            self.stdout.write(f'Wrote {options["output"]}')
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+            self.stdout.write(f'Compared with {baseline.get("commit") or options["compare"]} '
+                              f'(speed and upload are new / old, below 1 is slower)')
+            regressions = 0
+            for row, speed, upload, regressed in benchmarks.compare(report, baseline, options['tolerance']):
+                upload_text = f'{upload:9.2f}' if upload is not None else f'{"":9}'
+                flag = '  REGRESSION' if regressed else ''
+                self.stdout.write(f'{row["engine"]:16} {row["mode"]:6} {row["length"]:6} {speed:9.2f} '
+                                  f'{upload_text}{flag}')
+                regressions += regressed
+            if regressions:
+                raise CommandError(f'{regressions} cases are more than {options["tolerance"]:.0%} slower')
+
+    def write_row(self, row):
+        if row.get('skipped'):
+            self.stdout.write(f'{row["engine"]:16} {row["mode"]:6} {row["length"]:6} skipped, {row["skipped"]}')
+            return
+        upload = f'{row["upload_seconds"]:9.3f}' if 'upload_seconds' in row else f'{"":9}'
+        self.stdout.write(f'{row["engine"]:16} {row["mode"]:6} {row["length"]:6} {row["seconds"]:9.4f} '
+                          f'{row["cells_per_second"] / 1e6:9.1f} {row["peak_memory_bytes"] / 1e6:8.1f} {upload}')
@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from genome import vectorized
+from genome.benchmarks import best_time, random_genome
+from genome.align import AlignmentScorer
+from genome.scoring import INDEL_PENALTY, SCORING_MATRIX
+
+
+class Command(BaseCommand):
+    help = 'Compares per-cell scoring through AlignmentScorer.score with scoring from a precomputed query profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--length', type=int, default=300, help='Length of both sequences')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs of each case, the fastest one is reported')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        seq_one = random_genome(options['length'], rng)
+        seq_two = random_genome(options['length'], rng)
+        cells = len(seq_one) * len(seq_two)
+        repeat = options['repeat']
+        scorer = AlignmentScorer(SCORING_MATRIX, INDEL_PENALTY, 'python')
+
+        def python_lookup():
+            # The fill loop before query profiles: score looks both nucleotides up for every cell
+            matrix, traceback_matrix = scorer.create_initalized_matrices(len(seq_one), len(seq_two))
+            for y in range(len(seq_two)):
+                for x in range(len(seq_one)):
+                    matrix[y + 1][x + 1], traceback_matrix[y + 1, x + 1] = scorer.compute_score(matrix, seq_one,
+                                                                                               seq_two, x, y)
+
+        def python_profile():
+            matrix, traceback_matrix = scorer.create_initalized_matrices(len(seq_one), len(seq_two))
+            scorer.fill_matrices(matrix, traceback_matrix, seq_one, seq_two)
+
+        scoring_matrix, codes_one, codes_two = vectorized.prepare(scorer, seq_one, seq_two)
+        gap_offsets = np.arange(len(seq_one) + 1, dtype=scoring_matrix.dtype) * INDEL_PENALTY
+
+        def numpy_gather():
+            row = gap_offsets.copy()
+            for y in range(len(seq_two)):
+                row = vectorized.score_row(row, scoring_matrix[codes_two[y], codes_one], (y + 1) * INDEL_PENALTY,
+                                           INDEL_PENALTY, gap_offsets)
+
+        def numpy_profile():
+            for _ in vectorized.score_rows(scoring_matrix, INDEL_PENALTY, codes_one, codes_two):
+                pass
+
+        cases = [
+            ('python, score lookup per cell', python_lookup),
+            ('python, query profile', python_profile),
+            ('numpy, gather per row', numpy_gather),
+            ('numpy, query profile row', numpy_profile),
+        ]
+        self.stdout.write(f'{len(seq_one)} x {len(seq_two)} cells, fastest of {repeat} runs')
+        for name, function in cases:
+            seconds = best_time(function, repeat)
+            self.stdout.write(f'{name:32} {seconds * 1e9 / cells:10.1f} ns/cell')
@@ -0,0 +1,32 @@
+# Generated by Django 4.1.3 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('genome', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlignmentJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('algo', models.CharField(blank=True, max_length=16)),
+                ('score_only', models.BooleanField(default=False)),
+                ('file1', models.FileField(blank=True, null=True, upload_to='job_files1/%Y/%m')),
+                ('file2', models.FileField(blank=True, null=True, upload_to='job_files2/%Y/%m')),
+                ('file1_name', models.CharField(blank=True, max_length=255)),
+                ('file2_name', models.CharField(blank=True, max_length=255)),
+                ('cache_key', models.CharField(blank=True, max_length=255)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-18 09:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('genome', '0002_alignmentjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alignmentjob',
+            name='top_hits',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-18 09:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('genome', '0003_alignmentjob_top_hits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alignmentjob',
+            name='skip_graph',
+            field=models.BooleanField(default=False),
+        ),
+    ]
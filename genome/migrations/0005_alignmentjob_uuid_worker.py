@@ -0,0 +1,39 @@
+# Generated by Django 4.1.3 on 2026-10-18 14:02
+
+from uuid import uuid4
+
+from django.db import migrations, models
+
+
+def set_uuids(apps, schema_editor):
+    AlignmentJob = apps.get_model('genome', 'AlignmentJob')
+    for job in AlignmentJob.objects.all():
+        job.uuid = uuid4()
+        job.save(update_fields=['uuid'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('genome', '0004_alignmentjob_skip_graph'),
+    ]
+
+    # The existing jobs need a uuid of their own before the field can be unique
+    operations = [
+        migrations.AddField(
+            model_name='alignmentjob',
+            name='uuid',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(set_uuids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='alignmentjob',
+            name='uuid',
+            field=models.UUIDField(default=uuid4, editable=False, unique=True),
+        ),
+        migrations.AddField(
+            model_name='alignmentjob',
+            name='worker',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
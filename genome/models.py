@@ -1,3 +1,5 @@
+from uuid import uuid4
+
 from django.db import models
 
 
@@ -14,3 +16,43 @@ class TxtFiles(models.Model):
 
     def __str__(self):
         return str(self.id)
+
+
+class AlignmentJob(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    # The job pages are found by this instead of the id, so the jobs of other users can't be guessed
+    uuid = models.UUIDField(default=uuid4, unique=True, editable=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    algo = models.CharField(max_length=16, blank=True)
+    score_only = models.BooleanField(default=False)
+    # Number of local alignments to report, see AlignmentScorer.top_local_alignments
+    top_hits = models.PositiveSmallIntegerField(default=1)
+    # Leaves the runtime graph out of the result
+    skip_graph = models.BooleanField(default=False)
+    file1 = models.FileField(upload_to="job_files1/%Y/%m", null=True, blank=True)
+    file2 = models.FileField(upload_to="job_files2/%Y/%m", null=True, blank=True)
+    file1_name = models.CharField(max_length=255, blank=True)
+    file2_name = models.CharField(max_length=255, blank=True)
+    cache_key = models.CharField(max_length=255, blank=True)
+    # The tuple returned by main_local, stored as a JSON list
+    result = models.JSONField(null=True, blank=True)
+    # The message shown when the job failed, the traceback is only logged
+    error = models.TextField(blank=True)
+    # "host:pid" of the process whose pool runs the job, see jobs.fail_stale_jobs
+    worker = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return str(self.id)
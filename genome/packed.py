@@ -0,0 +1,136 @@
+import numpy as np
+
+NUCLEOTIDES = 'ACGT'
+
+# Maps every byte to its 2 bit nucleotide code (A=0, C=1, G=2, T=3, same as AlignmentScorer.scoring_matrix_indexes).
+# Anything else, like N, maps to 255.
+NUCLEOTIDE_CODES = np.full(256, 255, dtype=np.uint8)
+for code, nucleotide in enumerate(NUCLEOTIDES):
+    NUCLEOTIDE_CODES[ord(nucleotide)] = code
+    NUCLEOTIDE_CODES[ord(nucleotide.lower())] = code
+
+LETTERS = np.frombuffer(NUCLEOTIDES.encode('ascii'), dtype=np.uint8)
+
+# Bit shifts of the 4 codes packed in a byte, the first code is in the highest 2 bits
+SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+
+# Start of a packed sequence file: the magic bytes, then the number of nucleotides as a little endian uint64
+MAGIC = b'PSEQ\x00\x00\x00\x01'
+HEADER_SIZE = 16
+
+
+def nucleotide_codes(sequence):
+    """Returns the nucleotide codes of a str or PackedSequence as a uint8 array, with 255 for anything but A, C, G and T"""
+    if isinstance(sequence, PackedSequence):
+        return sequence.codes
+    return NUCLEOTIDE_CODES[np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)]
+
+
+def pack(sequence):
+    """Returns a str sequence as a PackedSequence, or the str itself when it can't be packed without changing it
+
+    Only sequences of the upper case nucleotides A, C, G and T are packed, so str(pack(sequence)) == sequence.
+    """
+    if not sequence.isascii() or not sequence.isupper():
+        return sequence
+    codes = nucleotide_codes(sequence)
+    if (codes > 3).any():
+        return sequence
+    return PackedSequence.from_codes(codes)
+
+
+class PackedSequence:
+    """A nucleotide sequence stored with 2 bits per nucleotide
+
+    Holds 4 nucleotides per byte, a quarter of the memory of the str. The engines work on the uint8 codes
+    returned by the codes attribute, which are unpacked once per alignment, so no per-cell character lookups
+    are needed. Otherwise a PackedSequence can be used like the str it was made from:
+
+    sequence = PackedSequence.from_string('ACGT')
+    len(sequence) gives 4, sequence[1] gives 'C', sequence[1:3] gives PackedSequence('CG') and str(sequence) gives 'ACGT'
+
+    save writes the packed bytes to a file that load memory-maps, so a saved genome is only read when it is used.
+    Only A, C, G and T can be packed.
+    """
+
+    def __init__(self, packed, length):
+        self.packed = packed
+        self.length = length
+
+    @classmethod
+    def from_codes(cls, codes):
+        codes = np.asarray(codes, dtype=np.uint8)
+        if (codes > 3).any():
+            raise ValueError('Only the nucleotides A, C, G and T can be packed')
+        padded = np.zeros(-(-len(codes) // 4) * 4, dtype=np.uint8)
+        padded[:len(codes)] = codes
+        packed = np.bitwise_or.reduce(padded.reshape(-1, 4) << SHIFTS, axis=1).astype(np.uint8)
+        return cls(packed, len(codes))
+
+    @classmethod
+    def from_string(cls, sequence):
+        return cls.from_codes(nucleotide_codes(sequence))
+
+    @property
+    def codes(self):
+        """The nucleotide codes as a uint8 array with one code per nucleotide"""
+        return self.unpack(0, self.length)
+
+    def unpack(self, start, stop):
+        """Returns the codes of the nucleotides start to stop (excluded), only unpacking the bytes that hold them"""
+        if start >= stop:
+            return np.empty(0, dtype=np.uint8)
+        first_byte = start // 4
+        codes = ((self.packed[first_byte:-(-stop // 4), np.newaxis] >> SHIFTS) & 3).ravel()
+        return codes[start - first_byte * 4:stop - first_byte * 4]
+
+    # Memory used by the packed nucleotides
+    @property
+    def nbytes(self):
+        return self.packed.nbytes
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step == 1:
+                return PackedSequence.from_codes(self.unpack(start, stop))
+            return PackedSequence.from_codes(self.codes[index])
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('PackedSequence index out of range')
+        return NUCLEOTIDES[(self.packed[index // 4] >> SHIFTS[index % 4]) & 3]
+
+    def __iter__(self):
+        return iter(str(self))
+
+    def __str__(self):
+        return LETTERS[self.codes].tobytes().decode('ascii')
+
+    def __repr__(self):
+        return f'PackedSequence({str(self)!r})'
+
+    def __eq__(self, other):
+        return isinstance(other, PackedSequence) and self.length == other.length and np.array_equal(
+            self.packed, other.packed)
+
+    def save(self, path):
+        """Writes the sequence to path as a header followed by the packed bytes"""
+        with open(path, 'wb') as file:
+            file.write(MAGIC + np.uint64(self.length).astype('<u8').tobytes())
+            file.write(self.packed.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        """Memory-maps a sequence written by save"""
+        with open(path, 'rb') as file:
+            header = file.read(HEADER_SIZE)
+        if len(header) != HEADER_SIZE or header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a packed sequence file')
+        length = int(np.frombuffer(header[len(MAGIC):], dtype='<u8')[0])
+        if length == 0:
+            return cls(np.empty(0, dtype=np.uint8), 0)
+        return cls(np.memmap(path, dtype=np.uint8, mode='r', offset=HEADER_SIZE, shape=(-(-length // 4),)), length)
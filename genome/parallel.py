@@ -0,0 +1,48 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+
+from django.conf import settings
+
+
+def run_chunk(function, tasks):
+    return [function(task) for task in tasks]
+
+
+def map_pairs(function, tasks, workers=None, chunksize=None):
+    """Yields function(task) for every task, running the tasks in a process pool
+
+    Every sequence pair of an upload is aligned on its own, so the pairs can be spread across cores.
+    workers is the number of processes (GENOME_PAIR_WORKERS by default, None uses one per core) and chunksize
+    how many tasks are sent to a process at a time (GENOME_PAIR_CHUNKSIZE by default). The results are in the
+    same order as tasks. With a single worker or a single task everything runs in the calling process.
+    function has to be defined at module level so it can be sent to the worker processes.
+
+    tasks can be a generator. Only a few chunks per worker are read from it ahead of the results, so the tasks
+    that are not being worked on don't have to be in memory.
+    """
+    if workers is None:
+        workers = getattr(settings, 'GENOME_PAIR_WORKERS', None) or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = getattr(settings, 'GENOME_PAIR_CHUNKSIZE', 1)
+
+    tasks = iter(tasks)
+    first_tasks = list(islice(tasks, 2))
+    tasks = chain(first_tasks, tasks)
+    if workers == 1 or len(first_tasks) <= 1:
+        for task in tasks:
+            yield function(task)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        chunks = iter(lambda: list(islice(tasks, chunksize)), [])
+        # Keep two chunks per worker queued so no worker waits while the next tasks are read
+        for chunk in islice(chunks, 2 * workers):
+            pending.append(executor.submit(run_chunk, function, chunk))
+        while pending:
+            results = pending.popleft().result()
+            for chunk in islice(chunks, 1):
+                pending.append(executor.submit(run_chunk, function, chunk))
+            yield from results
@@ -0,0 +1,305 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from functools import partial
+
+import numpy as np
+from django.conf import settings
+
+from . import packed
+from .packed import PackedSequence
+from .seeds import KmerIndex
+
+# Arrays of the KmerIndex of a reference. They are saved with np.save so they can be memory-mapped.
+INDEX_ARRAY_NAMES = ['kmers', 'sequence_ids', 'positions']
+
+
+def file_sha256(path):
+    """Returns the sha256 hex digest of the contents of the file at path"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_sha256(source):
+    """Returns the sha256 hex digest of a FASTA source, a path or the contents of a file as bytes"""
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    return file_sha256(source)
+
+
+def save_atomically(save, directory):
+    """Calls save(path) to write a directory, then moves it to directory
+
+    Other processes never see a half written directory. When directory already exists (another process saved
+    it first) or its parent was removed, what save wrote is dropped.
+    """
+    temporary_directory = f'{directory}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        save(temporary_directory)
+        os.rename(temporary_directory, directory)
+    except OSError:
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+
+
+def directory_size(directory):
+    """Returns the bytes taken by the files under directory"""
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+
+def write_index(index, directory):
+    os.makedirs(directory)
+    for name in INDEX_ARRAY_NAMES:
+        np.save(os.path.join(directory, name + '.npy'), getattr(index, name))
+    with open(os.path.join(directory, 'meta.json'), 'w') as file:
+        json.dump({'k': index.k}, file)
+
+
+def read_index(directory):
+    """Returns the KmerIndex written to directory by write_index, memory-mapped, or None when there is none"""
+    try:
+        with open(os.path.join(directory, 'meta.json')) as file:
+            meta = json.load(file)
+        if 'k' not in meta:
+            return None
+        arrays = [np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in INDEX_ARRAY_NAMES]
+    except FileNotFoundError:
+        return None
+    return KmerIndex(*arrays, meta['k'])
+
+
+class Reference:
+    """The sequences of a reference file along with the indexes precomputed for it
+
+    The sequences are stored back to back in text and sequence i is text[offsets[i]:offsets[i + 1]]. text is a
+    PackedSequence when every sequence only has the nucleotides A, C, G and T, which takes a quarter of the memory
+    and disk space, and a uint8 array of ASCII codes otherwise. For a reference loaded from disk text is
+    memory-mapped, so a sequence is only read from the file when it is used.
+
+    directory is where the reference is saved, if it is. Its index is saved there too once it is built.
+    """
+
+    def __init__(self, key, text, offsets, index=None, directory=None):
+        self.key = key
+        self.text = text
+        self.offsets = offsets
+        self.directory = directory
+        self._index = index
+        self.index_lock = threading.Lock()
+
+    @classmethod
+    def from_sequences(cls, key, sequences):
+        """Creates the Reference of a list of sequences, its index is only built when it is used"""
+        text = packed.pack(''.join(sequences))
+        if isinstance(text, str):
+            text = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+        offsets = np.cumsum([0] + [len(sequence) for sequence in sequences], dtype=np.int64)
+        return cls(key, text, offsets)
+
+    @property
+    def index(self):
+        """The KmerIndex of the sequences
+
+        Only the seeded local alignments use the index, so it is built the first time one of them needs it instead
+        of every time a reference is parsed. It is then saved in directory, where the other processes load it from.
+        """
+        with self.index_lock:
+            if self._index is None and self.directory is not None:
+                # References saved before the index was built lazily have it next to the sequences
+                self._index = (read_index(os.path.join(self.directory, 'index')) or
+                               read_index(self.directory))
+            if self._index is None:
+                self._index = KmerIndex.build(self.iter_sequences(packed=True))
+                if self.directory is not None:
+                    save_atomically(partial(write_index, self._index), os.path.join(self.directory, 'index'))
+            return self._index
+
+    @property
+    def sequence_count(self):
+        return len(self.offsets) - 1
+
+    @property
+    def is_packed(self):
+        return isinstance(self.text, PackedSequence)
+
+    def sequence(self, i):
+        return str(self.packed_sequence(i))
+
+    def packed_sequence(self, i):
+        """Returns sequence i as a PackedSequence, or as a str when the reference isn't packed"""
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        if self.is_packed:
+            return self.text[start:end]
+        return self.text[start:end].tobytes().decode('ascii')
+
+    def iter_sequences(self, packed=False):
+        """Yields the sequences one at a time, only one of them is decoded to a string at once
+
+        With packed the sequences are yielded like packed_sequence returns them, without decoding them.
+        """
+        for i in range(self.sequence_count):
+            yield self.packed_sequence(i) if packed else self.sequence(i)
+
+    # Approximate memory used by the reference, used for the size bound of the in-process cache
+    @property
+    def nbytes(self):
+        index = self._index
+        index_nbytes = 0 if index is None else sum(getattr(index, name).nbytes for name in INDEX_ARRAY_NAMES)
+        return self.text.nbytes + self.offsets.nbytes + index_nbytes
+
+    def save(self, directory):
+        """Writes the reference to directory, see ReferenceCache for the layout"""
+        os.makedirs(directory)
+        np.save(os.path.join(directory, 'offsets.npy'), self.offsets)
+        if self._index is not None:
+            write_index(self._index, os.path.join(directory, 'index'))
+        if self.is_packed:
+            self.text.save(os.path.join(directory, 'sequences.pseq'))
+        else:
+            np.save(os.path.join(directory, 'sequences.npy'), self.text)
+        with open(os.path.join(directory, 'meta.json'), 'w') as file:
+            json.dump({'packed': self.is_packed}, file)
+
+    @classmethod
+    def load(cls, key, directory):
+        """Reads a reference written by save. The arrays are memory-mapped instead of read into memory
+
+        The index is only read when it is used.
+        """
+        offsets = np.load(os.path.join(directory, 'offsets.npy'), mmap_mode='r')
+        with open(os.path.join(directory, 'meta.json')) as file:
+            meta = json.load(file)
+
+        # References saved before they were packed have no 'packed'
+        if meta.get('packed', False):
+            text = PackedSequence.load(os.path.join(directory, 'sequences.pseq'))
+        else:
+            text = np.load(os.path.join(directory, 'sequences.npy'), mmap_mode='r')
+
+        return cls(key, text, offsets, directory=directory)
+
+
+class ReferenceCache:
+    """Registry of reference files keyed by the sha256 of their contents
+
+    Uploading the same reference again, which is the common case, skips parsing the file and building its
+    indexes. Each reference is kept in two places:
+
+    - On disk in directory/<sha256>/ as .npy arrays and a packed sequence file that are memory-mapped when loaded,
+      so they survive restarts and are shared between worker processes through the page cache. The index is in
+      the index/ subdirectory once it was built. When the references on disk take more than max_disk_bytes, the
+      least recently used are removed every time a new one is saved (None keeps every reference).
+    - In an in-process LRU. When the references in it take more than max_bytes, the least recently used are dropped.
+    """
+
+    def __init__(self, directory, max_bytes, max_disk_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, source, read_sequences):
+        """Returns the Reference for source, the path of a file or its contents as bytes
+
+        read_sequences(source) is only called to parse the file when it isn't cached yet.
+        """
+        key = source_sha256(source)
+        reference = self.get_by_key(key)
+        if reference is None:
+            reference = Reference.from_sequences(key, read_sequences(source))
+            self.write(reference, os.path.join(self.directory, key))
+            self.add(reference)
+        return reference
+
+    def get_by_key(self, key):
+        """Returns the Reference with the sha256 key from memory or disk, or None if it was never saved"""
+        directory = os.path.join(self.directory, key)
+        with self.lock:
+            reference = self.entries.get(key)
+            if reference is not None:
+                self.entries.move_to_end(key)
+        if reference is None:
+            if not os.path.isdir(directory):
+                return None
+            try:
+                reference = Reference.load(key, directory)
+            except FileNotFoundError:
+                # Removed by evict_disk in another process
+                return None
+            self.add(reference)
+
+        # The modification time of a reference directory is when it was last used, see evict_disk
+        with contextlib.suppress(OSError):
+            os.utime(directory)
+        return reference
+
+    def write(self, reference, directory):
+        save_atomically(reference.save, directory)
+        reference.directory = directory
+        self.evict_disk(reference.key)
+
+    def evict_disk(self, keep):
+        """Removes the least recently used references from disk until they take at most max_disk_bytes
+
+        The reference with the key keep, which was just saved, is never removed. Processes that memory-mapped a
+        removed reference can go on using it.
+        """
+        if self.max_disk_bytes is None:
+            return
+        saved = []
+        for key in os.listdir(self.directory):
+            directory = os.path.join(self.directory, key)
+            if key.endswith('.tmp') or not os.path.isdir(directory):
+                continue
+            with contextlib.suppress(OSError):
+                saved.append((os.path.getmtime(directory), key, directory_size(directory)))
+
+        total = sum(size for _, _, size in saved)
+        for _, key, size in sorted(saved):
+            if total <= self.max_disk_bytes:
+                break
+            if key == keep:
+                continue
+            # Renamed first so no other process loads a half removed reference
+            directory = os.path.join(self.directory, key)
+            removed_directory = f'{directory}.{os.getpid()}.{threading.get_ident()}.tmp'
+            try:
+                os.rename(directory, removed_directory)
+            except OSError:
+                continue
+            shutil.rmtree(removed_directory, ignore_errors=True)
+            total -= size
+
+    def add(self, reference):
+        with self.lock:
+            if reference.key in self.entries:
+                return
+            self.entries[reference.key] = reference
+            # The indexes built since the references were added count too
+            self.size = sum(entry.nbytes for entry in self.entries.values())
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.nbytes
+
+
+_reference_cache = None
+
+
+def get_reference_cache():
+    """Returns the process wide ReferenceCache configured by GENOME_REFERENCE_CACHE_DIR,
+    GENOME_REFERENCE_CACHE_MAX_BYTES and GENOME_REFERENCE_CACHE_MAX_DISK_BYTES"""
+    global _reference_cache
+    if _reference_cache is None:
+        directory = getattr(settings, 'GENOME_REFERENCE_CACHE_DIR', os.path.join(settings.BASE_DIR, 'reference_cache'))
+        max_bytes = getattr(settings, 'GENOME_REFERENCE_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+        max_disk_bytes = getattr(settings, 'GENOME_REFERENCE_CACHE_MAX_DISK_BYTES', None)
+        _reference_cache = ReferenceCache(directory, max_bytes, max_disk_bytes)
+    return _reference_cache
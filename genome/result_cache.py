@@ -0,0 +1,80 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Bump this when the format of the results returned by main_local changes so old entries are ignored
+RESULT_FORMAT_VERSION = 5
+
+KEY_PREFIX = 'genome-result:'
+HITS_KEY = 'genome-result-cache:hits'
+MISSES_KEY = 'genome-result-cache:misses'
+
+
+def get_cache():
+    """Returns the Django cache named by GENOME_RESULT_CACHE, see CACHES in the settings for its TTL and size"""
+    return caches[getattr(settings, 'GENOME_RESULT_CACHE', 'default')]
+
+
+def data_sha256(data):
+    """Returns the sha256 hex digest of the contents of a file read into memory"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def result_key(file1_sha256, file2_sha256, algo, score_only, scoring_matrix, indel_penalty, gap_open=None,
+               gap_extend=None, max_divergence=None, top_hits=1, anchored=False, show_graphs=True, engine='auto',
+               cell_budget=None):
+    """Returns the cache key of the result of aligning two files with the given algorithm and scoring
+
+    engine and cell_budget are the GENOME_ENGINE and GENOME_FULL_MATRIX_CELL_BUDGET the result is computed with,
+    as they pick the engine, which can change the alignment or drop options.
+    """
+    parts = [RESULT_FORMAT_VERSION, file1_sha256, file2_sha256, algo, score_only, scoring_matrix, indel_penalty,
+             gap_open, gap_extend, engine, cell_budget]
+    # Options left at their default don't change the key
+    if max_divergence is not None:
+        parts += ['max_divergence', max_divergence]
+    if top_hits > 1:
+        parts += ['top_hits', top_hits]
+    if anchored:
+        parts += ['anchored']
+    if not show_graphs:
+        parts += ['no_graphs']
+    return KEY_PREFIX + hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+def count(key):
+    cache = get_cache()
+    # The counters never expire, add only creates them if they don't exist yet
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter was culled between add and incr
+        cache.set(key, 1, timeout=None)
+
+
+def get_result(key):
+    """Returns the cached result for key or None, and counts the hit or miss"""
+    result = get_cache().get(key)
+    count(MISSES_KEY if result is None else HITS_KEY)
+    return result
+
+
+def peek_result(key):
+    """Returns the cached result for key or None, without counting a hit or miss"""
+    return get_cache().get(key)
+
+
+def set_result(key, result):
+    get_cache().set(key, result)
+
+
+def stats():
+    """Returns the number of hits and misses of the result cache"""
+    cache = get_cache()
+    return {
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+    }
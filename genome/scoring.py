@@ -0,0 +1,11 @@
+# Scoring used by main_local. These are also part of the result cache key, so cached results are not reused
+# after they change. They are kept apart from the engines so the views can read them without importing numpy.
+INDEL_PENALTY = -1
+MISMATCH = 2
+MATCH = 4
+# Scoring matrix to allow different match scores / mismatch penalties for different nucleotide combinations. For example, an A-C mismatch could be penalized less than an A-G mismatch.
+#                  A        C       G       T
+SCORING_MATRIX = [[MATCH, MISMATCH, MISMATCH, MISMATCH],  # A
+                  [MISMATCH, MATCH, MISMATCH, MISMATCH],  # C
+                  [MISMATCH, MISMATCH, MATCH, MISMATCH],  # G
+                  [MISMATCH, MISMATCH, MISMATCH, MATCH]]  # T
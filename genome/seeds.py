@@ -0,0 +1,246 @@
+from bisect import bisect_left
+
+import numpy as np
+
+from . import hirschberg, packed, traceback, vectorized
+
+
+def encode_kmers(sequence, k):
+    """Returns (kmers, positions) for every k-mer of sequence (a str or PackedSequence) that only contains A, C, G and T
+
+    Each k-mer is packed into an integer with 2 bits per nucleotide. positions holds where each k-mer starts.
+    """
+    codes = packed.nucleotide_codes(sequence)
+    if len(codes) < k:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+
+    windows = np.lib.stride_tricks.sliding_window_view(codes, k)
+    valid = (windows != 255).all(axis=1)
+    shifts = np.arange(2 * (k - 1), -1, -2, dtype=np.uint64)
+    kmers = (windows[valid].astype(np.uint64) << shifts).sum(axis=1, dtype=np.uint64)
+    return kmers, np.flatnonzero(valid)
+
+
+class KmerIndex:
+    """Hash index of every k-mer in a list of reference sequences
+
+    The index is three arrays sorted by k-mer: the k-mer values, the reference sequence each one comes from
+    and its position in that sequence. Looking up a batch of k-mers is a binary search on the sorted array.
+    K-mers that occur more than max_occurrences times are repeats that give mostly useless seeds, so they are dropped.
+    """
+
+    def __init__(self, kmers, sequence_ids, positions, k):
+        self.kmers = kmers
+        self.sequence_ids = sequence_ids
+        self.positions = positions
+        self.k = k
+
+    @classmethod
+    def build(cls, sequences, k=12, max_occurrences=64):
+        if not 1 <= k <= 32:
+            raise ValueError('k must be between 1 and 32 so a k-mer fits in 64 bits')
+
+        all_kmers = []
+        all_sequence_ids = []
+        all_positions = []
+        for sequence_id, sequence in enumerate(sequences):
+            kmers, positions = encode_kmers(sequence, k)
+            all_kmers.append(kmers)
+            all_sequence_ids.append(np.full(len(kmers), sequence_id, dtype=np.int32))
+            all_positions.append(positions.astype(np.int32))
+
+        kmers = np.concatenate(all_kmers) if all_kmers else np.empty(0, dtype=np.uint64)
+        order = np.argsort(kmers, kind='stable')
+        kmers = kmers[order]
+        sequence_ids = np.concatenate(all_sequence_ids)[order] if all_kmers else np.empty(0, dtype=np.int32)
+        positions = np.concatenate(all_positions)[order] if all_kmers else np.empty(0, dtype=np.int32)
+
+        # Drop the k-mers that occur too often
+        _, counts = np.unique(kmers, return_counts=True)
+        keep = np.repeat(counts <= max_occurrences, counts)
+        return cls(kmers[keep], sequence_ids[keep], positions[keep], k)
+
+    def lookup(self, sequence, sequence_id=None):
+        """Returns (sequence_positions, sequence_ids, reference_positions) for every k-mer of sequence found in the index
+
+        If sequence_id is given, only hits in that reference sequence are returned.
+        """
+        kmers, query_positions = encode_kmers(sequence, self.k)
+        starts = np.searchsorted(self.kmers, kmers, side='left')
+        ends = np.searchsorted(self.kmers, kmers, side='right')
+        counts = ends - starts
+
+        # Expand every [start, end) range of matching index entries
+        hit_query_positions = np.repeat(query_positions, counts)
+        hit_indexes = np.repeat(ends - counts.cumsum(), counts) + np.arange(counts.sum())
+        hit_sequence_ids = self.sequence_ids[hit_indexes]
+        hit_reference_positions = self.positions[hit_indexes]
+
+        if sequence_id is not None:
+            in_sequence = hit_sequence_ids == sequence_id
+            return (hit_query_positions[in_sequence], hit_sequence_ids[in_sequence],
+                    hit_reference_positions[in_sequence])
+        return hit_query_positions, hit_sequence_ids, hit_reference_positions
+
+
+def chain_hits(reference_positions, query_positions):
+    """Returns the indexes of the longest chain of hits where both positions strictly increase
+
+    This is a longest increasing subsequence: hits are sorted by reference position (and by decreasing query
+    position for equal reference positions, so two hits at the same reference position can't both be used),
+    then the longest strictly increasing run of query positions is found in O(h log h).
+    """
+    order = np.lexsort((-query_positions, reference_positions))
+    query_positions = query_positions.tolist()
+    tails = []  # tails[i] is the smallest query position that ends a chain of length i + 1
+    tail_indexes = []
+    previous = [-1] * len(order)
+    for index in order.tolist():
+        query_position = query_positions[index]
+        length = bisect_left(tails, query_position)
+        if length == len(tails):
+            tails.append(query_position)
+            tail_indexes.append(index)
+        else:
+            tails[length] = query_position
+            tail_indexes[length] = index
+        if length > 0:
+            previous[index] = tail_indexes[length - 1]
+
+    chain = []
+    index = tail_indexes[-1] if tail_indexes else -1
+    while index != -1:
+        chain.append(index)
+        index = previous[index]
+    return chain[::-1]
+
+
+def x_drop_extend(scoring_matrix, indel_penalty, codes_one, codes_two, x_drop, window=64):
+    """Extends an alignment that starts at the beginning of codes_one and codes_two (gapped X-drop extension)
+
+    Cells are filled one row at a time from the anchored corner and the best scoring cell is kept. The extension
+    stops at the first row where every cell is more than x_drop below the best score. The rows and columns
+    looked at are limited to window, which is doubled while the best cell is at the edge of the window.
+
+    Returns (score, length_one, length_two, directions) where the extension covers codes_one[:length_one] and
+    codes_two[:length_two] and directions is the traceback code array to walk back from that cell.
+    """
+    while True:
+        columns = min(window, len(codes_one))
+        rows = min(window, len(codes_two))
+        gap_offsets = np.arange(columns + 1, dtype=scoring_matrix.dtype) * indel_penalty
+        directions = np.full((rows + 1, columns + 1), traceback.LEFT, dtype=np.uint8)
+        directions[:, 0] = traceback.UP
+        profile = vectorized.query_profile(scoring_matrix, codes_one[:columns])
+
+        # The corner is the empty extension, which scores 0
+        row = gap_offsets.copy()
+        best_score, best_x, best_y = 0, 0, 0
+        stopped = False
+        for y in range(rows):
+            row, directions[y + 1, 1:] = vectorized.fill_row(row, profile[codes_two[y]],
+                                                             (y + 1) * indel_penalty, indel_penalty, gap_offsets)
+            row_best = int(np.argmax(row))
+            if row[row_best] > best_score:
+                best_score, best_x, best_y = row[row_best].item(), row_best, y + 1
+            if row[row_best] < best_score - x_drop:
+                stopped = True
+                break
+
+        at_edge = (best_x == columns and columns < len(codes_one)) or (best_y == rows and rows < len(codes_two))
+        if stopped or not at_edge:
+            return best_score, best_x, best_y, directions
+        window *= 2
+
+
+def extension_gaps(directions, x, y, to_position_one, to_position_two, seq_a_gaps, seq_b_gaps):
+    """Walks directions back from (x, y) to the anchored corner and adds the gaps to seq_a_gaps and seq_b_gaps
+
+    to_position_one and to_position_two turn a column or row of the extension into a position of seq_one or seq_two.
+    """
+    while x > 0 or y > 0:
+        direction = directions[y, x]
+        if direction == traceback.UP:
+            seq_a_gaps.append(to_position_one(x))
+            y -= 1
+        elif direction == traceback.LEFT:
+            seq_b_gaps.append(to_position_two(y))
+            x -= 1
+        else:
+            y -= 1
+            x -= 1
+
+
+def seed_and_extend(scorer, seq_one, seq_two, index, sequence_id=0, max_gap=1000, x_drop=20):
+    """Finds a local alignment of seq_one (a sequence of index) and seq_two from k-mer seeds
+
+    The seeds are chained, consecutive seeds in the chain are joined with small global alignments and the
+    ends of the chain are extended with a gapped X-drop extension. Only the cells between and around seeds are computed.
+    Chains are split where two seeds are more than max_gap apart and the split with the most seeds is used.
+
+    Returns (score, max_x, max_y, x, y, seq_a_gaps, seq_b_gaps) in the format local_alignment_result takes,
+    or None when there are no seeds.
+    """
+    query_positions, _, reference_positions = index.lookup(seq_two, sequence_id)
+    chain = chain_hits(reference_positions, query_positions)
+    if not chain:
+        return None
+
+    # Split the chain where seeds are far apart and keep the part with the most seeds
+    xs = reference_positions[chain].astype(np.int64)
+    ys = query_positions[chain].astype(np.int64)
+    breaks = np.flatnonzero(np.maximum(np.diff(xs), np.diff(ys)) > max_gap) + 1
+    parts = np.split(np.arange(len(chain)), breaks)
+    best_part = max(parts, key=len)
+    xs = xs[best_part]
+    ys = ys[best_part]
+
+    scoring_matrix, codes_one, codes_two = vectorized.prepare(scorer, seq_one, seq_two)
+    k = index.k
+    seq_a_gaps = []
+    seq_b_gaps = []
+
+    # Walk through the seeds. (x, y) is where the aligned part ends so far.
+    x = xs[0]
+    y = ys[0]
+    start_x = x
+    start_y = y
+    score = 0
+    for seed_x, seed_y in zip(xs.tolist(), ys.tolist()):
+        # Skip the part of the seed that overlaps what is already aligned
+        overlap = max(x - seed_x, y - seed_y, 0)
+        if overlap >= k:
+            continue
+        seed_x += overlap
+        seed_y += overlap
+
+        # Join the previous seed to this one with a global alignment of the sequences between them
+        if seed_x > x or seed_y > y:
+            score += hirschberg.align(scoring_matrix, scorer.indel_penalty, codes_one[x:seed_x], codes_two[y:seed_y],
+                                      x, y, seq_a_gaps, seq_b_gaps).item()
+
+        end_x = seed_x + k - overlap
+        end_y = seed_y + k - overlap
+        score += scoring_matrix[codes_two[seed_y:end_y], codes_one[seed_x:end_x]].sum().item()
+        x = end_x
+        y = end_y
+
+    # Gapped X-drop extensions to the left of the first seed and to the right of the last one.
+    # The left extension runs on the reversed sequences before the first seed.
+    extension_score, length_one, length_two, directions = x_drop_extend(
+        scoring_matrix, scorer.indel_penalty, codes_one[:start_x][::-1], codes_two[:start_y][::-1], x_drop)
+    extension_gaps(directions, length_one, length_two, lambda column: start_x - column, lambda row: start_y - row,
+                   seq_a_gaps, seq_b_gaps)
+    start_x -= length_one
+    start_y -= length_two
+    score += extension_score
+
+    extension_score, length_one, length_two, directions = x_drop_extend(
+        scoring_matrix, scorer.indel_penalty, codes_one[x:], codes_two[y:], x_drop)
+    extension_gaps(directions, length_one, length_two, lambda column: x + column, lambda row: y + row,
+                   seq_a_gaps, seq_b_gaps)
+    x += length_one
+    y += length_two
+    score += extension_score
+
+    return score, int(x), int(y), int(start_x), int(start_y), seq_a_gaps, seq_b_gaps
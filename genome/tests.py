@@ -1,3 +1,932 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.template.loader import render_to_string
+from django.urls import Resolver404, resolve, reverse
+
+from . import (affine, align, banded, benchmarks, bitparallel, cigar, fasta, graphs, hirschberg, jobs, packed,
+               parallel, reference_cache, result_cache, vectorized, views, wavefront)
+from .align import AlignmentScorer
+from .align.engines import OPTION_WARNINGS
+from .models import AlignmentJob
+from .packed import PackedSequence
+from .reference_cache import ReferenceCache
+from .seeds import KmerIndex
+from .traceback import DIRECTIONS, TracebackMatrix
+from .scoring import INDEL_PENALTY, SCORING_MATRIX
+
+# Seconds importing the genome app (its URLs, views, models and jobs) may take once Django is set up
+IMPORT_TIME_BUDGET = 0.25
+
+# Modules the web process must not load until an alignment runs
+LAZY_MODULES = ['numpy', 'matplotlib', 'genome.local', 'genome.global_algo']
+
+
+# Match 1, mismatch -1 and indel -1 give many alignments with the same score, to test how ties are broken
+TIE_SCORING_MATRIX = [[1 if row == column else -1 for column in range(4)] for row in range(4)]
+
+
+def random_sequence(length, rng):
+    return ''.join(rng.choice('ACGT') for _ in range(length))
+
+
+def sequence_pairs():
+    """Yields (scoring matrix, indel penalty, seq_one, seq_two) for the engine tests"""
+    rng = random.Random(0)
+    for scoring_matrix, indel_penalty in [(SCORING_MATRIX, INDEL_PENALTY), (TIE_SCORING_MATRIX, -1)]:
+        yield scoring_matrix, indel_penalty, 'AAAA', 'AAA'
+        yield scoring_matrix, indel_penalty, 'ACGTACGT', 'TTGCA'
+        yield scoring_matrix, indel_penalty, 'ACAC', 'CACA'
+        for len_one, len_two in [(2, 5), (40, 37), (90, 120)]:
+            yield scoring_matrix, indel_penalty, random_sequence(len_one, rng), random_sequence(len_two, rng)
+
+
+def rescore(scoring_matrix, indel_penalty, line_one, line_two):
+    """Returns the score of the alignment of two aligned lines, with - for the gaps"""
+    indexes = AlignmentScorer.scoring_matrix_indexes
+    return sum(indel_penalty if '-' in (one, two) else scoring_matrix[indexes[two]][indexes[one]]
+               for one, two in zip(line_one, line_two))
+
+
+def levenshtein(seq_one, seq_two):
+    previous_row = list(range(len(seq_two) + 1))
+    for x, nucleotide_one in enumerate(seq_one, 1):
+        row = [x]
+        for y, nucleotide_two in enumerate(seq_two, 1):
+            substitution = previous_row[y - 1] + (nucleotide_one != nucleotide_two)
+            row.append(min(previous_row[y] + 1, row[y - 1] + 1, substitution))
+        previous_row = row
+    return previous_row[-1]
+
+
+def full_matrix_global_alignment(scorer, seq_one, seq_two):
+    matrix, traceback_matrix = scorer.create_initalized_matrices(len(seq_one), len(seq_two), True)
+    scorer.fill_matrices(matrix, traceback_matrix, seq_one, seq_two, True)
+    return scorer.global_alignment_traceback(matrix, traceback_matrix, seq_one, seq_two)
+
+
+def slow_square(task):
+    """The earlier tasks take longer, so the results of map_pairs come back out of order unless it orders them"""
+    time.sleep((20 - task) * 0.005)
+    return task * task
+
+
+class IsolatedReferenceCacheMixin:
+    """Keeps the process wide reference cache in a temporary directory during every test, like
+    benchmarks.run_benchmarks does, so tests neither write to nor read from GENOME_REFERENCE_CACHE_DIR"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache_settings = override_settings(GENOME_REFERENCE_CACHE_DIR=directory.name)
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+        reference_cache._reference_cache = None
+        self.addCleanup(setattr, reference_cache, '_reference_cache', None)
+
+
+def import_times(module):
+    """Imports module in a new interpreter with python -X importtime after django.setup()
+
+    Returns {module name: cumulative import time in seconds} for every module it imported.
+    """
+    code = f'import django; django.setup(); import {module}'
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'main.settings'))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=settings.BASE_DIR, env=env,
+                             capture_output=True, text=True, check=True)
+
+    times = {}
+    # Lines look like "import time:       466 |       1090 |     genome.scoring", in microseconds
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative) / 1_000_000
+    return times
+
+
+class ImportTimeTest(SimpleTestCase):
+    def test_urls_import_within_budget(self):
+        times = import_times('genome.urls')
+        self.assertLess(times['genome.urls'], IMPORT_TIME_BUDGET)
+
+    def test_heavy_modules_are_lazy(self):
+        times = import_times('genome.urls')
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, times)
+
+
+class GraphTest(SimpleTestCase):
+    def test_runtime_svg(self):
+        svg = graphs.runtime_svg(graphs.runtime_series([200, 100], [1.0, 0.5]))
+        self.assertTrue(svg.startswith('<svg'))
+        self.assertTrue(svg.endswith('</svg>'))
+        # Both points on a 300 x 300 graph with a margin of 40, the longest sequence and runtime on the edges
+        self.assertIn('<polyline points="150.0,150.0 260.0,40.0"', svg)
+        self.assertIn('>200</text>', svg)
+
+    def test_no_graph_without_matplotlib(self):
+        # A new interpreter, so modules other tests imported don't count
+        code = '''
+import sys, tempfile
+import django
+django.setup()
+from django.test import override_settings
+from genome.local import main_local
+with tempfile.TemporaryDirectory() as directory, override_settings(GENOME_REFERENCE_CACHE_DIR=directory):
+    result = main_local(b'>1\\nACGTACGTAC\\n', b'>1\\nACGTTCGTAC\\n', 'Global', workers=1, show_graphs=False)
+print(result[5], 'matplotlib' in sys.modules)
+'''
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'main.settings'))
+        process = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, capture_output=True,
+                                 text=True, check=True)
+        self.assertEqual(process.stdout.splitlines()[-1], 'None False')
+
+
+class BenchmarkTest(TestCase):
+    def test_mutate(self):
+        rng = random.Random(0)
+        reference = benchmarks.random_genome(1000, rng)
+        self.assertEqual(len(reference), 1000)
+        self.assertLessEqual(set(reference), set('ACGT'))
+        self.assertEqual(benchmarks.mutate(reference, rng, 0, 0), reference)
+
+        sample = benchmarks.mutate(reference, rng, 0.5, 0)
+        self.assertEqual(len(sample), len(reference))
+        self.assertNotEqual(sample, reference)
+
+    def test_command_writes_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.json')
+            call_command('benchmark_engines', engines=['auto', 'numpy', 'python'], lengths=[100], repeat=1,
+                         max_seconds=0.01, output=path, stdout=StringIO())
+            with open(path) as file:
+                report = json.load(file)
+            # The report compares with itself without regressions
+            call_command('benchmark_engines', engines=['numpy'], lengths=[100], repeat=1, no_upload=True,
+                         compare=path, tolerance=10, stdout=StringIO())
+
+        rows = {(row['engine'], row['mode']): row for row in report['results']}
+        self.assertEqual(set(rows), {(engine, mode) for engine in ['auto', 'numpy', 'python']
+                                     for mode in benchmarks.MODES})
+        self.assertIn('estimated', rows['python', 'global']['skipped'])
+        numpy_row = rows['numpy', 'local']
+        self.assertEqual(numpy_row['selected_engine'], 'numpy')
+        self.assertGreater(numpy_row['cells_per_second'], 0)
+        self.assertGreater(numpy_row['peak_memory_bytes'], 0)
+        self.assertGreater(numpy_row['upload_seconds'], 0)
+        self.assertEqual(rows['auto', 'global']['score'], rows['numpy', 'global']['score'])
+
+
+class QueryProfileTest(SimpleTestCase):
+    def test_same_matrices_as_score_lookup(self):
+        for scoring_matrix, indel_penalty, seq_one, seq_two in sequence_pairs():
+            for global_alignment in [True, False]:
+                # The fill loop before query profiles, with a score lookup of both nucleotides for every cell
+                scorer = AlignmentScorer(scoring_matrix, indel_penalty, 'python')
+                matrix, traceback_matrix = scorer.create_initalized_matrices(len(seq_one), len(seq_two),
+                                                                             global_alignment)
+                for y in range(len(seq_two)):
+                    for x in range(len(seq_one)):
+                        matrix[y + 1][x + 1], traceback_matrix[y + 1, x + 1] = scorer.compute_score(
+                            matrix, seq_one, seq_two, x, y, global_alignment)
+
+                for engine in ['python', 'numpy']:
+                    with self.subTest(seq_one=seq_one, seq_two=seq_two, global_alignment=global_alignment,
+                                      engine=engine):
+                        scorer = AlignmentScorer(scoring_matrix, indel_penalty, engine)
+                        profile_matrix, profile_traceback = scorer.create_initalized_matrices(
+                            len(seq_one), len(seq_two), global_alignment)
+                        scorer.fill_matrices(profile_matrix, profile_traceback, seq_one, seq_two, global_alignment)
+                        np.testing.assert_array_equal(np.array(profile_matrix), np.array(matrix))
+                        self.assertEqual(profile_traceback, traceback_matrix)
+
+                # The rows the score-only path computes from the query profile
+                with self.subTest(seq_one=seq_one, seq_two=seq_two, global_alignment=global_alignment):
+                    profile_scoring_matrix, codes_one, codes_two = vectorized.prepare(scorer, seq_one, seq_two)
+                    rows = vectorized.score_rows(profile_scoring_matrix, indel_penalty, codes_one, codes_two,
+                                                 global_alignment)
+                    np.testing.assert_array_equal(np.array(list(rows)), np.array(matrix))
+
+
+class TracebackMatrixTest(SimpleTestCase):
+    def test_one_byte_per_cell(self):
+        self.assertEqual(TracebackMatrix(30, 40).nbytes, 30 * 40)
+
+    def test_directions_round_trip(self):
+        traceback_matrix = TracebackMatrix(3, 4)
+        self.assertEqual(traceback_matrix[2, 3], '-')
+        for x, direction in enumerate(DIRECTIONS):
+            traceback_matrix[1, x] = direction
+        self.assertEqual([traceback_matrix[1, x] for x in range(4)], DIRECTIONS)
+        self.assertEqual(traceback_matrix[0, 0], '-')
+
+
+class NumpyEngineTest(SimpleTestCase):
+    def test_same_matrices_and_lines_as_python(self):
+        for scoring_matrix, indel_penalty, seq_one, seq_two in sequence_pairs():
+            for global_alignment in [True, False]:
+                with self.subTest(seq_one=seq_one, seq_two=seq_two, global_alignment=global_alignment):
+                    results = []
+                    for engine in ['python', 'numpy']:
+                        scorer = AlignmentScorer(scoring_matrix, indel_penalty, engine)
+                        matrix, traceback_matrix = scorer.create_initalized_matrices(len(seq_one), len(seq_two),
+                                                                                     global_alignment)
+                        scorer.fill_matrices(matrix, traceback_matrix, seq_one, seq_two, global_alignment)
+                        if global_alignment:
+                            lines = scorer.global_alignment_traceback(matrix, traceback_matrix, seq_one, seq_two)
+                        else:
+                            lines = scorer.local_alignment_traceback(matrix, traceback_matrix, seq_one, seq_two)
+                        results.append((np.array(matrix), traceback_matrix, lines))
+
+                    (python_matrix, python_traceback, python_lines), (numpy_matrix, numpy_traceback, numpy_lines) = \
+                        results
+                    np.testing.assert_array_equal(python_matrix, numpy_matrix)
+                    self.assertEqual(python_traceback, numpy_traceback)
+                    self.assertEqual(python_lines, numpy_lines)
+
+
+class TiledEngineTest(SimpleTestCase):
+    def test_same_lines_as_numpy(self):
+        for scoring_matrix, indel_penalty, seq_one, seq_two in sequence_pairs():
+            for global_alignment in [True, False]:
+                with self.subTest(seq_one=seq_one, seq_two=seq_two, global_alignment=global_alignment):
+                    scorer = AlignmentScorer(scoring_matrix, indel_penalty, 'numpy')
+                    matrix, traceback_matrix = scorer.create_initalized_matrices(len(seq_one), len(seq_two),
+                                                                                 global_alignment)
+                    scorer.fill_matrices(matrix, traceback_matrix, seq_one, seq_two, global_alignment)
+                    if global_alignment:
+                        lines = scorer.global_alignment_traceback(matrix, traceback_matrix, seq_one, seq_two)
+                    else:
+                        lines = scorer.local_alignment_traceback(matrix, traceback_matrix, seq_one, seq_two)
+
+                    alignment = wavefront.tiled_alignment(scorer, seq_one, seq_two, global_alignment, workers=2,
+                                                          tile_size=16)
+                    if global_alignment:
+                        tiled_lines = scorer.global_alignment_result(*alignment, seq_one, seq_two)
+                    else:
+                        tiled_lines = scorer.local_alignment_result(*alignment, seq_one, seq_two)
+                    self.assertEqual(lines, tiled_lines)
+
+    def test_runs_above_cell_budget_when_asked_for(self):
+        result = align.align(SCORING_MATRIX, INDEL_PENALTY, 'ACGTACGTAC' * 5, 'ACGTTCGTAC' * 5, engine='tiled',
+                             cell_budget=100)
+        self.assertEqual(result.engine, 'tiled')
+
+
+class AffineTest(SimpleTestCase):
+    def test_banded_same_as_full_matrices(self):
+        rng = random.Random(1)
+        for scoring_matrix, indel_penalty, seq_one, _ in sequence_pairs():
+            seq_two = benchmarks.mutate(seq_one, rng, 0.05, 0.05)
+            for gap_open, gap_extend in [(-3, -1), (-2, -2), (-5, -2)]:
+                with self.subTest(seq_one=seq_one, seq_two=seq_two, gap_open=gap_open, gap_extend=gap_extend):
+                    scorer = AlignmentScorer(scoring_matrix, indel_penalty, 'numpy')
+                    self.assertEqual(affine.banded_global_alignment(scorer, seq_one, seq_two, gap_open, gap_extend,
+                                                                    band=1),
+                                     affine.global_alignment(scorer, seq_one, seq_two, gap_open, gap_extend))
+
+    def test_falls_back_with_warning_above_cell_budget(self):
+        rng = random.Random(2)
+        seq_one = random_sequence(300, rng)
+        seq_two = random_sequence(300, rng)
+        for global_alignment in [True, False]:
+            for cell_budget in [1000, 20000]:
+                with self.subTest(global_alignment=global_alignment, cell_budget=cell_budget):
+                    result = align.align(SCORING_MATRIX, INDEL_PENALTY, seq_one, seq_two, global_alignment,
+                                         cell_budget=cell_budget, gap_open=-3, gap_extend=-1)
+                    linear_gaps = align.align(SCORING_MATRIX, INDEL_PENALTY, seq_one, seq_two, global_alignment,
+                                              cell_budget=cell_budget)
+                    self.assertEqual(result.score, linear_gaps.score)
+                    self.assertEqual(len(result.warnings), 1)
+                    self.assertIn('affine gap penalties were not used', result.warnings[0])
+
+
+class ScoreOnlyTest(SimpleTestCase):
+    def test_same_score_as_traceback(self):
+        rng = random.Random(17)
+        for _ in range(6):
+            scoring_matrix, indel_penalty = rng.choice([(SCORING_MATRIX, INDEL_PENALTY), (TIE_SCORING_MATRIX, -1)])
+            seq_one = random_sequence(rng.randint(20, 120), rng)
+            seq_two = benchmarks.mutate(seq_one, rng, 0.2, 0.1) if rng.random() < 0.5 else \
+                random_sequence(rng.randint(20, 120), rng)
+            for global_alignment in [True, False]:
+                traceback_scorer = AlignmentScorer(scoring_matrix, indel_penalty, 'python')
+                matrix, traceback_matrix = traceback_scorer.create_initalized_matrices(len(seq_one), len(seq_two),
+                                                                                       global_alignment)
+                traceback_scorer.fill_matrices(matrix, traceback_matrix, seq_one, seq_two, global_alignment)
+                if global_alignment:
+                    lines = traceback_scorer.global_alignment_traceback(matrix, traceback_matrix, seq_one, seq_two)
+                else:
+                    lines = traceback_scorer.local_alignment_traceback(matrix, traceback_matrix, seq_one, seq_two)
+                affine_lines = align.align(scoring_matrix, indel_penalty, seq_one, seq_two, global_alignment, 'affine',
+                                           gap_open=-3, gap_extend=-1).lines()
+                for engine in ['python', 'numpy']:
+                    with self.subTest(seq_one=seq_one, seq_two=seq_two, global_alignment=global_alignment,
+                                      engine=engine):
+                        scorer = AlignmentScorer(scoring_matrix, indel_penalty, engine)
+                        self.assertEqual(scorer.score_only(seq_one, seq_two, global_alignment), lines[3:])
+                        self.assertEqual(scorer.affine_score_only(seq_one, seq_two, -3, -1, global_alignment),
+                                         affine_lines[3:])
+
+                result = align.align(SCORING_MATRIX, INDEL_PENALTY, seq_one, seq_two, global_alignment,
+                                     gap_open=-3, gap_extend=-1)
+                self.assertEqual(result.warnings, [])
+
+
+class SelectEngineTest(SimpleTestCase):
+    def test_in_cell_budget(self):
+        for global_alignment in [True, False]:
+            with self.subTest(global_alignment=global_alignment):
+                engine = align.select_engine(1000, 1000, global_alignment, cell_budget=10_000_000)
+                self.assertTrue(engine.auto)
+                self.assertLessEqual(engine.estimate(1000, 1000)[1], 10_000_000)
+                self.assertEqual(align.select_engine(1000, 1000, global_alignment, 10_000_000, 'numpy').name,
+                                 'numpy')
+
+    def test_over_cell_budget(self):
+        for global_alignment, expected in [(True, 'linear_space'), (False, 'seeded')]:
+            with self.subTest(global_alignment=global_alignment):
+                # Only the engines that keep one row or the seeds fit
+                engine = align.select_engine(1000, 1000, global_alignment, 10_000, 'numpy')
+                self.assertEqual(engine.name, expected)
+                self.assertEqual(align.select_engine(1000, 1000, global_alignment, 10_000).name, expected)
+
+    def test_required_options(self):
+        for name, global_alignment in [('affine', True), ('affine', False), ('banded_affine', True),
+                                       ('anchored', True)]:
+            with self.subTest(name=name, global_alignment=global_alignment):
+                with self.assertRaisesMessage(ValueError, name):
+                    align.select_engine(100, 100, global_alignment, preferred=name)
+                with self.assertRaises(ValueError):
+                    align.align(SCORING_MATRIX, INDEL_PENALTY, 'ACGT', 'ACGA', global_alignment, name)
+
+        self.assertEqual(align.select_engine(100, 100, False, preferred='affine', gap_open=-3, gap_extend=-1).name,
+                         'affine')
+        self.assertEqual(align.select_engine(100, 100, True, preferred='anchored', anchored=True).name, 'anchored')
+        # Picked without being named when the option is set
+        self.assertEqual(align.select_engine(1000, 1000, True, 100_000, gap_open=-3, gap_extend=-1).name,
+                         'banded_affine')
+        self.assertEqual(align.select_engine(100, 100, False, top_hits=3).name, 'waterman_eggert')
+
+
+class BandedTest(SimpleTestCase):
+    def test_same_as_full_matrices(self):
+        rng = random.Random(10)
+        for scoring_matrix, indel_penalty, seq_one, seq_two in sequence_pairs():
+            for seq_two in [seq_two, benchmarks.mutate(seq_one, rng, 0.05, 0.05)]:
+                with self.subTest(seq_one=seq_one, seq_two=seq_two, indel_penalty=indel_penalty):
+                    scorer = AlignmentScorer(scoring_matrix, indel_penalty, 'numpy')
+                    self.assertEqual(scorer.banded_global_alignment(seq_one, seq_two, band=1),
+                                     full_matrix_global_alignment(scorer, seq_one, seq_two))
+
+    def test_band_doubles_until_optimal(self):
+        rng = random.Random(11)
+        seq_one = random_sequence(200, rng)
+        # A 40 nucleotide deletion and a later insertion of the same length take the alignment far from the
+        # diagonal, outside a band of 1
+        seq_two = seq_one[:50] + seq_one[90:150] + random_sequence(40, rng) + seq_one[150:]
+        scorer = AlignmentScorer(SCORING_MATRIX, INDEL_PENALTY, 'numpy')
+        band_is_optimal = banded.band_is_optimal
+        optimal = []
+
+        def record_band_is_optimal(*args):
+            optimal.append(band_is_optimal(*args))
+            return optimal[-1]
+
+        with mock.patch.object(banded, 'fill_band', wraps=banded.fill_band) as fill_band, \
+                mock.patch.object(banded, 'band_is_optimal', side_effect=record_band_is_optimal):
+            lines = scorer.banded_global_alignment(seq_one, seq_two, band=1)
+
+        length_difference = len(seq_one) - len(seq_two)
+        bands = [call.args[5] - length_difference for call in fill_band.call_args_list]
+        self.assertGreater(len(bands), 1)
+        self.assertEqual(bands, [2 ** i for i in range(len(bands))])
+        # The bound failed for every band but the last
+        self.assertEqual(optimal, [False] * (len(bands) - 1) + [True])
+        self.assertEqual(lines, full_matrix_global_alignment(scorer, seq_one, seq_two))
+        # With too few cells for the band it needs, it gives up
+        self.assertIsNone(scorer.banded_global_alignment(seq_one, seq_two, band=1, max_cells=len(seq_two) * 8))
+
+
+class EditDistanceTest(SimpleTestCase):
+    def pairs(self):
+        rng = random.Random(12)
+        yield '', ''
+        yield 'ACGT', ''
+        yield '', 'ACG'
+        yield 'ACGT', 'ACGT'
+        yield 'ACGT', 'TGCA'
+        # Longer than a 64 bit word
+        for len_one, len_two in [(1, 1), (7, 9), (63, 64), (65, 64), (130, 120), (300, 290)]:
+            yield random_sequence(len_one, rng), random_sequence(len_two, rng)
+        reference = random_sequence(400, rng)
+        yield reference, benchmarks.mutate(reference, rng, 0.02, 0.01)
+
+    def test_same_as_levenshtein(self):
+        for seq_one, seq_two in self.pairs():
+            with self.subTest(seq_one=seq_one, seq_two=seq_two):
+                distance = levenshtein(seq_one, seq_two)
+                self.assertEqual(bitparallel.edit_distance(seq_one, seq_two), distance)
+                self.assertEqual(bitparallel.edit_distance(seq_two, seq_one), distance)
+                if seq_one and seq_two:
+                    self.assertEqual(bitparallel.edit_distance(PackedSequence.from_string(seq_one),
+                                                               PackedSequence.from_string(seq_two)), distance)
+
+    def test_max_distance(self):
+        for seq_one, seq_two in self.pairs():
+            distance = levenshtein(seq_one, seq_two)
+            for max_distance in {0, distance - 1, distance, distance + 1}:
+                if max_distance < 0:
+                    continue
+                with self.subTest(seq_one=seq_one, seq_two=seq_two, max_distance=max_distance):
+                    self.assertEqual(bitparallel.edit_distance(seq_one, seq_two, max_distance),
+                                     distance if distance <= max_distance else None)
+
+
+
+class DivergenceTest(IsolatedReferenceCacheMixin, SimpleTestCase):
+    def test_skipped_pairs_in_result(self):
+        from .local import main_local
+        rng = random.Random(13)
+        reference = random_sequence(200, rng)
+        similar = benchmarks.mutate(reference, rng, 0.01, 0)
+        different = random_sequence(200, rng)
+        data_one = f'>1\n{reference}\n>2\n{reference}\n'.encode('ascii')
+
+        # The last pair is skipped, so nothing of the first pair is shown as the result
+        data_two = f'>1\n{similar}\n>2\n{different}\n'.encode('ascii')
+        result = main_local(data_one, data_two, 'Global', workers=1, max_divergence=0.2, show_graphs=False)
+        self.assertEqual(result[-1], ['Skipped 1 sequence pairs that diverge more than 20%: 2'])
+        self.assertEqual(result[:5], ('Not aligned', '', '', '', ''))
+        self.assertEqual(result[6:8], ([], None))
+        page = render_to_string('results.html', views.results_context('Global', 'one.txt', 'two.txt', False, result))
+        self.assertIn('Not aligned', page)
+        self.assertNotIn(reference[:20], page)
+
+        # An aligned last pair is shown as usual
+        data_two = f'>1\n{different}\n>2\n{similar}\n'.encode('ascii')
+        result = main_local(data_one, data_two, 'Global', workers=1, max_divergence=0.2, show_graphs=False)
+        self.assertEqual(result[-1], ['Skipped 1 sequence pairs that diverge more than 20%: 1'])
+        aligned = main_local(f'>2\n{reference}\n'.encode('ascii'), f'>2\n{similar}\n'.encode('ascii'), 'Global',
+                             workers=1, show_graphs=False)
+        self.assertEqual(result[:8], aligned[:8])
+
+
+class ParallelTest(SimpleTestCase):
+    def test_results_in_task_order(self):
+        tasks = (task for task in range(20))
+        self.assertEqual(list(parallel.map_pairs(slow_square, tasks, workers=2, chunksize=3)),
+                         [task * task for task in range(20)])
+
+
+class CigarTest(SimpleTestCase):
+    def test_same_lines_as_add_dashes(self):
+        for scoring_matrix, indel_penalty, seq_one, seq_two in sequence_pairs():
+            for global_alignment in [True, False]:
+                with self.subTest(seq_one=seq_one, seq_two=seq_two, global_alignment=global_alignment):
+                    scorer = AlignmentScorer(scoring_matrix, indel_penalty, 'numpy')
+                    matrix, traceback_matrix = scorer.create_initalized_matrices(len(seq_one), len(seq_two),
+                                                                                 global_alignment)
+                    scorer.fill_matrices(matrix, traceback_matrix, seq_one, seq_two, global_alignment)
+                    if global_alignment:
+                        x, y, max_x, max_y = 0, 0, len(seq_one), len(seq_two)
+                        seq_a_gaps, seq_b_gaps = scorer.global_traceback_gaps(traceback_matrix, seq_one, seq_two)
+                    else:
+                        max_x, max_y = np.unravel_index(np.argmax(matrix.T), (len(seq_one) + 1, len(seq_two) + 1))
+                        max_x, max_y = int(max_x), int(max_y)
+                        x, y, seq_a_gaps, seq_b_gaps = scorer.local_traceback_gaps(traceback_matrix, max_x, max_y)
+
+                    # The lines the tracebacks built before the alignments were stored as CIGAR operations
+                    line_one = scorer.add_dashes(seq_one, seq_a_gaps, max(y - x, 0))
+                    line_two = scorer.add_dashes(seq_two, seq_b_gaps, max(x - y, 0))
+                    start = max(x, y)
+                    end = start + (max_x - x) + len(seq_a_gaps)
+                    match_line = ' ' * start + AlignmentScorer.create_match_string(line_one[start:end],
+                                                                                 line_two[start:end])
+
+                    alignment = cigar.Alignment.from_gaps(seq_one, seq_two, x, y, max_x, max_y, seq_a_gaps,
+                                                          seq_b_gaps)
+                    self.assertEqual(alignment.window(), (line_one, match_line, line_two))
+                    self.assertEqual(len(alignment), max(len(line_one), len(line_two)))
+
+                    # The CIGAR string and the stored form give back the same alignment
+                    self.assertEqual(cigar.parse(alignment.cigar), alignment.operations)
+                    stored = cigar.Alignment.from_dict(json.loads(json.dumps(alignment.to_dict(sequences=True))))
+                    self.assertEqual(stored.window(), alignment.window())
+                    for start, end in [(0, 3), (2, 9), (len(alignment) - 4, len(alignment) + 2)]:
+                        self.assertEqual(stored.window(start, end),
+                                         (line_one[start:end], match_line[start:end], line_two[start:end]))
+
+
+class AnchoredTest(SimpleTestCase):
+    def test_rescores_to_reported_score(self):
+        rng = random.Random(14)
+        for length, substitution_rate, indel_rate, anchored in [(2000, 0.01, 0.002, True), (1500, 0.05, 0.01, True),
+                                                                (300, 0.3, 0.05, False)]:
+            reference = benchmarks.random_genome(length, rng)
+            sample = benchmarks.mutate(reference, rng, substitution_rate, indel_rate)
+            with self.subTest(length=length, substitution_rate=substitution_rate):
+                scorer = AlignmentScorer(SCORING_MATRIX, INDEL_PENALTY, 'numpy')
+                lines, stats = scorer.anchored_global_alignment(reference, sample)
+                line_one, _, line_two = scorer.alignment.window(0, len(scorer.alignment))
+                self.assertEqual(line_one.replace('-', ''), reference)
+                self.assertEqual(line_two.replace('-', ''), sample)
+                self.assertEqual(rescore(SCORING_MATRIX, INDEL_PENALTY, line_one, line_two), int(lines[3]))
+                # Anchoring never beats the optimal score
+                self.assertLessEqual(int(lines[3]), int(full_matrix_global_alignment(scorer, reference, sample)[3]))
+                self.assertLessEqual(stats['cells'], stats['full_matrix_cells'])
+                if anchored:
+                    self.assertGreater(stats['anchors'], 0)
+
+
+class SeededTest(IsolatedReferenceCacheMixin, SimpleTestCase):
+    def test_same_as_full_matrix_on_one_long_match(self):
+        rng = random.Random(15)
+        reference = benchmarks.random_genome(600, rng)
+        sample = benchmarks.random_genome(100, rng) + reference[200:450] + benchmarks.random_genome(100, rng)
+        # Mismatches score less than nothing, so the best local alignment is the shared part
+        result = align.align(TIE_SCORING_MATRIX, -2, reference, sample, False, 'seeded')
+        alignment = result.alignment
+        self.assertEqual((alignment.x, alignment.max_x, alignment.y, alignment.max_y), (200, 450, 100, 350))
+        line_one, _, line_two = alignment.region_window(0, alignment.region_columns)
+        self.assertEqual(rescore(TIE_SCORING_MATRIX, -2, line_one, line_two), int(result.score))
+
+        scorer = AlignmentScorer(TIE_SCORING_MATRIX, -2, 'numpy')
+        matrix, traceback_matrix = scorer.create_initalized_matrices(len(reference), len(sample), False)
+        scorer.fill_matrices(matrix, traceback_matrix, reference, sample, False)
+        self.assertEqual(result.lines(), scorer.local_alignment_traceback(matrix, traceback_matrix, reference, sample))
+
+    def test_missing_reference_key(self):
+        rng = random.Random(16)
+        reference = benchmarks.random_genome(300, rng)
+        sample = benchmarks.mutate(reference, rng, 0.02, 0.005)
+        expected = align.align(SCORING_MATRIX, INDEL_PENALTY, reference, sample, False, 'seeded')
+        result = align.align(SCORING_MATRIX, INDEL_PENALTY, reference, sample, False, 'seeded',
+                             reference_key='0' * 64, sequence_id=3)
+        self.assertEqual(result.lines(), expected.lines())
+
+
+class LinearSpaceTest(SimpleTestCase):
+    def test_same_score_as_full_matrices(self):
+        rng = random.Random(9)
+        reference = random_sequence(450, rng)
+        pairs = [(reference, benchmarks.mutate(reference, rng, 0.05, 0.02)),
+                 (random_sequence(400, rng), random_sequence(380, rng))]
+        for scoring_matrix, indel_penalty in [(SCORING_MATRIX, INDEL_PENALTY), (TIE_SCORING_MATRIX, -1)]:
+            for seq_one, seq_two in pairs:
+                self.assertGreater(len(seq_one) * len(seq_two), hirschberg.BLOCK_CELLS)
+                with self.subTest(indel_penalty=indel_penalty, len_one=len(seq_one), len_two=len(seq_two)):
+                    scorer = AlignmentScorer(scoring_matrix, indel_penalty, 'numpy')
+                    # The sequences are split before the halves are aligned in blocks
+                    with mock.patch.object(hirschberg, 'align_block', wraps=hirschberg.align_block) as align_block:
+                        score = int(scorer.linear_space_global_alignment(seq_one, seq_two)[3])
+                    self.assertGreater(align_block.call_count, 1)
+
+                    self.assertEqual(score, int(full_matrix_global_alignment(scorer, seq_one, seq_two)[3]))
+                    line_one, _, line_two = scorer.alignment.window(0, len(scorer.alignment))
+                    self.assertEqual(line_one.replace('-', ''), seq_one)
+                    self.assertEqual(line_two.replace('-', ''), seq_two)
+                    self.assertEqual(rescore(scoring_matrix, indel_penalty, line_one, line_two), score)
+
+
+class ResultKeyTest(SimpleTestCase):
+    def test_settings_that_change_result_change_key(self):
+        arguments = {'file1_sha256': 'a', 'file2_sha256': 'b', 'algo': 'Global', 'score_only': False,
+                     'scoring_matrix': SCORING_MATRIX, 'indel_penalty': INDEL_PENALTY}
+        keys = [result_cache.result_key(**arguments)]
+        for changed in [{'engine': 'numpy'}, {'cell_budget': 1000}, {'gap_open': -3, 'gap_extend': -1},
+                        {'gap_open': -3, 'gap_extend': -2}, {'max_divergence': 0.1}, {'top_hits': 3},
+                        {'anchored': True}, {'show_graphs': False}, {'indel_penalty': -2}]:
+            keys.append(result_cache.result_key(**dict(arguments, **changed)))
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertEqual(result_cache.result_key(**arguments), keys[0])
+
+
+class TopHitsTest(IsolatedReferenceCacheMixin, SimpleTestCase):
+    def test_warns_when_dropped_above_cell_budget(self):
+        rng = random.Random(5)
+        seq_one = random_sequence(300, rng)
+        seq_two = benchmarks.mutate(seq_one, rng, 0.05, 0.01)
+        result = align.align(SCORING_MATRIX, INDEL_PENALTY, seq_one, seq_two, False, top_hits=3)
+        self.assertEqual(len(result.hits), 3)
+        self.assertEqual(result.warnings, [])
+
+        result = align.align(SCORING_MATRIX, INDEL_PENALTY, seq_one, seq_two, False, cell_budget=1000, top_hits=3)
+        self.assertEqual(result.hits, [])
+        self.assertEqual(len(result.warnings), 1)
+        self.assertIn(OPTION_WARNINGS['top_hits'], result.warnings[0])
+
+        from .local import main_local
+        data_one = f'>one\n{seq_one}\n'.encode('ascii')
+        data_two = f'>two\n{seq_two}\n'.encode('ascii')
+        with self.settings(GENOME_FULL_MATRIX_CELL_BUDGET=1000, GENOME_ENGINE=align.AUTO):
+            warnings = main_local(data_one, data_two, '', workers=1, top_hits=3, show_graphs=False)[-1]
+        self.assertEqual(len(warnings), 1)
+        self.assertTrue(warnings[0].startswith('Sequence pair 1: '))
+        self.assertIn(OPTION_WARNINGS['top_hits'], warnings[0])
+
+    def test_upload_form_uses_max_top_hits(self):
+        with self.settings(GENOME_MAX_TOP_HITS=7):
+            response = views.UploadTxt.as_view()(RequestFactory().get('/'))
+        self.assertContains(response, 'max="7"')
+
+
+class PackedSequenceTest(SimpleTestCase):
+    def test_round_trip(self):
+        rng = random.Random(3)
+        for length in [0, 1, 3, 4, 5, 17, 1000]:
+            sequence = random_sequence(length, rng)
+            with self.subTest(length=length):
+                packed_sequence = PackedSequence.from_string(sequence)
+                self.assertEqual(str(packed_sequence), sequence)
+                self.assertEqual(len(packed_sequence), length)
+                self.assertEqual(packed_sequence.nbytes, -(-length // 4))
+                with tempfile.TemporaryDirectory() as directory:
+                    path = os.path.join(directory, 'sequence.pseq')
+                    packed_sequence.save(path)
+                    self.assertEqual(PackedSequence.load(path), packed_sequence)
+
+    def test_slicing(self):
+        sequence = random_sequence(37, random.Random(4))
+        packed_sequence = PackedSequence.from_string(sequence)
+        for index in [slice(None), slice(0, 4), slice(1, 3), slice(5, 30), slice(33, None), slice(-6, -1),
+                      slice(20, 10), slice(30, 100), slice(None, None, 3), slice(None, None, -1)]:
+            with self.subTest(index=index):
+                self.assertEqual(str(packed_sequence[index]), sequence[index])
+        self.assertEqual([packed_sequence[i] for i in range(-37, 37)], list(sequence * 2))
+        with self.assertRaises(IndexError):
+            packed_sequence[37]
+
+    def test_pack_only_when_lossless(self):
+        self.assertIsInstance(packed.pack('ACGT'), PackedSequence)
+        for sequence in ['', 'ACGN', 'acgt', 'ACGTé']:
+            self.assertEqual(packed.pack(sequence), sequence)
+
+    def test_reference_cache_packs_sequences(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for sequences in [['ACGTA', 'CCGTTGA', 'GTCA'], ['ACGTA', 'NNCGT']]:
+                with self.subTest(sequences=sequences):
+                    data = ''.join(f'>{i}\n{sequence}\n' for i, sequence in enumerate(sequences)).encode('ascii')
+                    ReferenceCache(directory, 1 << 20).get(data, lambda source: sequences)
+                    # A new cache loads the reference from disk
+                    reference = ReferenceCache(directory, 1 << 20).get(data, None)
+                    self.assertEqual(reference.is_packed, 'N' not in ''.join(sequences))
+                    self.assertEqual(list(reference.iter_sequences()), sequences)
+                    self.assertEqual([str(sequence) for sequence in reference.iter_sequences(packed=True)], sequences)
+
+
+class ReferenceCacheTest(IsolatedReferenceCacheMixin, SimpleTestCase):
+    def fasta(self, sequences):
+        return ''.join(f'>{i}\n{sequence}\n' for i, sequence in enumerate(sequences)).encode('ascii')
+
+    def test_index_built_when_used(self):
+        rng = random.Random(6)
+        sequences = [random_sequence(200, rng), random_sequence(150, rng)]
+        with tempfile.TemporaryDirectory() as directory:
+            reference = ReferenceCache(directory, 1 << 20).get(self.fasta(sequences), lambda source: sequences)
+            self.assertIsNone(reference._index)
+            self.assertFalse(os.path.exists(os.path.join(directory, reference.key, 'index')))
+
+            index = reference.index
+            expected = KmerIndex.build(sequences)
+            for name in ['kmers', 'sequence_ids', 'positions']:
+                np.testing.assert_array_equal(getattr(index, name), getattr(expected, name))
+
+            # Other processes load the index that was saved instead of building it
+            loaded = ReferenceCache(directory, 1 << 20).get_by_key(reference.key)
+            self.assertIsNone(loaded._index)
+            with mock.patch.object(KmerIndex, 'build', side_effect=AssertionError('built again')):
+                np.testing.assert_array_equal(loaded.index.kmers, expected.kmers)
+
+    def test_global_alignment_builds_no_index(self):
+        from .local import main_local
+        from .reference_cache import get_reference_cache, source_sha256
+        rng = random.Random(7)
+        data_one = self.fasta([random_sequence(120, rng)])
+        main_local(data_one, self.fasta([random_sequence(110, rng)]), 'Global', workers=1, show_graphs=False)
+        reference = get_reference_cache().get_by_key(source_sha256(data_one))
+        self.assertEqual(reference.directory, os.path.join(settings.GENOME_REFERENCE_CACHE_DIR, reference.key))
+        self.assertIsNone(reference._index)
+        self.assertFalse(os.path.exists(os.path.join(reference.directory, 'index')))
+
+    def test_least_recently_used_removed_from_disk(self):
+        rng = random.Random(8)
+        references = [[random_sequence(4000, rng)] for _ in range(4)]
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ReferenceCache(directory, 1 << 20)
+            keys = [cache.get(self.fasta(sequences), lambda source, sequences=sequences: sequences).key
+                    for sequences in references[:3]]
+            # Used in the order 1, 0, 2
+            for age, key in zip([30, 20, 10], [keys[1], keys[0], keys[2]]):
+                used = time.time() - age
+                os.utime(os.path.join(directory, key), (used, used))
+            cache.get_by_key(keys[2])
+
+            cache.max_disk_bytes = 3 * reference_cache.directory_size(os.path.join(directory, keys[0]))
+            new_key = cache.get(self.fasta(references[3]), lambda source: references[3]).key
+            self.assertEqual(sorted(os.listdir(directory)), sorted([keys[0], keys[2], new_key]))
+
+            cache.max_disk_bytes = 0
+            cache.evict_disk(new_key)
+            self.assertEqual(os.listdir(directory), [new_key])
+
+
+@override_settings(GENOME_ALIGNMENT_WINDOW=10, GENOME_MAX_ALIGNMENT_WINDOW=25)
+class AlignmentWindowTest(TestCase):
+    def setUp(self):
+        rng = random.Random(15)
+        seq_one = random_sequence(60, rng)
+        seq_two = benchmarks.mutate(seq_one, rng, 0.1, 0.05)
+        scorer = AlignmentScorer(SCORING_MATRIX, INDEL_PENALTY, 'numpy')
+        scorer.linear_space_global_alignment(seq_one, seq_two)
+        self.alignment = scorer.alignment
+        self.digest = hashlib.sha256(seq_two.encode('ascii')).hexdigest()
+        self.key = result_cache.KEY_PREFIX + self.digest
+        self.result = ('', '', '', '', '', None, [], self.alignment.to_dict(sequences=True), [])
+        result_cache.get_cache().delete(self.key)
+        views.load_alignment.cache_clear()
+
+    def get(self, **query):
+        response = views.AlignmentWindow.as_view()(RequestFactory().get('/', query), digest=self.digest)
+        return response.status_code, json.loads(response.content)
+
+    def assertWindow(self, query, start, end):
+        status, data = self.get(**query)
+        self.assertEqual(status, 200)
+        line_one, match_line, line_two = self.alignment.window(start, end)
+        self.assertEqual(data, {'start': start, 'end': end, 'columns': len(self.alignment), 'line_one': line_one,
+                                'match_line': match_line, 'line_two': line_two})
+
+    def test_slices_and_bounds(self):
+        result_cache.set_result(self.key, self.result)
+        columns = len(self.alignment)
+        self.assertWindow({}, 0, 10)
+        self.assertWindow({'start': 5}, 5, 15)
+        self.assertWindow({'start': 3, 'end': 20}, 3, 20)
+        # end is capped by the maximum window and the length of the alignment, and never before start
+        self.assertWindow({'start': 0, 'end': 1000}, 0, 25)
+        self.assertWindow({'start': columns - 5, 'end': columns + 5}, columns - 5, columns)
+        self.assertWindow({'start': columns + 5}, columns + 5, columns + 5)
+        self.assertWindow({'start': 8, 'end': 2}, 8, 8)
+        self.assertWindow({'start': -5, 'end': 4}, 0, 4)
+        self.assertEqual(self.get(start='a')[0], 400)
+        self.assertEqual(self.get(start=0, end='1.5')[0], 400)
+
+    def test_falls_back_to_job(self):
+        with self.assertRaises(Http404):
+            self.get()
+        AlignmentJob.objects.create(status=AlignmentJob.DONE, cache_key=self.key, result=list(self.result))
+        views.load_alignment.cache_clear()
+        self.assertWindow({'start': 2, 'end': 7}, 2, 7)
+
+
+class UploadParsingTest(IsolatedReferenceCacheMixin, SimpleTestCase):
+    FILES = [
+        b'>one\nACGT\nACGA\n>two\nTTGCA\n',
+        # Windows line endings, no newline at the end of the file
+        b'>one\r\nACGT\r\nACGA\r\n>two\r\nTTGCA',
+        # A sequence before the first header, a header without a sequence and blank lines
+        b'ACG\n>empty\n>one description\nAC\n\nGT\n>two\nT\n',
+        '>caf\u00e9\nACGT\n'.encode('utf-8'),
+        b'',
+    ]
+
+    def test_same_as_from_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for i, data in enumerate(self.FILES):
+                path = os.path.join(directory, f'{i}.txt')
+                with open(path, 'wb') as file:
+                    file.write(data)
+                with self.subTest(data=data):
+                    self.assertEqual(list(fasta.read_fasta(data)), list(fasta.read_fasta(path)))
+                    self.assertEqual(fasta.get_sequences(data), fasta.get_sequences(path))
+                    self.assertEqual(reference_cache.source_sha256(data), reference_cache.source_sha256(path))
+                    self.assertEqual(result_cache.data_sha256(data), reference_cache.file_sha256(path))
+
+    def test_main_local_same_as_from_disk(self):
+        from .local import main_local
+        rng = random.Random(16)
+        reference = random_sequence(150, rng)
+        data_one = f'>1\r\n{reference[:70]}\r\n{reference[70:]}\r\n>2\r\n{reference}\r\n'.encode('ascii')
+        data_two = f'>1\n{benchmarks.mutate(reference, rng, 0.05, 0.01)}\n>2\n{random_sequence(140, rng)}'.encode(
+            'ascii')
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for name, data in [('one.txt', data_one), ('two.txt', data_two)]:
+                paths.append(os.path.join(directory, name))
+                with open(paths[-1], 'wb') as file:
+                    file.write(data)
+            for algo in ['Global', '']:
+                with self.subTest(algo=algo):
+                    self.assertEqual(main_local(data_one, data_two, algo, workers=1, show_graphs=False),
+                                     main_local(*paths, algo, workers=1, show_graphs=False))
+
+
+# The views are called without the middleware, like benchmarks.benchmark_upload does, as the message middleware
+# needs the SECRET_KEY the settings leave empty
+@override_settings(GENOME_JOB_WORKERS=0, GENOME_PAIR_WORKERS=None, GENOME_SAVE_UPLOADS=False)
+class JobLifecycleTest(IsolatedReferenceCacheMixin, TestCase):
+    def upload(self, seq_one, seq_two, algo='Global'):
+        return views.UploadTxt.as_view()(RequestFactory().post('/', {
+            'algo': algo,
+            'file1': SimpleUploadedFile('reference.txt', f'>reference\n{seq_one}\n'.encode('ascii')),
+            'file2': SimpleUploadedFile('sample.txt', f'>sample\n{seq_two}\n'.encode('ascii')),
+            'top_hits': '1',
+            'skip_graph': 'on',
+        }))
+
+    def get(self, path):
+        match = resolve(path)
+        return match.func(RequestFactory().get(path), *match.args, **match.kwargs)
+
+    def status(self, job):
+        return json.loads(self.get(reverse('job_status', kwargs={'job_id': job.uuid})).content)
+
+    def test_upload_runs_job(self):
+        response = self.upload('ACGTACGTTAGC', 'ACGTTCGTAGC')
+        job = AlignmentJob.objects.get()
+        self.assertEqual(response.url, reverse('job_detail', kwargs={'job_id': job.uuid}))
+        self.assertEqual(job.status, AlignmentJob.DONE)
+        self.assertEqual(job.worker, jobs.current_worker())
+
+        status = self.status(job)
+        self.assertEqual(status['status'], AlignmentJob.DONE)
+        self.assertEqual(status['id'], str(job.uuid))
+        self.assertContains(self.get(status['result_url']), 'ACGTACGTTAGC')
+
+        # Jobs are only found by their uuid
+        with self.assertRaises(Resolver404):
+            resolve(f'/jobs/{job.id}/')
+        with self.assertRaises(Http404):
+            self.get(reverse('job_detail', kwargs={'job_id': uuid.uuid4()}))
+
+    def test_job_caches_result(self):
+        self.upload('ACGTACGTTAGCC', 'ACGTTCGTAGCC')
+        job = AlignmentJob.objects.get()
+        # Before the result page is looked at
+        self.assertEqual(result_cache.peek_result(job.cache_key), tuple(job.result))
+
+    def test_pairs_aligned_one_after_another_in_job(self):
+        with mock.patch('genome.local.main_local', return_value=()) as main_local:
+            self.upload('ACGTACGTTAGG', 'ACGTTCGTAGG')
+            self.assertEqual(main_local.call_args.kwargs['workers'], 1)
+            with self.settings(GENOME_PAIR_WORKERS=3):
+                self.upload('ACGTACGTTAGT', 'ACGTTCGTAGT')
+            self.assertEqual(main_local.call_args.kwargs['workers'], 3)
+
+    def test_failed_job_shows_message_not_traceback(self):
+        with mock.patch('genome.local.main_local', side_effect=RuntimeError('secret detail')), \
+                self.assertLogs('genome.jobs', 'ERROR') as logs:
+            self.upload('ACGTACGTTAGA', 'ACGTTCGTAGA')
+        self.assertIn('secret detail', '\n'.join(logs.output))
+
+        job = AlignmentJob.objects.get()
+        self.assertEqual(job.status, AlignmentJob.FAILED)
+        self.assertEqual(job.error, jobs.FAILED_MESSAGE)
+        self.assertEqual(self.status(job)['error'], jobs.FAILED_MESSAGE)
+        response = self.get(reverse('job_detail', kwargs={'job_id': job.uuid}))
+        self.assertNotContains(response, 'secret detail')
+        self.assertNotContains(response, 'Traceback')
+
+    def test_jobs_of_exited_workers_fail(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        host = socket.gethostname()
+        stale = AlignmentJob.objects.create(status=AlignmentJob.RUNNING, worker=f'{host}:{process.pid}')
+        unknown = AlignmentJob.objects.create(status=AlignmentJob.QUEUED)
+        alive = AlignmentJob.objects.create(status=AlignmentJob.RUNNING, worker=jobs.current_worker())
+        other_host = AlignmentJob.objects.create(status=AlignmentJob.QUEUED, worker=f'not-{host}:{process.pid}')
+        done = AlignmentJob.objects.create(status=AlignmentJob.DONE, worker=f'{host}:{process.pid}')
+
+        # Polling the job finds out on its own
+        status = self.status(stale)
+        self.assertEqual(status['status'], AlignmentJob.FAILED)
+        self.assertEqual(status['error'], jobs.STALE_MESSAGE)
+
+        self.assertEqual(jobs.fail_stale_jobs(), 1)
+        statuses = {job.id: job.status for job in AlignmentJob.objects.all()}
+        self.assertEqual(statuses, {
+            stale.id: AlignmentJob.FAILED,
+            unknown.id: AlignmentJob.FAILED,
+            alive.id: AlignmentJob.RUNNING,
+            other_host.id: AlignmentJob.QUEUED,
+            done.id: AlignmentJob.DONE,
+        })
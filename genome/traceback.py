@@ -0,0 +1,69 @@
+import numpy as np
+
+# The traceback directions, in the same order as AlignmentScorer.traceback_directions.
+# Each cell of a TracebackMatrix stores the position of its direction in this list.
+DIRECTIONS = ['Up', 'Left', 'Diagonal', '-']
+UP = 0
+LEFT = 1
+DIAGONAL = 2
+NONE = 3
+
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+
+
+class TracebackMatrix:
+    """Holds the traceback direction of every cell of the score matrix as a single uint8 code
+
+    A list of lists of direction strings costs an 8 byte pointer per cell plus a list object per row.
+    This stores one byte per cell in a numpy array. Cells are read and written with the direction strings:
+
+    traceback_matrix[y, x] = 'Diagonal'
+    traceback_matrix[y, x] gives 'Diagonal'
+
+    The numpy engine reads and writes whole rows of codes directly through the codes attribute.
+    """
+
+    def __init__(self, rows, columns):
+        self.codes = np.full((rows, columns), NONE, dtype=np.uint8)
+
+    # Wraps an existing array of direction codes without copying it
+    @classmethod
+    def from_codes(cls, codes):
+        traceback_matrix = cls.__new__(cls)
+        traceback_matrix.codes = codes
+        return traceback_matrix
+
+    def __getitem__(self, position):
+        return DIRECTIONS[self.codes[position]]
+
+    def __setitem__(self, position, direction):
+        self.codes[position] = DIRECTION_CODES[direction]
+
+    def __eq__(self, other):
+        return isinstance(other, TracebackMatrix) and np.array_equal(self.codes, other.codes)
+
+    # Number of bytes used to store the directions
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+
+class BandedTracebackMatrix(TracebackMatrix):
+    """A TracebackMatrix that only stores the cells close to the diagonal
+
+    Only cells with lowest_diagonal <= x - y <= highest_diagonal are stored, so each row holds
+    highest_diagonal - lowest_diagonal + 1 codes. Cells are read and written with their normal [y, x] position.
+    Row y starts at column y + lowest_diagonal of the score matrix.
+    """
+
+    def __init__(self, rows, lowest_diagonal, highest_diagonal):
+        super().__init__(rows, highest_diagonal - lowest_diagonal + 1)
+        self.lowest_diagonal = lowest_diagonal
+
+    def __getitem__(self, position):
+        y, x = position
+        return DIRECTIONS[self.codes[y, x - y - self.lowest_diagonal]]
+
+    def __setitem__(self, position, direction):
+        y, x = position
+        self.codes[y, x - y - self.lowest_diagonal] = DIRECTION_CODES[direction]
@@ -2,5 +2,10 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
-    path("", views.UploadTxt.as_view(), name="upload_txt")
+    path("", views.UploadTxt.as_view(), name="upload_txt"),
+    path("jobs/<uuid:job_id>/", views.JobDetail.as_view(), name="job_detail"),
+    path("jobs/<uuid:job_id>/status/", views.JobStatus.as_view(), name="job_status"),
+    path("jobs/<uuid:job_id>/result/", views.JobResult.as_view(), name="job_result"),
+    path("alignments/<str:digest>/", views.AlignmentWindow.as_view(), name="alignment_window"),
+    path("cache-stats/", views.ResultCacheStats.as_view(), name="result_cache_stats"),
 ]
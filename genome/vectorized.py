@@ -0,0 +1,134 @@
+import numpy as np
+
+from . import packed
+from .traceback import UP, LEFT, DIAGONAL, NONE
+
+
+def encode_sequence(sequence):
+    """Returns the scoring matrix index of every nucleotide of a str or PackedSequence as a uint8 array
+
+    Example, encode_sequence('ACGT') gives [0, 1, 2, 3]
+    """
+    codes = packed.nucleotide_codes(sequence)
+    unknown = np.flatnonzero(codes > 3)
+    if len(unknown):
+        # Same error as looking the nucleotide up in AlignmentScorer.scoring_matrix_indexes
+        raise KeyError(sequence[unknown[0]])
+    return codes
+
+
+def score_row(previous_row, substitution_scores, first_value, indel_penalty, gap_offsets, global_alignment=True):
+    """Computes one row of the score matrix from the row above it
+
+    previous_row is the already filled row above, substitution_scores holds the match/mismatch score of every
+    column in the row and first_value is the value of column 0. gap_offsets must be arange(len(previous_row)) * indel_penalty.
+
+    The left neighbour of a cell is part of the same row, so it can't be computed with a single element-wise max.
+    Because the indel penalty is linear, the best score coming from the left is
+    max over k < x of (row[k] + (x - k) * indel_penalty), which is a running maximum of (row[k] - k * indel_penalty).
+    """
+    # Best of the scores from the cell above and from the diagonal
+    best_scores = np.empty_like(previous_row)
+    best_scores[0] = first_value
+    np.maximum(previous_row[1:] + indel_penalty, previous_row[:-1] + substitution_scores, out=best_scores[1:])
+    if not global_alignment:
+        np.maximum(best_scores[1:], 0, out=best_scores[1:])  # For local alignment, each cell must have a min score of 0.
+
+    # Fold in the scores coming from the left with a running maximum
+    return np.maximum.accumulate(best_scores - gap_offsets) + gap_offsets
+
+
+def fill_row(previous_row, substitution_scores, first_value, indel_penalty, gap_offsets, global_alignment=True):
+    """Computes one row of the score matrix and the traceback codes for that row
+
+    Takes the same arguments as score_row.
+    """
+    row = score_row(previous_row, substitution_scores, first_value, indel_penalty, gap_offsets, global_alignment)
+
+    # Pick the direction the same way compute_score does: the first of Up, Left, Diagonal that gives the max value.
+    values = row[1:]
+    directions = np.full(len(values), NONE, dtype=np.uint8)
+    directions[previous_row[:-1] + substitution_scores == values] = DIAGONAL
+    directions[row[:-1] + indel_penalty == values] = LEFT
+    directions[previous_row[1:] + indel_penalty == values] = UP
+    if not global_alignment:
+        directions[values == 0] = NONE  # No traceback direction if the corresponding matrix value is 0
+
+    return row, directions
+
+
+def query_profile(scoring_matrix, codes_one):
+    """Returns the query profile of codes_one, row i holds the score of nucleotide i against every nucleotide of codes_one
+
+    profile[codes_two[y]] gives the substitution scores of row y of the score matrix, so each row is a single
+    row lookup instead of a gather through the scoring matrix for every cell.
+    """
+    return scoring_matrix[:, codes_one]
+
+
+def score_dtype(scorer):
+    """Returns the numpy dtype the scores of scorer are computed in"""
+    return np.result_type(np.array(scorer.scoring_matrix), scorer.indel_penalty)
+
+
+def prepare(scorer, seq_one, seq_two):
+    """Returns the scoring matrix of scorer as a numpy array and both sequences as arrays of scoring matrix indexes
+
+    The sequences can be str or PackedSequence.
+    """
+    scoring_matrix = np.array(scorer.scoring_matrix, dtype=score_dtype(scorer))
+    codes_one = encode_sequence(seq_one)
+    codes_two = encode_sequence(seq_two)
+    return scoring_matrix, codes_one, codes_two
+
+
+def score_rows(scoring_matrix, indel_penalty, codes_one, codes_two, global_alignment=True):
+    """Yields every row of the score matrix of codes_one (top) and codes_two (left side), starting with row 0
+
+    Only the previous row is kept, so this uses O(len(codes_one)) memory.
+    """
+    gap_offsets = np.arange(len(codes_one) + 1, dtype=scoring_matrix.dtype) * indel_penalty
+    profile = query_profile(scoring_matrix, codes_one)
+    if global_alignment:
+        row = gap_offsets.copy()
+    else:
+        row = np.zeros(len(codes_one) + 1, dtype=scoring_matrix.dtype)
+    yield row
+
+    for y in range(len(codes_two)):
+        first_value = (y + 1) * indel_penalty if global_alignment else 0
+        row = score_row(row, profile[codes_two[y]], first_value, indel_penalty, gap_offsets,
+                        global_alignment)
+        yield row
+
+
+def best_score(scorer, seq_one, seq_two, global_alignment=True):
+    """Returns the alignment score of seq_one and seq_two without creating the matrices
+
+    For global alignment this is the bottom right value of the score matrix, for local alignment the maximum value.
+    """
+    scoring_matrix, codes_one, codes_two = prepare(scorer, seq_one, seq_two)
+    rows = score_rows(scoring_matrix, scorer.indel_penalty, codes_one, codes_two, global_alignment)
+    if global_alignment:
+        for row in rows:
+            pass
+        return row[-1].item()
+    return max(row.max() for row in rows).item()
+
+
+def fill_matrices(scorer, matrix, traceback_matrix, seq_one, seq_two, global_alignment=True):
+    """Fills matrix and traceback_matrix one row at a time with numpy array operations
+
+    This gives exactly the same matrices as AlignmentScorer.fill_matrices with the python engine.
+    matrix is the numpy array create_initalized_matrices makes for the numpy engine, every finished row is
+    written into it and its direction codes straight into the TracebackMatrix.
+    """
+    scoring_matrix, codes_one, codes_two = prepare(scorer, seq_one, seq_two)
+    gap_offsets = np.arange(len(seq_one) + 1, dtype=scoring_matrix.dtype) * scorer.indel_penalty
+    profile = query_profile(scoring_matrix, codes_one)
+
+    for y in range(len(seq_two)):
+        # seq_one is on the top of the matrix so the substitution scores for this row are a row of the query profile
+        matrix[y + 1], traceback_matrix.codes[y + 1, 1:] = fill_row(matrix[y], profile[codes_two[y]], matrix[y + 1, 0],
+                                                                    scorer.indel_penalty, gap_offsets,
+                                                                    global_alignment)
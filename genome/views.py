@@ -1,89 +1,260 @@
-import base64
-import os
-import shutil
+from functools import lru_cache
 
 from django.conf import settings
-from django.shortcuts import render
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.utils.safestring import mark_safe
 from django.views import View
 from django.contrib import messages
-from .models import TxtFiles
-from .local import main_local
-from .global_algo import main_global
-from django.core.files.storage import FileSystemStorage
+from .models import AlignmentJob
+# The alignment engines import numpy, so they are only loaded by the code that runs them, see jobs.run_job
+from . import graphs, jobs, result_cache
+from .scoring import INDEL_PENALTY, SCORING_MATRIX
 from datetime import date
 
 
 # Create your views here.
 class UploadTxt(View):
     def get(self, request, *args, **kwargs):
-        return render(request, "home_upload.html")
+        return render(request, "home_upload.html", context=upload_context())
 
     def post(self, request, *args, **kwargs):
         a_value = request.POST.get("algo")
         algo = a_value
         file1 = request.FILES.get("file1", False)
         file2 = request.FILES.get("file2", False)
-
-        currentDate = date.today()
-        today = currentDate.strftime('%m/%d/%Y').replace("/0", "/")
-        if today[0] == '0':
-            today = today[1:]
+        score_only = request.POST.get("score_only") == "on"
+        skip_graph = request.POST.get("skip_graph") == "on"
+        top_hits = request.POST.get("top_hits", "1")
 
         filename1 = ""
         filename2 = ""
 
-        if algo == "Global":
-            global_or_local = "Global Alignment Result"
-        elif algo == "":
-            global_or_local = "Local Alignment Result"
-        elif algo == "select":
+        if algo == "select":
             messages.error(request, "Please Select Algorithm")
-            return render(request, "home_upload.html")
+            return render(request, "home_upload.html", context=upload_context())
 
         if file1:
             filename1 = file1.name
             if not filename1.endswith('.txt'):
                 messages.error(request, "Please Select A .txt File")
-                return render(request, "home_upload.html")
+                return render(request, "home_upload.html", context=upload_context())
 
         if file2:
             filename2 = file2.name
             if not filename2.endswith('.txt'):
                 messages.error(request, "Please Select A .txt File")
-                return render(request, "home_upload.html")
+                return render(request, "home_upload.html", context=upload_context())
 
         if file1 is False or file2 is False:
             messages.error(request, "Please Select Files")
-            return render(request, "home_upload.html")
+            return render(request, "home_upload.html", context=upload_context())
+
+        max_top_hits = upload_context()["max_top_hits"]
+        if not top_hits.isdigit() or not 1 <= int(top_hits) <= max_top_hits:
+            messages.error(request, f"Please Select Between 1 And {max_top_hits} Local Hits")
+            return render(request, "home_upload.html", context=upload_context())
+        # Only local alignments have several hits
+        top_hits = int(top_hits) if algo == "" else 1
+
+        # The uploads are read into memory once and parsed from there, they are only saved when GENOME_SAVE_UPLOADS is set
+        file1_data = file1.read()
+        file2_data = file2.read()
 
-        created = TxtFiles.objects.create(
-            file1=file1,
-            file2=file2
+        # Uploading the same pair of files again with the same algorithm reuses the result, including the graph
+        key = result_cache.result_key(result_cache.data_sha256(file1_data), result_cache.data_sha256(file2_data),
+                                      algo, score_only, SCORING_MATRIX, INDEL_PENALTY,
+                                      getattr(settings, 'GENOME_GAP_OPEN', None),
+                                      getattr(settings, 'GENOME_GAP_EXTEND', None),
+                                      getattr(settings, 'GENOME_MAX_DIVERGENCE', None), top_hits,
+                                      getattr(settings, 'GENOME_ANCHORED_GLOBAL', False), not skip_graph,
+                                      getattr(settings, 'GENOME_ENGINE', 'auto'),
+                                      getattr(settings, 'GENOME_FULL_MATRIX_CELL_BUDGET', 10_000_000))
+        result = result_cache.get_result(key)
+        if result is not None:
+            return render(request, "results.html",
+                          context=results_context(algo, filename1, filename2, score_only, result, key))
+
+        # Alignments can take minutes, so they run as a job in a worker process. The browser is sent to the job
+        # page, which polls the status endpoint and loads the results when the job is done.
+        # Saved uploads get a name of their own, so jobs never share or delete each other's files.
+        save_uploads = getattr(settings, 'GENOME_SAVE_UPLOADS', False)
+        job = AlignmentJob.objects.create(
+            algo=algo,
+            score_only=score_only,
+            top_hits=top_hits,
+            skip_graph=skip_graph,
+            file1=file1 if save_uploads else None,
+            file2=file2 if save_uploads else None,
+            file1_name=filename1,
+            file2_name=filename2,
+            cache_key=key,
+            worker=jobs.current_worker(),
         )
-        created.save()
-
-        local_result1, local_result2, local_result3, local_result4_score, result5_p_similarity, local_image_data = main_local(
-            created.file1.path, created.file2.path, algo)
-        # main_global(created.file1.path, created.file2.path, algo)
-
-        shutil.rmtree(os.path.join(settings.MEDIA_ROOT), ignore_errors=False, onerror=None)
-        created.delete()
-
-        context = {
-            "file1_name": filename1,
-            "file2_name": filename2,
-            "local_result1": local_result1,
-            "local_result2": local_result2,
-            "local_result3": local_result3,
-            "local_result4_score": local_result4_score,
-            "local_image_data": local_image_data,
-            "global_or_local": global_or_local,
-            "today": today,
-            "algo": algo,
-            "result5_p_similarity": result5_p_similarity,
-        }
-
-        return render(request, "results.html", context=context)
+        if save_uploads:
+            jobs.submit(job)
+        else:
+            jobs.submit(job, file1_data, file2_data)
+
+        if request.accepts("application/json") and not request.accepts("text/html"):
+            return JsonResponse(job_status(job), status=202)
+        return redirect("job_detail", job_id=job.uuid)
+
+
+class JobDetail(View):
+    def get(self, request, job_id, *args, **kwargs):
+        job = get_job(job_id)
+        return render(request, "job.html", context={"job": job, "status": job_status(job)})
+
+
+class JobStatus(View):
+    def get(self, request, job_id, *args, **kwargs):
+        return JsonResponse(job_status(get_job(job_id)))
+
+
+class JobResult(View):
+    def get(self, request, job_id, *args, **kwargs):
+        job = get_job(job_id)
+
+        if job.status == AlignmentJob.FAILED:
+            messages.error(request, "The Alignment Failed")
+            return render(request, "home_upload.html", context=upload_context())
+        if job.status != AlignmentJob.DONE:
+            return redirect("job_detail", job_id=job.uuid)
+
+        # The job ran in another process, so its result is cached here
+        result = tuple(job.result)
+        result_cache.set_result(job.cache_key, result)
+
+        return render(request, "results.html",
+                      context=results_context(job.algo, job.file1_name, job.file2_name, job.score_only, result,
+                                              job.cache_key))
+
+
+class AlignmentWindow(View):
+    """Returns the columns start to end of a stored alignment as JSON, so the results page can page through it"""
+
+    def get(self, request, digest, *args, **kwargs):
+        alignment = load_alignment(result_cache.KEY_PREFIX + digest)
+        window = getattr(settings, 'GENOME_ALIGNMENT_WINDOW', 100)
+        max_window = getattr(settings, 'GENOME_MAX_ALIGNMENT_WINDOW', 1000)
+        try:
+            start = max(int(request.GET.get("start", 0)), 0)
+            end = int(request.GET.get("end", start + window))
+        except ValueError:
+            return JsonResponse({"error": "start and end must be integers"}, status=400)
+        end = max(min(end, start + max_window, len(alignment)), start)
+
+        line_one, match_line, line_two = alignment.window(start, end)
+        return JsonResponse({
+            "start": start,
+            "end": end,
+            "columns": len(alignment),
+            "line_one": line_one,
+            "match_line": match_line,
+            "line_two": line_two,
+        })
+
+
+class ResultCacheStats(View):
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(result_cache.stats())
+
+
+def upload_context():
+    """Returns the context of home_upload.html"""
+    return {"max_top_hits": getattr(settings, 'GENOME_MAX_TOP_HITS', 10)}
+
+
+def get_job(job_id):
+    """Returns the AlignmentJob with the uuid job_id, raises Http404 if there is none
+
+    A job whose worker process has exited is marked as failed first, so the job page stops polling it.
+    """
+    queryset = AlignmentJob.objects.filter(uuid=job_id)
+    jobs.fail_stale_jobs(queryset)
+    return get_object_or_404(queryset)
+
+
+def job_status(job):
+    """Returns the status of an AlignmentJob as sent by JobStatus"""
+    return {
+        "id": str(job.uuid),
+        "status": job.status,
+        "error": job.error,
+        "status_url": reverse("job_status", kwargs={"job_id": job.uuid}),
+        "result_url": reverse("job_result", kwargs={"job_id": job.uuid}),
+    }
+
+
+@lru_cache(maxsize=16)
+def load_alignment(key):
+    """Returns the cigar.Alignment of the result stored under the result cache key, raises Http404 if there is none
+
+    The result comes from the result cache, or from the job that computed it once it has left the cache.
+    The parsed alignments of the last results looked at are kept, so paging through one only renders windows.
+    """
+    result = result_cache.peek_result(key)
+    if result is None:
+        job = AlignmentJob.objects.filter(cache_key=key, status=AlignmentJob.DONE).order_by("-id").first()
+        result = job.result if job is not None else None
+    if result is None or len(result) < 8 or not result[7] or "seq_one" not in result[7]:
+        raise Http404("No alignment is stored for this result")
+    from . import cigar
+    return cigar.Alignment.from_dict(result[7])
+
+
+def results_context(algo, filename1, filename2, score_only, result, cache_key=None):
+    """Returns the context of results.html for the tuple returned by main_local
+
+    With the cache_key of the result, the page can load more of the alignment from the AlignmentWindow view.
+    """
+    currentDate = date.today()
+    today = currentDate.strftime('%m/%d/%Y').replace("/0", "/")
+    if today[0] == '0':
+        today = today[1:]
+
+    if algo == "Global":
+        global_or_local = "Global Alignment Result"
+    else:
+        global_or_local = "Local Alignment Result"
+
+    local_result1, local_result2, local_result3, local_result4_score, result5_p_similarity, graph = result[:6]
+    hits = result[6] if len(result) > 6 else []
+    alignment = result[7] if len(result) > 7 else None
+    warnings = result[8] if len(result) > 8 else []
+    alignment_url = None
+    if cache_key and alignment and "seq_one" in alignment:
+        alignment_url = reverse("alignment_window", kwargs={"digest": cache_key[len(result_cache.KEY_PREFIX):]})
+
+    return {
+        "file1_name": filename1,
+        "file2_name": filename2,
+        "local_result1": local_result1,
+        "local_result2": local_result2,
+        "local_result3": local_result3,
+        "local_result4_score": local_result4_score,
+        "graph_svg": runtime_svg(tuple(map(tuple, graph))) if isinstance(graph, list) else None,
+        # Results saved before the graph was stored as points hold a PNG
+        "local_image_data": graph if isinstance(graph, str) else None,
+        "global_or_local": global_or_local,
+        "today": today,
+        "algo": algo,
+        "result5_p_similarity": result5_p_similarity,
+        "score_only": score_only,
+        "hits": hits,
+        "alignment": alignment,
+        "warnings": warnings,
+        "alignment_url": alignment_url,
+        "alignment_window": getattr(settings, 'GENOME_ALIGNMENT_WINDOW', 100),
+    }
+
+
+@lru_cache(maxsize=64)
+def runtime_svg(series):
+    """Draws the runtime graph of a result, cached since the same result is shown again while it is cached"""
+    return mark_safe(graphs.runtime_svg(series))
 
 
 # Trim each line to only be x characters long
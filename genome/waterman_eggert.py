@@ -0,0 +1,140 @@
+import heapq
+
+import numpy as np
+
+from . import vectorized
+from .traceback import UP, LEFT, NONE
+
+
+class LocalHits:
+    """Finds the best local alignments of two sequences that don't share any cell (Waterman-Eggert)
+
+    The local score matrix is filled once. The best remaining hit comes from a heap that holds the maximum of every
+    row. After a hit is reported, the cells on its path are set to 0 and only the cells that depend on them are
+    recomputed: a row is recomputed from the first column that changed in the row above it, and the rows below
+    the hit stop being recomputed as soon as a row doesn't change. The rows that changed push their new maximum.
+
+    The first hit is the alignment local_alignment_traceback gives.
+    """
+
+    def __init__(self, scorer, seq_one, seq_two):
+        scoring_matrix, codes_one, self.codes_two = vectorized.prepare(scorer, seq_one, seq_two)
+        self.indel_penalty = scorer.indel_penalty
+        self.profile = vectorized.query_profile(scoring_matrix, codes_one)
+
+        shape = (len(self.codes_two) + 1, len(codes_one) + 1)
+        self.scores = np.zeros(shape, dtype=scoring_matrix.dtype)
+        self.directions = np.full(shape, NONE, dtype=np.uint8)
+        # Cells on the path of a reported hit
+        self.blocked = np.zeros(shape, dtype=bool)
+        # Heap entries of a row are stale once its version changes
+        self.row_versions = [0] * shape[0]
+        self.heap = []
+
+        gap_offsets = np.arange(shape[1], dtype=scoring_matrix.dtype) * self.indel_penalty
+        for y in range(1, shape[0]):
+            row, self.directions[y, 1:] = vectorized.fill_row(self.scores[y - 1], self.profile[self.codes_two[y - 1]],
+                                                              0, self.indel_penalty, gap_offsets, False)
+            self.scores[y] = row
+            self.push_row_max(y)
+
+    def push_row_max(self, y):
+        self.row_versions[y] += 1
+        x = int(np.argmax(self.scores[y]))
+        if self.scores[y, x] > 0:
+            # Ties go to the lowest column, then the lowest row, like local_alignment_traceback picks its maximum
+            heapq.heappush(self.heap, (-self.scores[y, x].item(), x, y, self.row_versions[y]))
+
+    def fill_segment(self, y, x_start):
+        """Recomputes row y from column x_start to the end and returns the first column that changed, or None"""
+        old_row = self.scores[y, x_start:].copy()
+        blocked_columns = np.flatnonzero(self.blocked[y, x_start:]) + x_start
+        self.scores[y, blocked_columns] = 0
+        self.directions[y, blocked_columns] = NONE
+
+        # Nothing reaches a cell from the left through a blocked cell, so the row is filled in pieces between them
+        starts = [x_start] + (blocked_columns + 1).tolist()
+        ends = blocked_columns.tolist() + [self.scores.shape[1]]
+        substitution_scores = self.profile[self.codes_two[y - 1]]
+        for start, end in zip(starts, ends):
+            if start >= end:
+                continue
+            gap_offsets = np.arange(end - start + 1, dtype=self.scores.dtype) * self.indel_penalty
+            row, self.directions[y, start:end] = vectorized.fill_row(
+                self.scores[y - 1, start - 1:end], substitution_scores[start - 1:end - 1], self.scores[y, start - 1],
+                self.indel_penalty, gap_offsets, False)
+            self.scores[y, start:end] = row[1:]
+
+        changed = np.flatnonzero(self.scores[y, x_start:] != old_row)
+        return int(changed[0]) + x_start if len(changed) else None
+
+    def traceback(self, max_x, max_y):
+        """Follows the traceback from (max_x, max_y) until a 0, like local_alignment_traceback
+
+        Returns (x, y, seq_a_gaps, seq_b_gaps, path) where path lists the (y, x) cells of the alignment.
+        """
+        seq_a_gaps = []
+        seq_b_gaps = []
+        path = []
+        x = max_x
+        y = max_y
+        while self.scores[y, x] != 0:
+            path.append((y, x))
+            direction = self.directions[y, x]
+            if direction == UP:
+                seq_a_gaps.append(x)
+                y -= 1
+            elif direction == LEFT:
+                seq_b_gaps.append(y)
+                x -= 1
+            else:
+                y -= 1
+                x -= 1
+        return x, y, seq_a_gaps, seq_b_gaps, path
+
+    def remove(self, path):
+        """Sets the cells of path to 0 and recomputes the cells that depend on them"""
+        rows = {}
+        for y, x in path:
+            self.blocked[y, x] = True
+            rows[y] = min(x, rows.get(y, x))
+
+        x_start = None
+        for y in range(min(rows), self.scores.shape[0]):
+            if y in rows:
+                x_start = rows[y] if x_start is None else min(x_start, rows[y])
+            if x_start is None:
+                if y > max(rows):
+                    break
+                continue
+            # A cell changes the cell below it and the cells to the right of that one
+            x_start = self.fill_segment(y, x_start)
+            if x_start is not None:
+                self.push_row_max(y)
+
+    def next_hit(self):
+        """Returns the next best hit as (max_value, max_x, max_y, x, y, seq_a_gaps, seq_b_gaps), or None"""
+        while self.heap:
+            max_value, max_x, max_y, version = heapq.heappop(self.heap)
+            if version != self.row_versions[max_y]:
+                continue
+            # The row of the hit changes, so its next best cell is pushed by remove
+            x, y, seq_a_gaps, seq_b_gaps, path = self.traceback(max_x, max_y)
+            self.remove(path)
+            return -max_value, max_x, max_y, x, y, seq_a_gaps, seq_b_gaps
+        return None
+
+
+def local_alignments(scorer, seq_one, seq_two, count):
+    """Returns up to count local alignments that don't share any cell, best first
+
+    Each one is (max_value, max_x, max_y, x, y, seq_a_gaps, seq_b_gaps) in the format local_alignment_result takes.
+    """
+    hits = LocalHits(scorer, seq_one, seq_two)
+    alignments = []
+    while len(alignments) < count:
+        alignment = hits.next_hit()
+        if alignment is None:
+            break
+        alignments.append(alignment)
+    return alignments
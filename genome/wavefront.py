@@ -0,0 +1,187 @@
+import contextlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from django.conf import settings
+
+from . import vectorized
+from .traceback import UP, LEFT, NONE, TracebackMatrix
+
+# The process pool the tiles are filled in, kept between alignments, see get_executor
+_executor = None
+_executor_workers = None
+_executor_lock = threading.Lock()
+
+
+def auto_tile_size(columns, rows, workers):
+    """Returns a tile size that gives every worker about two tiles on the longest wavefront
+
+    Tiles smaller than 256 cells per side spend more time in numpy call overhead than in computing cells.
+    """
+    return max(256, -(-max(columns, rows) // (2 * workers)))
+
+
+def get_executor(workers):
+    """Returns the process pool of workers processes the tiles are filled in
+
+    Starting the processes takes longer than filling a small matrix, so the pool is started once and reused.
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown()
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            _executor_workers = workers
+        return _executor
+
+
+def fill_tile(task):
+    """Fills the cells of one tile in a worker process and returns the best cell of the tile
+
+    task is (arrays, indel_penalty, global_alignment, tile_row, tile_column, bounds), arrays describes the shared
+    memory blocks as (name, shape, dtype) in the order fill_tile_arrays takes them. The blocks are attached for
+    this tile only, so nothing is left mapped in the worker once the alignment is done.
+    """
+    arrays = task[0]
+    memories = [shared_memory.SharedMemory(name=name) for name, _, _ in arrays]
+    try:
+        return fill_tile_arrays(*[np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+                                  for memory, (_, shape, dtype) in zip(memories, arrays)], *task[1:])
+    finally:
+        for memory in memories:
+            memory.close()
+
+
+def fill_tile_arrays(row_edges, column_edges, codes, profile, codes_two, indel_penalty, global_alignment, tile_row,
+                     tile_column, bounds):
+    """Fills one tile and returns (value, x, y) of its best cell, or None when no cell of it is above 0
+
+    bounds is (x_start, x_end, y_start, y_end), the tile covers columns x_start to x_end and rows y_start to y_end
+    of the score matrix (ends excluded). Only the edges of the tiles are kept: row_edges[tile_row] holds the row
+    just above the tile and column_edges[:, tile_column] the column just left of it. The tile writes its last row
+    and last column there for the tiles below it and to its right, and its directions into codes.
+    The best cell is the one local_alignment_traceback would pick: the highest value, then the lowest x, then the
+    lowest y.
+    """
+    x_start, x_end, y_start, y_end = bounds
+
+    # Every row of the tile is computed like a whole row of vectorized.fill_matrices, starting from the cell
+    # to the left of the tile, so the values and directions are exactly the same.
+    gap_offsets = np.arange(x_end - x_start + 1, dtype=row_edges.dtype) * indel_penalty
+    previous_row = row_edges[tile_row, x_start - 1:x_end]
+    best = None
+    for y in range(y_start, y_end):
+        substitution_scores = profile[codes_two[y - 1], x_start - 1:x_end - 1]
+        row, codes[y, x_start:x_end] = vectorized.fill_row(previous_row, substitution_scores,
+                                                           column_edges[y, tile_column], indel_penalty, gap_offsets,
+                                                           global_alignment)
+        column_edges[y, tile_column + 1] = row[-1]
+
+        x = int(np.argmax(row[1:]))
+        value = row[x + 1].item()
+        # A later row only wins with a higher value, or the same value in a lower column
+        if value > 0 and (best is None or (-value, x_start + x) < (-best[0], best[1])):
+            best = (value, x_start + x, y)
+        previous_row = row
+
+    row_edges[tile_row + 1, x_start:x_end] = previous_row[1:]
+    return best
+
+
+def tile_bounds(length, tile_size):
+    """Returns the (start, end) matrix indexes of the tiles along one side of a matrix for a sequence of length"""
+    return [(start, min(start + tile_size, length + 1)) for start in range(1, length + 1, tile_size)]
+
+
+def tiled_alignment(scorer, seq_one, seq_two, global_alignment=True, workers=None, tile_size=None):
+    """Aligns seq_one and seq_two with tiles filled in parallel along anti-diagonal wavefronts
+
+    A tile only depends on the tiles above it, to its left and above-left, so every tile on an anti-diagonal
+    can be filled at the same time once the previous anti-diagonal is done. The traceback directions and the
+    edge rows and columns of the tiles live in shared memory, the scores inside the tiles are never kept, so this
+    uses about one byte per matrix cell. The alignment is the same the python and numpy engines give.
+
+    Returns (score, seq_a_gaps, seq_b_gaps) for global alignment and (max_value, max_x, max_y, x, y, seq_a_gaps,
+    seq_b_gaps) for local alignment.
+
+    workers defaults to GENOME_TILE_WORKERS (None uses one per core) and tile_size to GENOME_TILE_SIZE
+    (None picks one from the matrix size and the number of workers).
+    """
+    if workers is None:
+        workers = getattr(settings, 'GENOME_TILE_WORKERS', None) or os.cpu_count() or 1
+    if tile_size is None:
+        tile_size = getattr(settings, 'GENOME_TILE_SIZE', None) or auto_tile_size(len(seq_one), len(seq_two), workers)
+
+    scoring_matrix, codes_one, codes_two = vectorized.prepare(scorer, seq_one, seq_two)
+    profile = vectorized.query_profile(scoring_matrix, codes_one)
+    column_tiles = tile_bounds(len(seq_one), tile_size)
+    row_tiles = tile_bounds(len(seq_two), tile_size)
+    arrays = [
+        ((len(row_tiles) + 1, len(seq_one) + 1), scoring_matrix.dtype),  # row_edges
+        ((len(seq_two) + 1, len(column_tiles) + 1), scoring_matrix.dtype),  # column_edges
+        ((len(seq_two) + 1, len(seq_one) + 1), np.dtype(np.uint8)),  # codes
+        (profile.shape, profile.dtype),
+        (codes_two.shape, codes_two.dtype),
+    ]
+    memories = [shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+                for shape, dtype in arrays]
+    try:
+        return fill_tiles(scorer, [(memory.name, shape, dtype.str) for memory, (shape, dtype) in zip(memories, arrays)],
+                          memories, profile, codes_two, column_tiles, row_tiles, seq_one, seq_two, global_alignment,
+                          workers)
+    finally:
+        for memory in memories:
+            memory.unlink()
+            # When fill_tiles raised, its arrays are still referenced by the traceback. The memory is then
+            # released with them.
+            with contextlib.suppress(BufferError):
+                memory.close()
+
+
+def fill_tiles(scorer, arrays, memories, profile, codes_two, column_tiles, row_tiles, seq_one, seq_two,
+               global_alignment, workers):
+    """Fills the shared arrays of tiled_alignment wavefront by wavefront and follows the traceback"""
+    row_edges, column_edges, codes, shared_profile, shared_codes_two = [
+        np.ndarray(shape, dtype=dtype, buffer=memory.buf) for memory, (_, shape, dtype) in zip(memories, arrays)]
+    shared_profile[:] = profile
+    shared_codes_two[:] = codes_two
+
+    # Row 0 and column 0 like create_initalized_matrices makes them
+    codes[:] = NONE
+    if global_alignment:
+        row_edges[0] = np.arange(len(seq_one) + 1) * scorer.indel_penalty
+        column_edges[:, 0] = np.arange(len(seq_two) + 1) * scorer.indel_penalty
+        codes[0, :] = LEFT
+        codes[:, 0] = UP
+    else:
+        row_edges[0] = 0
+        column_edges[:, 0] = 0
+    # The first cell of every edge is on column 0 or row 0
+    row_edges[1:, 0] = column_edges[[end - 1 for _, end in row_tiles], 0]
+    column_edges[0, 1:] = row_edges[0, [end - 1 for _, end in column_tiles]]
+
+    best_cells = []
+    if column_tiles and row_tiles:
+        executor = get_executor(workers)
+        for wavefront in range(len(column_tiles) + len(row_tiles) - 1):
+            tasks = []
+            for tile_row in range(max(0, wavefront - len(column_tiles) + 1), min(wavefront + 1, len(row_tiles))):
+                tile_column = wavefront - tile_row
+                tasks.append((arrays, scorer.indel_penalty, global_alignment, tile_row, tile_column,
+                              column_tiles[tile_column] + row_tiles[tile_row]))
+            # Wait for the whole wavefront before starting the next one
+            best_cells.extend(best for best in executor.map(fill_tile, tasks) if best is not None)
+
+    traceback_matrix = TracebackMatrix.from_codes(codes)
+    if global_alignment:
+        seq_a_gaps, seq_b_gaps = scorer.global_traceback_gaps(traceback_matrix, seq_one, seq_two)
+        return row_edges[-1, -1].item(), seq_a_gaps, seq_b_gaps
+
+    # Ties go to the lowest column, then the lowest row, like local_alignment_traceback picks its maximum
+    max_value, max_x, max_y = min(best_cells, key=lambda cell: (-cell[0], cell[1], cell[2]), default=(0, 0, 0))
+    x, y, seq_a_gaps, seq_b_gaps = scorer.local_traceback_gaps(traceback_matrix, max_x, max_y)
+    return max_value, max_x, max_y, x, y, seq_a_gaps, seq_b_gaps
@@ -137,6 +137,89 @@ STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Alignments with more matrix cells than this (length of sequence one * length of sequence two) don't build
+# the full score and traceback matrices. Global alignments are run in linear memory and local alignments
+# only compute the cells around k-mer seeds.
+GENOME_FULL_MATRIX_CELL_BUDGET = 10_000_000
+
+# Parsed reference files and their indexes are saved here, keyed by the sha256 of the file
+GENOME_REFERENCE_CACHE_DIR = os.path.join(BASE_DIR, 'reference_cache')
+
+# Memory the references cached in each process may use before the least recently used ones are dropped
+GENOME_REFERENCE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Disk space the saved references may take before the least recently used ones are removed, None keeps all of them
+GENOME_REFERENCE_CACHE_MAX_DISK_BYTES = 2 * 1024 * 1024 * 1024
+
+# Engine main_local aligns the pairs with, see genome.align.ENGINES. 'auto' picks the fastest engine that fits in
+# GENOME_FULL_MATRIX_CELL_BUDGET for every pair. 'tiled' splits a single large alignment across
+# GENOME_TILE_WORKERS processes (None uses one per core) in tiles of GENOME_TILE_SIZE cells per side
+# (None picks a size from the matrix size and the number of workers). It keeps one byte per matrix cell and is
+# used even above GENOME_FULL_MATRIX_CELL_BUDGET.
+GENOME_ENGINE = 'auto'
+GENOME_TILE_WORKERS = None
+GENOME_TILE_SIZE = None
+
+# Number of processes the sequence pairs of one upload are aligned in (1 aligns them one after another) and how many
+# pairs are sent to a process at a time. None uses one per core, except in alignment jobs, which already run one per
+# core (see GENOME_JOB_WORKERS) and align their pairs one after another.
+GENOME_PAIR_WORKERS = None
+GENOME_PAIR_CHUNKSIZE = 1
+
+# Affine gap penalties: a gap of length L scores GENOME_GAP_OPEN + (L - 1) * GENOME_GAP_EXTEND. Both are negative
+# and GENOME_GAP_OPEN can't be higher than GENOME_GAP_EXTEND. None scores every gap nucleotide with the indel penalty.
+GENOME_GAP_OPEN = None
+GENOME_GAP_EXTEND = None
+
+# Sequence pairs whose edit distance is more than this fraction of the longer sequence (0.1 is 10%) are skipped
+# by main_local without being aligned. The edit distance is computed with a fast bit-parallel algorithm.
+# None aligns every pair.
+GENOME_MAX_DIVERGENCE = None
+
+# Global alignments are anchored on maximal unique matches between the two sequences and only the parts between
+# the matches are aligned with the score matrices. Much faster for similar whole genomes, but the alignment is
+# forced through the matches, so it is not guaranteed to be optimal.
+GENOME_ANCHORED_GLOBAL = False
+
+# Number of alignment columns the results page loads at a time, and the most one request can ask for
+GENOME_ALIGNMENT_WINDOW = 100
+GENOME_MAX_ALIGNMENT_WINDOW = 1000
+
+# Highest number of local alignments the upload form can ask for
+GENOME_MAX_TOP_HITS = 10
+
+# Uploads up to this size are kept in memory instead of being written to a temporary file by Django
+FILE_UPLOAD_MAX_MEMORY_SIZE = 64 * 1024 * 1024
+
+# Save the uploaded files of every alignment job under MEDIA_ROOT until the job is done. By default the jobs get
+# the contents of the files in memory and nothing is written to disk.
+GENOME_SAVE_UPLOADS = False
+
+# Number of worker processes that run alignment jobs. None uses one per core and 0 runs the jobs in the web process.
+GENOME_JOB_WORKERS = None
+
+# Alignment results are cached by the sha256 of both files, the algorithm and the scoring.
+# TIMEOUT is how many seconds a result is kept and MAX_ENTRIES how many results are kept.
+# The local memory cache is per process, use a shared backend like FileBasedCache or Redis to share results
+# between worker processes.
+GENOME_RESULT_CACHE = 'genome_results'
+GENOME_RESULT_CACHE_TTL = 60 * 60 * 24
+GENOME_RESULT_CACHE_MAX_ENTRIES = 256
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    GENOME_RESULT_CACHE: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'genome-results',
+        'TIMEOUT': GENOME_RESULT_CACHE_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': GENOME_RESULT_CACHE_MAX_ENTRIES,
+        },
+    },
+}
+
 MESSAGE_TAGS = {
     messages.ERROR: "danger"
 }
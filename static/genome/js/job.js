@@ -0,0 +1,29 @@
+const loader = document.querySelector("#loader_detail_page");
+const job_status = document.querySelector("#job_status");
+const job_error = document.querySelector("#job_error");
+const status_data = JSON.parse(document.querySelector("#job_status_data").textContent);
+
+// Polls the status endpoint until the job is done, then loads the results page
+function poll_job() {
+    fetch(status_data.status_url)
+        .then(response => response.json())
+        .then(data => {
+            job_status.textContent = data.status;
+            if (data.status === "done") {
+                window.location = data.result_url;
+            } else if (data.status === "failed") {
+                loader.style.display = 'none';
+                job_error.textContent = data.error;
+            } else {
+                setTimeout(poll_job, 1000);
+            }
+        })
+        .catch(() => setTimeout(poll_job, 5000));
+}
+
+if (status_data.status === "done") {
+    window.location = status_data.result_url;
+} else if (status_data.status !== "failed") {
+    loader.style.display = 'block';
+    poll_job();
+}
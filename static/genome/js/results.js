@@ -1,6 +1,38 @@
 const loader = document.querySelector("#loader_detail_page");
+const viewer = document.querySelector("#alignment_viewer");
 
 
 $(document).ready(function () {
     loader.style.display = 'none';
-});
\ No newline at end of file
+});
+
+// Pages through the alignment one window of columns at a time. Only the columns shown are fetched and rendered.
+if (viewer) {
+    const window_size = parseInt(viewer.dataset.window);
+    const start_input = document.querySelector("#alignment_start");
+    let columns = null;
+
+    function show_window(start) {
+        start = Math.max(0, columns === null ? start : Math.min(start, Math.max(columns - window_size, 0)));
+        fetch(`${viewer.dataset.url}?start=${start}&end=${start + window_size}`)
+            .then(response => response.json())
+            .then(data => {
+                columns = data.columns;
+                document.querySelector("#alignment_line_one").textContent = data.line_one;
+                document.querySelector("#alignment_match_line").textContent = data.match_line;
+                document.querySelector("#alignment_line_two").textContent = data.line_two;
+                document.querySelector("#alignment_range").textContent = `to ${data.end} of ${data.columns}`;
+                start_input.value = data.start + 1;
+            });
+    }
+
+    document.querySelector("#alignment_previous").addEventListener("click", () => {
+        show_window(parseInt(start_input.value) - 1 - window_size);
+    });
+    document.querySelector("#alignment_next").addEventListener("click", () => {
+        show_window(parseInt(start_input.value) - 1 + window_size);
+    });
+    start_input.addEventListener("change", () => show_window(parseInt(start_input.value) - 1));
+
+    show_window(0);
+}